@@ -1,57 +1,55 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from datetime import datetime
+import asyncio
+import json
 import uvicorn
 
-from scrape_reddit import run_scraper
+from src.jobs import JobStore, QueueFullError, TERMINAL_STATUSES
+from src.job_worker import report_dedupe_key
+from src.checkpoint import load_report
+from src import metrics
 
 app = FastAPI(title="Crash Reports API", version="1.0.0")
 
-# In-memory storage for task results
-task_results = {}
-task_status = {}
+# Jobs live in a shared SQLite store and are executed by `python -m src.job_worker`,
+# so any number of API processes can accept and report on them
+job_store = JobStore()
 
-def background_scraper(task_id: str, limit: int, include_comments: bool, days_back: int):
-    """Background task to run the scraper"""
-    try:
-        task_status[task_id] = "running"
-        result = run_scraper(limit=limit, include_comments=include_comments, days_back=days_back)
-        task_results[task_id] = result
-        task_status[task_id] = "completed"
-    except Exception as e:
-        task_results[task_id] = {
-            "success": False,
-            "message": f"Error occurred: {str(e)}",
-            "posts_found": 0,
-            "total_comments": 0,
-            "crash_related_comments": 0
-        }
-        task_status[task_id] = "failed"
+DEFAULT_SUBREDDITS = ["boston", "massachusetts", "cambridge", "MassachusettsUSA", "CambridgeMA"]
+# Seconds between event store polls of an open progress stream
+EVENT_POLL_INTERVAL = 0.5
+
+def get_job_or_404(task_id: str, include_result: bool = True):
+    job = job_store.get(task_id, include_result=include_result)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return job
 
 @app.get("/")
 async def root():
     return {"message": "Crash Reports API", "version": "1.0.0"}
 
 @app.post("/scrape")
-async def trigger_scrape(request: dict, background_tasks: BackgroundTasks):
-    """Trigger a Reddit scrape operation in the background"""
+def trigger_scrape(request: dict):
+    """Queue a Reddit scrape operation for the job workers"""
     # Extract parameters with defaults
-    limit = request.get("limit", 1000)
-    include_comments = request.get("include_comments", True)
-    days_back = request.get("days_back", 365)
-
-    # Generate a unique task ID
-    task_id = f"scrape_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
-
-    # Add the scraping task to background tasks
-    background_tasks.add_task(
-        background_scraper,
-        task_id=task_id,
-        limit=limit,
-        include_comments=include_comments,
-        days_back=days_back
-    )
+    now = datetime.now()
+    keywords = request.get("keywords")
+    if not keywords:
+        raise HTTPException(status_code=422, detail="'keywords' must be a non-empty list")
+    params = {
+        "limit": request.get("limit", 1000),
+        "year": request.get("year", now.year),
+        "month": request.get("month", now.month),
+        "subreddits": request.get("subreddits", DEFAULT_SUBREDDITS),
+        "keywords": keywords,
+    }
 
-    task_status[task_id] = "queued"
+    try:
+        task_id = job_store.enqueue("scrape", params)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Too many queued tasks ({e}), try again later")
 
     return {
         "task_id": task_id,
@@ -60,48 +58,143 @@ async def trigger_scrape(request: dict, background_tasks: BackgroundTasks):
     }
 
 @app.get("/scrape/{task_id}/status")
-async def get_scrape_status(task_id: str):
+def get_scrape_status(task_id: str):
     """Get the status of a scraping task"""
-    if task_id not in task_status:
-        return {"error": "Task not found"}, 404
-
-    status = task_status[task_id]
-    response = {"task_id": task_id, "status": status}
+    job = get_job_or_404(task_id)
+    response = {"task_id": task_id, "status": job["status"]}
 
-    if status == "completed" and task_id in task_results:
-        response["result"] = task_results[task_id]
-    elif status == "failed" and task_id in task_results:
-        response["error"] = task_results[task_id]
+    if job["status"] == "completed":
+        response["result"] = job["result"]
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    elif job["status"] == "running" and job["cancel_requested"]:
+        response["cancel_requested"] = True
 
     return response
 
 @app.get("/scrape/{task_id}/result")
-async def get_scrape_result(task_id: str):
+def get_scrape_result(task_id: str):
     """Get the result of a completed scraping task"""
-    if task_id not in task_status:
-        return {"error": "Task not found"}, 404
+    job = get_job_or_404(task_id)
+
+    if job["status"] != "completed":
+        raise HTTPException(status_code=400, detail=f"Task is not completed. Current status: {job['status']}")
+
+    if job["result"] is None:
+        raise HTTPException(status_code=404, detail="Task result not found")
+
+    return job["result"]
+
+async def stream_job_events(task_id: str, after: int):
+    """Yield a job's events as NDJSON lines until the job has finished and its log is drained"""
+    while True:
+        events = await asyncio.to_thread(job_store.get_events, task_id, after)
+        for event in events:
+            after = event["id"]
+            yield json.dumps(event) + "\n"
+        if events:
+            continue
+        job = await asyncio.to_thread(job_store.get, task_id, False)
+        if job["status"] in TERMINAL_STATUSES:
+            # Pick up anything written between the last read and the status change
+            events = await asyncio.to_thread(job_store.get_events, task_id, after)
+            for event in events:
+                yield json.dumps(event) + "\n"
+            yield json.dumps({"event": "status", "data": {"status": job["status"], "error": job["error"]}}) + "\n"
+            return
+        await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+@app.get("/scrape/{task_id}/events")
+def get_scrape_events(task_id: str, after: int = 0):
+    """
+    Stream progress events and finished post records of a task as NDJSON.
+
+    Each line is {"id", "event", "data", "created_at"}; reconnect with ?after=<last id>
+    to resume. The stream ends with a "status" line once the task has finished.
+    """
+    get_job_or_404(task_id, include_result=False)
+    return StreamingResponse(stream_job_events(task_id, after), media_type="application/x-ndjson")
+
+@app.post("/scrape/{task_id}/cancel")
+def cancel_scrape(task_id: str):
+    """Cancel a queued task, or ask a running one to stop"""
+    status = job_store.cancel(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if status in ("completed", "failed"):
+        raise HTTPException(status_code=409, detail=f"Task already finished. Current status: {status}")
+    return {"task_id": task_id, "status": status, "cancel_requested": status == "running"}
+
+@app.post("/reports")
+def trigger_report(request: dict):
+    """
+    Get the report of an agency for a month, generating it if needed.
+
+    Finished reports are returned directly. Otherwise the scrape -> filter -> report
+    -> upload pipeline is queued, and concurrent requests for the same report join
+    the job that is already queued or running. With "streaming": true the job
+    filters posts while they are scraped instead of going through the shared corpus.
+    """
+    agency = request.get("agency")
+    month = request.get("month")
+    year = request.get("year")
+    if not agency or not isinstance(month, int) or not isinstance(year, int) or not 1 <= month <= 12:
+        raise HTTPException(status_code=422, detail="'agency', 'month' (1-12) and 'year' are required")
+
+    report = load_report(agency, month, year)
+    if report is not None:
+        return {"status": "completed", "cached": True, "agency": agency, "month": month, "year": year,
+                "report": report}
 
-    if task_status[task_id] != "completed":
-        return {"error": f"Task is not completed. Current status: {task_status[task_id]}"}, 400
+    try:
+        task_id = job_store.enqueue("report", {"agency": agency, "month": month, "year": year,
+                                               "streaming": bool(request.get("streaming", False))},
+                                    dedupe_key=report_dedupe_key(agency, month, year))
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Too many queued tasks ({e}), try again later")
 
-    if task_id not in task_results:
-        return {"error": "Task result not found"}, 404
+    job = get_job_or_404(task_id, include_result=False)
+    return {
+        "task_id": task_id,
+        "status": job["status"],
+        "cached": False,
+        "message": "Report pipeline is queued or already running for this agency and month"
+    }
 
-    return task_results[task_id]
+@app.get("/reports/{task_id}")
+def get_report_task(task_id: str):
+    """Get the status of a report task, with the report once it is completed"""
+    job = get_job_or_404(task_id)
+    response = {"task_id": task_id, "status": job["status"], **job["params"]}
+    if job["status"] == "completed":
+        response.update(job["result"])
+    elif job["status"] == "failed":
+        response["error"] = job["error"]
+    return response
 
 @app.get("/tasks")
-async def list_tasks():
-    """List all tasks and their current status"""
+def list_tasks(limit: int = 100):
+    """List the most recent tasks and their current status"""
     return {
         "tasks": [
             {
-                "task_id": task_id,
-                "status": status,
-                "has_result": task_id in task_results
+                "task_id": job["id"],
+                "status": job["status"],
+                "has_result": job["has_result"]
             }
-            for task_id, status in task_status.items()
-        ]
+            for job in job_store.list(limit=limit)
+        ],
+        "counts": job_store.count_by_status()
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus metrics of this API process and every job worker, with queue depth by status"""
+    snapshot = metrics.merge_snapshots([metrics.registry.snapshot()] + job_store.load_metrics())
+    lines = [metrics.to_prometheus(snapshot).rstrip("\n"), f"# TYPE {metrics.METRIC_PREFIX}jobs gauge"]
+    for status, count in job_store.count_by_status().items():
+        lines.append(f'{metrics.METRIC_PREFIX}jobs{{status="{status}"}} {count}')
+    return "\n".join(lines) + "\n"
+
 if __name__ == "__main__":
-    uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,139 @@
+import json
+import math
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+from src.utils import estimate_tokens
+
+
+def _unit_hash(*parts):
+    """Deterministic float in [0, 1) derived from the given values."""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _embedded_json(prompt, marker):
+    """Decode the JSON value that follows `marker` in a prompt, or return None."""
+    start = prompt.find(marker)
+    if start == -1:
+        return None
+    try:
+        value, _ = json.JSONDecoder().raw_decode(prompt, start + len(marker))
+    except json.JSONDecodeError:
+        return None
+    return value
+
+
+class FakeOpenAIClient:
+    """
+    Deterministic local stand-in for openai.OpenAI, answering the pipeline's prompts.
+
+    Relevance verdicts, failures and malformed answers are derived from hashes of
+    the prompt, so every run over the same data makes the same decisions no matter
+    how the calls are scheduled across threads.
+
+    Args:
+        latency (float): Base seconds each call sleeps
+        jitter (float): Extra seconds added, scaled by a per-prompt hash
+        seconds_per_1k_tokens (float): Extra latency per 1000 prompt tokens
+        failure_rate (float): Share of calls raising a 429 RateLimitError
+        malformed_rate (float): Share of calls answering with truncated JSON
+        relevance_rate (float): Share of posts and comments judged relevant
+        report_tokens (int): Approximate size of generated reports and findings
+        retry_after (float): Retry-After seconds sent with simulated 429s
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, seconds_per_1k_tokens=0.0, failure_rate=0.0,
+                 malformed_rate=0.0, relevance_rate=0.3, report_tokens=800, retry_after=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.relevance_rate = relevance_rate
+        self.report_tokens = report_tokens
+        self.retry_after = retry_after
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.latencies = []
+        self.calls = 0
+        self.failures = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def reset_stats(self):
+        with self.lock:
+            self.latencies = []
+            self.calls = 0
+            self.failures = 0
+
+    def is_relevant(self, item_id):
+        return _unit_hash(self.seed, "relevant", item_id) < self.relevance_rate
+
+    def answer(self, prompt):
+        posts = _embedded_json(prompt, "Posts: ")
+        if isinstance(posts, list):
+            return "```json\n" + json.dumps([{"id": post["id"], "is_relevant": self.is_relevant(post["id"])}
+                                             for post in posts]) + "\n```"
+        comments = _embedded_json(prompt, "Comments: ")
+        if isinstance(comments, list):
+            return "```json\n" + json.dumps([{"comment_id": c["comment_id"],
+                                              "is_relevant": self.is_relevant(c["comment_id"])}
+                                             for c in comments]) + "\n```"
+        if "Answer with a single word: yes or no." in prompt:
+            return "yes" if self.is_relevant(prompt) else "no"
+        if "Is this post relevant to the topic?" in prompt:
+            return "```json\n" + json.dumps({"is_relevant": self.is_relevant(prompt)}) + "\n```"
+        # Report, map and merge prompts get markdown of roughly report_tokens tokens
+        line = f"- Finding {hashlib.sha256(prompt.encode()).hexdigest()[:12]}: riders report delays and crowding\n"
+        return "# ACTIONABLE ANALYSIS REPORT\n\n" + line * max(1, self.report_tokens * 4 // len(line))
+
+    def create(self, model, messages, temperature=0.7, **kwargs):
+        prompt = messages[-1]["content"]
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        with self.lock:
+            attempt = self.attempts.get(prompt, 0)
+            self.attempts[prompt] = attempt + 1
+            self.calls += 1
+
+        delay = (self.latency + self.jitter * _unit_hash(self.seed, "latency", prompt, attempt)
+                 + self.seconds_per_1k_tokens * prompt_tokens / 1000)
+        start = time.perf_counter()
+        time.sleep(delay)
+
+        if _unit_hash(self.seed, "failure", prompt, attempt) < self.failure_rate:
+            with self.lock:
+                self.failures += 1
+                self.latencies.append(time.perf_counter() - start)
+            request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+            response = httpx.Response(429, headers={"retry-after": str(self.retry_after)}, request=request)
+            raise openai.RateLimitError("Simulated rate limit", response=response, body=None)
+
+        content = self.answer(prompt)
+        finish_reason = "stop"
+        if _unit_hash(self.seed, "malformed", prompt, attempt) < self.malformed_rate:
+            content = content[:len(content) // 2]
+            finish_reason = "length"
+
+        logprobs = None
+        if kwargs.get("logprobs"):
+            # Confidence of the first token spread over [0.5, 1), the rest goes to the other answer
+            confidence = 0.5 + 0.5 * _unit_hash(self.seed, "confidence", prompt)
+            other = {"yes": "no", "no": "yes"}.get(content, "")
+            alternatives = [SimpleNamespace(token=content, logprob=math.log(confidence)),
+                            SimpleNamespace(token=other, logprob=math.log(1 - confidence))]
+            logprobs = SimpleNamespace(content=[SimpleNamespace(token=content, logprob=alternatives[0].logprob,
+                                                                top_logprobs=alternatives)])
+
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), logprobs=logprobs,
+                                     finish_reason=finish_reason)],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(content)),
+        )
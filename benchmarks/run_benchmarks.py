@@ -0,0 +1,278 @@
+"""
+Offline benchmarks of the pipeline stages over the checked-in Reddit CSVs.
+
+Every LLM call goes to a deterministic local stand-in (benchmarks/fake_llm.py),
+so runs are free, reproducible and need no network. Run from the repo root:
+
+    python -m benchmarks.run_benchmarks --latency 0.05 --max-workers 8
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --tolerance 0.2
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+# The real client is never used, but it is created when src.openai_wrapper is imported
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from src import openai_wrapper
+from src.rate_limit import RateLimiter
+from src.keyword_matcher import KeywordMatcher
+from src.filtering import get_filtered_posts_and_comments, generate_report
+from src.cascade import Cascade
+from src.storage import write_partition, read_partition, read_partition_records
+from benchmarks.fake_llm import FakeOpenAIClient
+
+DEFAULT_POSTS = "reddit_posts_9-2025.csv"
+DEFAULT_COMMENTS = "reddit_comments_9-2025.csv"
+KEYWORD_DATASETS = ["reddit_crash_posts_20250928_132800.csv", "reddit_posts_20250928_172400.csv",
+                    "reddit_comments_20250928_172400.csv"]
+
+BENCH_TOPIC = "Public transit service in Greater Boston: MBTA subway, bus and commuter rail reliability and safety"
+BENCH_AGENCY = "Massachusetts Bay Transportation Authority (MBTA)"
+BENCH_KEYWORDS = [
+    "mbta", "t", "subway", "train", "bus", "commuter rail", "red line", "orange line", "green line", "blue line",
+    "silver line", "delay", "shuttle", "slow zone", "charliecard", "fare", "station", "platform", "derail",
+    "crash", "accident", "collision", "pedestrian", "cyclist", "traffic", "highway", "police", "ambulance",
+    "injured", "storrow drive", "mass pike", "i-93", "i-90", "intersection", "speeding", "drunk driver",
+]
+# Throughput metric compared against the baseline for each stage
+THROUGHPUT_KEY = "items_per_second"
+
+csv.field_size_limit(sys.maxsize)
+
+
+def load_csv(path):
+    """Read a scraper CSV export into dicts with numeric fields converted."""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        for key in ("created_utc",):
+            if row.get(key) not in (None, ""):
+                row[key] = float(row[key])
+        for key in ("score", "num_comments"):
+            if row.get(key) not in (None, ""):
+                row[key] = int(float(row[key]))
+    return rows
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 6)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def measure(name, func, items_count, latencies=None):
+    """
+    Run one stage under tracemalloc and collect its numbers.
+
+    Args:
+        name (str): Stage name
+        func (callable): The stage; may return a list of per-item latencies in seconds
+        items_count (int): Number of items the stage processes, for throughput
+        latencies (callable, optional): Returns per-request latencies once the stage is done,
+            used instead of func's return value (e.g. the fake LLM's call latencies)
+
+    Returns:
+        dict: Wall time, throughput, latency percentiles and peak traced memory
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = latencies() if latencies is not None else (result if isinstance(result, list) else [])
+    stats = {
+        "stage": name,
+        "items": items_count,
+        "wall_seconds": round(wall, 4),
+        THROUGHPUT_KEY: round(items_count / wall, 2) if wall > 0 else None,
+        "latency_seconds": percentiles(samples),
+        "peak_memory_mb": round(peak / 2 ** 20, 2),
+    }
+    print(f"{name:<22} {items_count:>7} items {wall:>9.3f}s {stats[THROUGHPUT_KEY] or 0:>10.1f}/s "
+          f"p50={stats['latency_seconds']['p50']} p95={stats['latency_seconds']['p95']} "
+          f"p99={stats['latency_seconds']['p99']} peak={stats['peak_memory_mb']}MB")
+    return stats
+
+
+def bench_csv_load(paths):
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        load_csv(path)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def to_items(posts, comments):
+    """Nest CSV comments under their posts as fetch_new() records, grouped by (subreddit, year, month)."""
+    comments_by_post = {}
+    for comment in comments:
+        comments_by_post.setdefault(comment["post_id"], []).append(comment)
+    partitions = {}
+    for post in posts:
+        created = datetime.fromtimestamp(post["created_utc"]) if post.get("created_utc") else datetime.now()
+        record = {key: post.get(key) for key in ("source", "id", "unique_id", "title", "body", "url", "author",
+                                                 "created_utc", "num_comments", "score")}
+        record["comments"] = comments_by_post.get(post["id"], [])
+        partitions.setdefault((post["subreddit"], created.year, created.month), []).append(record)
+    return partitions
+
+
+def bench_parquet(partitions, root, write, records=False):
+    latencies = []
+    for (subreddit, year, month), items in partitions.items():
+        start = time.perf_counter()
+        if write:
+            write_partition(items, subreddit, year, month, root=root)
+        elif records:
+            read_partition_records(subreddit, year, month, root=root)
+        else:
+            read_partition(subreddit, year, month, root=root)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_keywords(texts, word_boundaries):
+    matcher = KeywordMatcher(BENCH_KEYWORDS, word_boundaries=word_boundaries)
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        matcher.score(text)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """Return the stages whose throughput fell more than `tolerance` below the baseline."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+    regressions = []
+    for stage in results["stages"]:
+        before = baseline.get(stage["stage"], {}).get(THROUGHPUT_KEY)
+        after = stage[THROUGHPUT_KEY]
+        if before and after is not None and after < before * (1 - tolerance):
+            regressions.append(f"{stage['stage']}: {after}/s vs {before}/s in baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks over the checked-in CSVs")
+    parser.add_argument("--posts", default=DEFAULT_POSTS)
+    parser.add_argument("--comments", default=DEFAULT_COMMENTS)
+    parser.add_argument("--max-posts", type=int, default=None, help="Only use the first N posts")
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--batch-token-budget", type=int, default=4000,
+                        help="Batched post classification budget, 0 classifies posts one by one")
+    parser.add_argument("--latency", type=float, default=0.05, help="Base fake LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of LLM calls answered with a 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of LLM answers truncated")
+    parser.add_argument("--relevance-rate", type=float, default=0.3)
+    parser.add_argument("--cascade-threshold", type=float, default=None,
+                        help="Classify posts with the model cascade, escalating answers below this confidence")
+    parser.add_argument("--rpm", type=int, default=10 ** 9, help="Client-side request limit")
+    parser.add_argument("--tpm", type=int, default=10 ** 12, help="Client-side token limit")
+    parser.add_argument("--stages", default="csv,parquet,keywords,filtering,report",
+                        help="Comma-separated stages to run")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Fail if throughput regressed against this results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    stages = set(args.stages.split(","))
+
+    fake = FakeOpenAIClient(latency=args.latency, jitter=args.jitter,
+                            seconds_per_1k_tokens=args.seconds_per_1k_tokens,
+                            failure_rate=args.failure_rate, malformed_rate=args.malformed_rate,
+                            relevance_rate=args.relevance_rate)
+    openai_wrapper.client = fake
+    openai_wrapper.limiter = RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    # Every call must reach the fake client to be measured
+    openai_wrapper.LLM_CACHE_MODE = "off"
+
+    posts = load_csv(args.posts)[:args.max_posts]
+    comments = load_csv(args.comments)
+    post_ids = {post["id"] for post in posts}
+    comments = [comment for comment in comments if comment["post_id"] in post_ids]
+    print(f"Loaded {len(posts)} posts and {len(comments)} comments")
+
+    results = {"args": vars(args), "stages": []}
+    add = results["stages"].append
+
+    if "csv" in stages:
+        paths = [args.posts, args.comments] + KEYWORD_DATASETS
+        rows = sum(len(load_csv(path)) for path in paths)
+        add(measure("csv_load", lambda: bench_csv_load(paths), rows))
+
+    if "parquet" in stages:
+        partitions = to_items(posts, comments)
+        rows = len(posts) + len(comments)
+        with tempfile.TemporaryDirectory() as root:
+            add(measure("parquet_write", lambda: bench_parquet(partitions, root, write=True), rows))
+            add(measure("parquet_load", lambda: bench_parquet(partitions, root, write=False), rows))
+            add(measure("parquet_load_records", lambda: bench_parquet(partitions, root, write=False, records=True),
+                        rows))
+
+    if "keywords" in stages:
+        texts = [f"{row.get('title', '') or ''}\n{row.get('body', '') or ''}"
+                 for path in [args.posts] + KEYWORD_DATASETS for row in load_csv(path)]
+        add(measure("keywords_substring", lambda: bench_keywords(texts, False), len(texts)))
+        add(measure("keywords_word_boundary", lambda: bench_keywords(texts, True), len(texts)))
+
+    filtered = None
+    if "filtering" in stages or "report" in stages:
+        fake.reset_stats()
+        cascade = Cascade(threshold=args.cascade_threshold) if args.cascade_threshold is not None else None
+
+        def run_filtering():
+            nonlocal filtered
+            filtered = get_filtered_posts_and_comments(posts, comments, BENCH_TOPIC,
+                                                       max_workers=args.max_workers,
+                                                       batch_token_budget=args.batch_token_budget or None,
+                                                       cascade=cascade)
+
+        stats = measure("filtering", run_filtering, len(posts) + len(comments), latencies=lambda: fake.latencies)
+        stats.update(llm_calls=fake.calls, llm_failures=fake.failures, relevant_posts=len(filtered))
+        if cascade is not None:
+            stats["cascade"] = cascade.report()
+        if "filtering" in stages:
+            add(stats)
+
+    if "report" in stages:
+        fake.reset_stats()
+        stats = measure("report", lambda: generate_report(filtered, BENCH_AGENCY, BENCH_TOPIC,
+                                                          max_workers=args.max_workers),
+                        len(filtered), latencies=lambda: fake.latencies)
+        stats.update(llm_calls=fake.calls, llm_failures=fake.failures)
+        add(stats)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
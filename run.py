@@ -1,139 +1,242 @@
-from src.scrape_reddit import run_scraper
+from src.corpus import build_corpus, get_agency_data
 from src.filtering import get_filtered_posts_and_comments, generate_report
-from src.bigquery_uploader import upload_report_to_bigquery
+from src.bigquery_uploader import upload_report_to_bigquery, ReportUploadBatch
 from src.prompts import (insight_post_prompt,
                          filter_post_prompt, filter_comment_prompt,
                          keywords_generator_prompt, keywords_generator_system_prompt,
                          topic_generator_prompt, topic_generator_system_prompt,
                          )
-from src.openai_wrapper import get_completion
+from src.openai_wrapper import get_completion, invalidate_completion
+from src.llm_cache import get_cache
 from src.utils import parse_result
-import pandas as pd
+from src.checkpoint import Checkpoint, get_report_filename
+from src.dedup import DEDUP_THRESHOLD
+from src.prefilter import PREFILTER_THRESHOLD, PREFILTER_TOP_K
+from src.scrape_reddit import report_progress, iter_new, ScrapeCancelled
+from src.pipeline import stream_filtered_posts, stream_report
+from src.cascade import Cascade, CASCADE_ENABLED
+from src.metrics import stage, write_run_summary
 from datetime import datetime
 import os
+import json
 from src.bigquery_uploader import load_credentials_from_file
 
 
 credentials = load_credentials_from_file("sundai-club-434220-8c96234b132c.json")
 
+BIGQUERY_PROJECT_ID = "sundai-club-434220"
+BIGQUERY_DATASET_ID = "bostonreports"
+BIGQUERY_TABLE_ID = "boston-reports"
+
+# Tokens of post text packed into each batched relevance request
+POST_BATCH_TOKEN_BUDGET = 4000
+
 subreddits = ["boston", "massachusetts", "cambridge", "MassachusettsUSA", "CambridgeMA", ]  # Using verified subreddit names
 
-def get_keywords(agency):
+def get_keywords(agency, checkpoint=None):
+    if checkpoint is not None and checkpoint.get("keywords"):
+        return checkpoint.get("keywords")
     prompt = keywords_generator_prompt.format(agency=agency)
     result = get_completion(keywords_generator_system_prompt, prompt)
-    keywords = parse_result(result)
+    try:
+        keywords = parse_result(result)
+    except json.JSONDecodeError:
+        # A malformed answer must not be replayed from the cache on the next run
+        invalidate_completion(keywords_generator_system_prompt, prompt)
+        raise
+    if checkpoint is not None:
+        checkpoint.set("keywords", keywords)
     return keywords
 
-def get_topic(agency):
+def get_topic(agency, checkpoint=None):
+    if checkpoint is not None and checkpoint.get("topic"):
+        return checkpoint.get("topic")
     prompt = topic_generator_prompt.format(agency=agency)
     result = get_completion(topic_generator_system_prompt, prompt)
-    topic = parse_result(result)
+    try:
+        topic = parse_result(result)
+    except json.JSONDecodeError:
+        invalidate_completion(topic_generator_system_prompt, prompt)
+        raise
     topic = topic['topic']
+    if checkpoint is not None:
+        checkpoint.set("topic", topic)
     return topic
 
-def run(agency, month, year):
-    timestamp = f"{month}-{year}"
-    print(os.path.exists(f"{agency.replace(' ', '_').lower()}_reddit_posts_{timestamp}.csv"))
+def upload_report(agency, month, year, report, upload_batch=None):
+    """Upload a report now, or queue it on upload_batch to be sent with the others."""
+    if upload_batch is not None:
+        upload_batch.add(agency, month, year, report)
+        return
+    upload_report_to_bigquery(
+        agency=agency,
+        month=month,
+        year=year,
+        report_content=report,
+        credentials=credentials,
+        project_id=BIGQUERY_PROJECT_ID,
+        dataset_id=BIGQUERY_DATASET_ID,
+        table_id=BIGQUERY_TABLE_ID
+    )
+
+def raise_if_stopped(should_stop, next_stage):
+    """Stop a cancelled run between stages, everything done so far stays checkpointed."""
+    if should_stop is not None and should_stop():
+        raise ScrapeCancelled(f"Run cancelled before the {next_stage} stage")
+
+def until_stopped(items, should_stop, next_stage):
+    """Pass items through, checking for cancellation before each one."""
+    for item in items:
+        raise_if_stopped(should_stop, next_stage)
+        yield item
+
+def run_phases(agency, month, year, keywords, corpus, checkpoint, progress=None, should_stop=None):
+    """Scrape (or reuse the shared corpus), then filter, then write the report, one phase after the other."""
+    print("Getting posts...")
+    report_progress(progress, "stage", stage="corpus")
+    if corpus is None:
+        # Scrape or load the shared corpus; partitions already stored by
+        # other agencies' runs are reused
+        with stage("corpus"):
+            corpus = build_corpus(limit=1000,
+                                  year=year,
+                                  month=month,
+                                  subreddits=subreddits,
+                                  keywords=keywords,
+                                  should_stop=should_stop)
+
+    # Apply this agency's keywords to the corpus
+    raise_if_stopped(should_stop, "agency_data")
+    with stage("agency_data"):
+        data = get_agency_data(corpus, keywords, year, month, should_stop=should_stop)
+    posts_data = data['posts']
+    comments_data = data['comments']
+
+    raise_if_stopped(should_stop, "topic")
+    print("Getting topic...")
+    report_progress(progress, "stage", stage="topic")
+    with stage("topic"):
+        topic = get_topic(agency, checkpoint)
+    print(f"Topic: {topic}")
+    raise_if_stopped(should_stop, "filtering")
+    print("Filtering posts and comments...")
+    report_progress(progress, "stage", stage="filtering", posts=len(posts_data), comments=len(comments_data))
+    cascade = Cascade(agency=agency) if CASCADE_ENABLED else None
+    with stage("filtering"):
+        filtered_posts_and_comments = get_filtered_posts_and_comments(
+            posts_data,
+            comments_data,
+            topic,
+            batch_token_budget=POST_BATCH_TOKEN_BUDGET,
+            # Crossposts and repeated comments are classified once
+            dedupe_threshold=DEDUP_THRESHOLD,
+            # Clear misses are dropped locally, scored against the topic and the agency keywords
+            prefilter_threshold=PREFILTER_THRESHOLD,
+            prefilter_top_k=PREFILTER_TOP_K,
+            prefilter_terms=keywords,
+            checkpoint=checkpoint,
+            cascade=cascade
+        )
+
+    print(f"Filtered results: {len(filtered_posts_and_comments)} posts with relevant comments")
+    if cascade is not None:
+        print(f"Cascade: {cascade.report()}")
+
+    report = checkpoint.get("report")
+    if report is None:
+        raise_if_stopped(should_stop, "report")
+        print("Generating report...")
+        report_progress(progress, "stage", stage="report", filtered_posts=len(filtered_posts_and_comments))
+        with stage("report"):
+            report = generate_report(filtered_posts_and_comments, agency, topic)
+        checkpoint.set("report", report)
+    return filtered_posts_and_comments, report
+
+def run_streaming(agency, month, year, keywords, checkpoint, progress=None, should_stop=None):
+    """
+    Scrape, filter and summarize at the same time: posts are filtered while the
+    listings are still being walked and report batches are summarized as they fill.
+    The shared corpus is bypassed, so nothing is stored for other agencies, and the
+    prefilter is not applied since it ranks the whole month of posts at once.
+    """
+    print("Getting topic...")
+    report_progress(progress, "stage", stage="topic")
+    with stage("topic"):
+        topic = get_topic(agency, checkpoint)
+    print(f"Topic: {topic}")
+
+    report = checkpoint.get("report")
+    if report is not None:
+        return [], report
+
+    raise_if_stopped(should_stop, "streaming")
+    report_progress(progress, "stage", stage="streaming")
+    cascade = Cascade(agency=agency) if CASCADE_ENABLED else None
+    with stage("streaming"):
+        records = iter_new(limit=1000, year=year, month=month, subreddits=subreddits, keywords=keywords,
+                           should_stop=should_stop, progress=progress)
+        filtered = stream_filtered_posts(records, topic,
+                                         batch_token_budget=POST_BATCH_TOKEN_BUDGET,
+                                         dedupe_threshold=DEDUP_THRESHOLD,
+                                         checkpoint=checkpoint,
+                                         cascade=cascade)
+        # Filtering goes on after the scrape ends, so the results are checked as well
+        filtered = until_stopped(filtered, should_stop, "report")
+        filtered_posts_and_comments, report = stream_report(filtered, agency, topic)
+    print(f"Filtered results: {len(filtered_posts_and_comments)} posts with relevant comments")
+    if cascade is not None:
+        print(f"Cascade: {cascade.report()}")
+    checkpoint.set("report", report)
+    return filtered_posts_and_comments, report
+
+def run(agency, month, year, keywords=None, corpus=None, upload_batch=None, progress=None, streaming=False,
+        should_stop=None):
     print(agency)
-    if os.path.exists(f"report_{agency.replace(' ', '_').lower()}_{timestamp}.md"):
+    report_filename = get_report_filename(agency, month, year)
+    if os.path.exists(report_filename):
         print("Report already exists")
         
-        report = open(f"report_{agency.replace(' ', '_').lower()}_{timestamp}.md", "r").read()
+        report = open(report_filename, "r").read()
         
-        upload_report_to_bigquery(
-            agency=agency,
-            month=month,
-            year=year,
-            report_content=report,
-            credentials=credentials,
-            project_id="sundai-club-434220",
-            dataset_id="bostonreports",
-            table_id="boston-reports"
-        )
+        upload_report(agency, month, year, report, upload_batch)
         
         return {
             "filtered_data": [],
             "report": report,
-            "report_filename": f"report_{agency.replace(' ', '_').lower()}_{timestamp}.md"
+            "report_filename": report_filename
         }
         
     else:
         print("Report does not exist")
-        if not os.path.exists(f"{agency.replace(' ', '_').lower()}_reddit_posts_{timestamp}.csv") and not os.path.exists(f"{agency.replace(' ', '_').lower()}_reddit_comments_{timestamp}.csv"):
-            
-            print("Getting keywords...")
-            
-            keywords = get_keywords(agency)
-            print(f"Keywords: {keywords}")
-            print("Getting posts...")
-            data = run_scraper(limit=1000,
-                            year=year,
-                            month=month,
-                            subreddits=subreddits,
-                            keywords=keywords)
-
-            # Save to CSV using pandas
-            timestamp = f"{month}-{year}"
-
-            # Save posts
-            posts_df = pd.DataFrame(data['posts'])
-            posts_filename = f"{agency.replace(' ', '_').lower()}_reddit_posts_{timestamp}.csv"
-            posts_df.to_csv(posts_filename, index=False)
-            print(f"Saved {len(posts_df)} posts to {posts_filename}")
-
-            # Save comments
-            comments_df = pd.DataFrame(data['comments'])
-            comments_filename = f"{agency.replace(' ', '_').lower()}_reddit_comments_{timestamp}.csv"
-            comments_df.to_csv(comments_filename, index=False)
-            print(f"Saved {len(comments_df)} comments to {comments_filename}")
-        else:
-            print("Loading existing data from CSV...")
-            posts_df = pd.read_csv(f"{agency.replace(' ', '_').lower()}_reddit_posts_{timestamp}.csv")
-            comments_df = pd.read_csv(f"{agency.replace(' ', '_').lower()}_reddit_comments_{timestamp}.csv")
-
-            # Convert DataFrames back to lists of dictionaries
-            posts_data = posts_df.to_dict('records')
-            comments_data = comments_df.to_dict('records')
-
-        # Use the appropriate data source
-        if 'data' in locals():
-            posts_data = data['posts']
-            comments_data = data['comments']
-
-        print("Getting topic...")
-        topic = get_topic(agency)
-        print(f"Topic: {topic}")
-        print("Filtering posts and comments...")
-        filtered_posts_and_comments = get_filtered_posts_and_comments(
-            posts_data,
-            comments_data,
-            topic
-        )
+        # Everything produced below is recorded so a restart resumes where it stopped
+        checkpoint = Checkpoint(agency, month, year)
 
-        print(f"Filtered results: {len(filtered_posts_and_comments)} posts with relevant comments")
+        print("Getting keywords...")
+        report_progress(progress, "stage", stage="keywords")
+        if keywords is None:
+            with stage("keywords"):
+                keywords = get_keywords(agency, checkpoint)
+        print(f"Keywords: {keywords}")
 
-        print("Generating report...")
-        report = generate_report(filtered_posts_and_comments, agency, topic)
+        if streaming:
+            filtered_posts_and_comments, report = run_streaming(agency, month, year, keywords, checkpoint, progress,
+                                                                should_stop)
+        else:
+            filtered_posts_and_comments, report = run_phases(agency, month, year, keywords, corpus, checkpoint,
+                                                             progress, should_stop)
 
         # Save report to file
-        report_filename = f"report_{agency.replace(' ', '_').lower()}_{timestamp}.md"
         with open(report_filename, 'w', encoding='utf-8') as f:
             f.write(report)
         print(f"Report saved to {report_filename}")
 
         # Upload to BigQuery (optional - set environment variables to enable)
+        report_progress(progress, "stage", stage="upload")
         try:
-            upload_report_to_bigquery(
-                agency=agency,
-                month=month,
-                year=year,
-                report_content=report,
-                credentials=credentials,
-                project_id="sundai-club-434220",
-                dataset_id="bostonreports",
-                table_id="boston-reports"
-            )
-            print("Report uploaded to BigQuery successfully")
+            with stage("upload"):
+                upload_report(agency, month, year, report, upload_batch)
+            if upload_batch is None:
+                print("Report uploaded to BigQuery successfully")
         except Exception as e:
             print(f"BigQuery upload failed (this is optional): {e}")
             print("To enable BigQuery upload, set GOOGLE_CLOUD_PROJECT environment variable")
@@ -158,8 +261,49 @@ if __name__ == "__main__":
     "Department of Children and Families"
 ]
 
+    month, year = 9, 2025
+    started_at = datetime.now()
+
+    # Only agencies that still need scraping contribute keywords to the shared corpus
+    keywords_by_agency = {}
+    for agency in mass_gov_agencies:
+        if os.path.exists(get_report_filename(agency, month, year)):
+            continue
+        with stage("keywords"):
+            keywords_by_agency[agency] = get_keywords(agency, Checkpoint(agency, month, year))
+
+    corpus = None
+    if keywords_by_agency:
+        all_keywords = sorted({k for keywords in keywords_by_agency.values() for k in keywords})
+        print(f"Building shared corpus with {len(all_keywords)} keywords...")
+        with stage("corpus"):
+            corpus = build_corpus(limit=1000, year=year, month=month,
+                                  subreddits=subreddits, keywords=all_keywords)
+
+    # Reports are uploaded together once every agency is done
+    upload_batch = ReportUploadBatch(project_id=BIGQUERY_PROJECT_ID,
+                                     credentials=credentials,
+                                     dataset_id=BIGQUERY_DATASET_ID,
+                                     table_id=BIGQUERY_TABLE_ID)
     for agency in mass_gov_agencies:
         print(agency)
-        results = run(agency, 9, 2025)
+        results = run(agency, month, year,
+                      keywords=keywords_by_agency.get(agency),
+                      corpus=corpus,
+                      upload_batch=upload_batch)
+
+    try:
+        with stage("upload"):
+            upload_batch.flush()
+    except Exception as e:
+        print(f"BigQuery upload failed (this is optional): {e}")
+
+    print(f"LLM cache: {get_cache().stats()}")
+    # Where the batch spent its time and money
+    write_run_summary(f"run_summary_{month}-{year}.json",
+                      month=month, year=year,
+                      agencies=mass_gov_agencies,
+                      started_at=started_at.isoformat(),
+                      wall_seconds=round((datetime.now() - started_at).total_seconds(), 3))
     # print(results)
     # results = run("Registry of Motor Vehicles", 9, 2025)
\ No newline at end of file
@@ -0,0 +1,332 @@
+import io
+import os
+import csv
+import json
+import hashlib
+import argparse
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool
+
+from src.keyword_matcher import get_matcher
+from src.scrape_reddit import items_to_scraper_data
+from src.storage import STORAGE_DIR, partition_lock, write_partition
+from src import metrics
+
+# configure via env vars
+ARCHIVE_WORKERS = int(os.environ.get("ARCHIVE_WORKERS", os.cpu_count() or 1))
+# Bytes of decompressed NDJSON handed to a worker at a time
+ARCHIVE_CHUNK_BYTES = int(os.environ.get("ARCHIVE_CHUNK_BYTES", 16 * 2 ** 20))
+# Comments are kept this long after the end of the window, for posts near its end
+ARCHIVE_COMMENT_GRACE_DAYS = int(os.environ.get("ARCHIVE_COMMENT_GRACE_DAYS", 30))
+
+# The dumps are compressed with long-distance matching windows of up to 2 GB
+ZSTD_MAX_WINDOW_SIZE = 2 ** 31
+REMOVED_BODIES = ("[deleted]", "[removed]")
+
+# Per-process filter settings, set once by init_worker() instead of being sent with every chunk
+_worker = {}
+
+
+def get_epoch_window(year, month=None):
+    """Epoch [start, end) of a month or year, in local time like is_within_date_range()."""
+    start = datetime(year, month or 1, 1)
+    if month is None or month == 12:
+        end = datetime(year + 1, 1, 1)
+    else:
+        end = datetime(year, month + 1, 1)
+    return start.timestamp(), end.timestamp()
+
+
+def open_dump(path):
+    """
+    Open a dump as a binary stream of NDJSON, decompressing .zst files on the fly.
+
+    Reading .zst dumps needs the optional zstandard package (pip install zstandard),
+    plain NDJSON dumps do not.
+    """
+    if not path.endswith(".zst"):
+        return open(path, 'rb')
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"Reading {path} needs the zstandard package: pip install zstandard") from None
+    f = open(path, 'rb')
+    reader = zstandard.ZstdDecompressor(max_window_size=ZSTD_MAX_WINDOW_SIZE).stream_reader(f, closefd=True)
+    return io.BufferedReader(reader)
+
+
+def iter_chunks(path, chunk_bytes=ARCHIVE_CHUNK_BYTES):
+    """Yield blocks of about chunk_bytes bytes of a dump, always ending at a line break."""
+    with open_dump(path) as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            # Complete the last line so no record is split between two workers
+            chunk += f.readline()
+            yield chunk
+
+
+def init_worker(subreddits, start, end, comment_end, keywords):
+    _worker["subreddits"] = {sub.lower() for sub in subreddits}
+    # Raw lines are checked for these before paying for json.loads
+    _worker["needles"] = [f'"{sub.lower()}"'.encode() for sub in subreddits]
+    _worker["start"] = start
+    _worker["end"] = end
+    _worker["comment_end"] = comment_end
+    _worker["matcher"] = get_matcher(keywords) if keywords else None
+
+
+def parse_lines(chunk, end):
+    """Decode the lines of a chunk that are in one of the subreddits and [start, end)."""
+    for line in chunk.splitlines():
+        lowered = line.lower()
+        if not any(needle in lowered for needle in _worker["needles"]):
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            continue
+        if str(obj.get("subreddit", "")).lower() not in _worker["subreddits"]:
+            continue
+        created_utc = float(obj.get("created_utc") or 0)
+        if not _worker["start"] <= created_utc < end:
+            continue
+        obj["created_utc"] = created_utc
+        yield obj
+
+
+def get_author(obj):
+    author = obj.get("author")
+    return None if author in (None, "[deleted]") else author
+
+
+def filter_submissions(chunk):
+    """
+    Worker task: post records of a submissions chunk, with the keyword hits of
+    their text ("comments" is filled in later).
+
+    Returns:
+        Tuple of (post records, lines in the chunk)
+    """
+    matcher = _worker["matcher"]
+    records = []
+    for obj in parse_lines(chunk, _worker["end"]):
+        created_utc = obj["created_utc"]
+        text = (obj.get("title") or "") + " " + (obj.get("selftext") or "")
+        records.append({
+            "source": "reddit",
+            "subreddit": obj.get("subreddit"),
+            "id": obj["id"],
+            "unique_id": hashlib.sha256((obj["id"] + str(created_utc)).encode()).hexdigest(),
+            "title": obj.get("title"),
+            "body": obj.get("selftext"),
+            "url": obj.get("url"),
+            "author": get_author(obj),
+            "created_utc": created_utc,
+            "num_comments": obj.get("num_comments"),
+            "score": obj.get("score"),
+            "keyword_hits": matcher.score(text) if matcher is not None else 0,
+            "comments": None,
+        })
+    return records, chunk.count(b"\n")
+
+
+def filter_comments_chunk(chunk):
+    """
+    Worker task: (post id, comment record) pairs of a comments chunk.
+
+    Returns:
+        Tuple of (pairs, lines in the chunk)
+    """
+    matcher = _worker["matcher"]
+    pairs = []
+    for obj in parse_lines(chunk, _worker["comment_end"]):
+        body = obj.get("body")
+        link_id = obj.get("link_id") or ""
+        if not body or body in REMOVED_BODIES or not link_id.startswith("t3_"):
+            continue
+        hits = matcher.score(body) if matcher is not None else 0
+        pairs.append((link_id[3:], {
+            "comment_id": obj["id"],
+            "author": get_author(obj),
+            "body": body,
+            "created_utc": obj["created_utc"],
+            "score": obj.get("score"),
+            "parent_id": obj.get("parent_id"),
+            "is_related": hits > 0,
+            "keyword_hits": hits,
+        }))
+    return pairs, chunk.count(b"\n")
+
+
+def map_chunks(pool, func, chunks, max_pending):
+    """
+    Apply func to chunks in the pool, in order, with at most max_pending chunks in flight.
+
+    Pool.imap() would read the whole dump ahead of the workers; this keeps memory
+    bounded by pausing decompression while the workers catch up.
+    """
+    if pool is None:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(func, (chunk,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def ingest_archive(submission_paths, comment_paths, subreddits, year=None, month=None, start=None, end=None,
+                   keywords=None, keep_unmatched=False, workers=ARCHIVE_WORKERS, chunk_bytes=ARCHIVE_CHUNK_BYTES,
+                   comment_grace_days=ARCHIVE_COMMENT_GRACE_DAYS):
+    """
+    Stream archive dumps and collect the posts of some subreddits in a time window.
+
+    Chunks of each dump are filtered by subreddit and epoch window in worker
+    processes; comments are then joined to their posts through link_id.
+
+    Args:
+        submission_paths (list): Submission dumps (.zst or plain NDJSON)
+        comment_paths (list): Comment dumps (.zst or plain NDJSON)
+        subreddits (list): Subreddit names to keep
+        year (int, optional): Year of the window, when start/end are not given
+        month (int, optional): Month of the window within the year
+        start (float, optional): Window start as an epoch timestamp, overrides year/month
+        end (float, optional): Window end (exclusive) as an epoch timestamp
+        keywords (list, optional): Posts must contain one to get their comments, as in
+            fetch_new(). Without keywords every post gets its comments.
+        keep_unmatched (bool): Also return posts that did not match the keywords,
+            with "comments" set to None
+        workers (int): Worker processes, 1 filters in this process
+        chunk_bytes (int): Decompressed bytes per worker task
+        comment_grace_days (int): Days after the window end whose comments are still joined
+
+    Returns:
+        list: Post records with their comments, newest first within each subreddit,
+        in the subreddit names given
+    """
+    if start is None or end is None:
+        start, end = get_epoch_window(year, month)
+    comment_end = end + comment_grace_days * 86400
+    names = {sub.lower(): sub for sub in subreddits}
+    initargs = (subreddits, start, end, comment_end, keywords)
+
+    pool = None
+    if workers > 1:
+        pool = Pool(processes=workers, initializer=init_worker, initargs=initargs)
+    else:
+        init_worker(*initargs)
+    try:
+        posts = {}
+        for path in submission_paths:
+            print(f"Reading submissions from {path}")
+            for records, lines in map_chunks(pool, filter_submissions, iter_chunks(path, chunk_bytes), workers * 2):
+                metrics.inc("archive_lines_total", lines, kind="submissions")
+                for record in records:
+                    record["subreddit"] = names[record["subreddit"].lower()]
+                    if keywords is None or record["keyword_hits"]:
+                        record["comments"] = []
+                    elif not keep_unmatched:
+                        continue
+                    posts[record["id"]] = record
+        print(f"Kept {len(posts)} posts")
+
+        comment_count = 0
+        for path in comment_paths:
+            print(f"Reading comments from {path}")
+            for pairs, lines in map_chunks(pool, filter_comments_chunk, iter_chunks(path, chunk_bytes), workers * 2):
+                metrics.inc("archive_lines_total", lines, kind="comments")
+                for post_id, comment in pairs:
+                    post = posts.get(post_id)
+                    if post is not None and post["comments"] is not None:
+                        post["comments"].append(comment)
+                        comment_count += 1
+        print(f"Joined {comment_count} comments")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    metrics.inc("archive_posts_total", len(posts))
+    metrics.inc("archive_comments_total", comment_count)
+    order = {sub: i for i, sub in enumerate(subreddits)}
+    return sorted(posts.values(), key=lambda post: (order[post["subreddit"]], -post["created_utc"]))
+
+
+def run_archive_scraper(submission_paths, comment_paths, subreddits, keywords, year=None, month=None,
+                        start=None, end=None, workers=ARCHIVE_WORKERS):
+    """
+    Archive counterpart of run_scraper(): keyword-matching posts of the window with their comments.
+
+    Returns:
+        dict: Contains 'posts' and 'comments' data, as returned by run_scraper()
+    """
+    items = ingest_archive(submission_paths, comment_paths, subreddits, year=year, month=month, start=start,
+                           end=end, keywords=keywords, workers=workers)
+    return items_to_scraper_data(items)
+
+
+def store_archive_items(items, corpus_dir=STORAGE_DIR):
+    """
+    Write archive records into the corpus, one partition per (subreddit, year, month),
+    where build_corpus() finds them instead of paging the API.
+
+    Stored partitions are replaced, so the window should cover whole months.
+    """
+    partitions = {}
+    for item in items:
+        created = datetime.fromtimestamp(item["created_utc"])
+        partitions.setdefault((item["subreddit"], created.year, created.month), []).append(item)
+    for (subreddit, year, month), partition_items in sorted(partitions.items()):
+        with partition_lock(subreddit, year, month, root=corpus_dir):
+            write_partition(partition_items, subreddit, year, month, root=corpus_dir)
+        print(f"Stored {len(partition_items)} posts for r/{subreddit} {year}-{month:02d}")
+    return sorted(partitions)
+
+
+def write_csv(rows, path):
+    if not rows:
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote {len(rows)} rows to {path}")
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest local Reddit archive dumps")
+    parser.add_argument("--submissions", nargs="*", default=[], help="Submission dump files")
+    parser.add_argument("--comments", nargs="*", default=[], help="Comment dump files")
+    parser.add_argument("--subreddits", nargs="+", required=True)
+    parser.add_argument("--year", type=int)
+    parser.add_argument("--month", type=int)
+    parser.add_argument("--start", type=parse_date, help="Window start, YYYY-MM-DD (overrides --year/--month)")
+    parser.add_argument("--end", type=parse_date, help="Window end, exclusive, YYYY-MM-DD")
+    parser.add_argument("--keywords", nargs="*", help="Only keep comments of posts matching these")
+    parser.add_argument("--workers", type=int, default=ARCHIVE_WORKERS)
+    parser.add_argument("--store", action="store_true", help="Write the posts into the corpus partitions")
+    parser.add_argument("--corpus-dir", default=STORAGE_DIR)
+    parser.add_argument("--output-prefix", help="Write {prefix}_posts.csv and {prefix}_comments.csv")
+    args = parser.parse_args()
+    if (args.start is None or args.end is None) and args.year is None:
+        parser.error("either --year or both --start and --end are required")
+
+    items = ingest_archive(args.submissions, args.comments, args.subreddits, year=args.year, month=args.month,
+                           start=args.start, end=args.end, keywords=args.keywords or None,
+                           keep_unmatched=args.store, workers=args.workers)
+    if args.store:
+        store_archive_items(items, args.corpus_dir)
+    if args.output_prefix:
+        data = items_to_scraper_data([item for item in items if item["comments"] is not None])
+        write_csv(data["posts"], f"{args.output_prefix}_posts.csv")
+        write_csv(data["comments"], f"{args.output_prefix}_comments.csv")
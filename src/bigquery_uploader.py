@@ -1,81 +1,182 @@
 from google.cloud import bigquery
 from google.oauth2 import service_account
+from google.api_core.retry import Retry, if_transient_error
 import os
+import json
+import time
+import hashlib
+import threading
+from src import metrics
 
 
-def insert_report(agency, month, year, report_content,
-                 project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports"):
+# Retry transient insert failures (429/5xx, connection errors) for up to 2 minutes
+INSERT_RETRY = Retry(predicate=if_transient_error, initial=1.0, maximum=30.0, deadline=120.0)
+# insertAll requests are limited to 10 MB
+MAX_INSERT_BYTES = 9 * 1024 * 1024
+
+# Seconds get_reports() results are served from the local cache
+REPORTS_CACHE_TTL = float(os.environ.get("REPORTS_CACHE_TTL", 300))
+
+_clients = {}
+_tables = {}
+_reports_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_client(project_id=None, credentials=None):
     """
-    Insert a new report into BigQuery
+    Return a long-lived BigQuery client for (project, credentials), creating it on first use.
 
     Args:
-        agency: Agency name
-        month: Month (integer)
-        year: Year (integer)
-        report_content: Markdown report content
-        project_id: Google Cloud project ID
+        project_id: Google Cloud project ID (defaults to GOOGLE_CLOUD_PROJECT)
         credentials: Service account credentials (optional)
-        dataset_id: BigQuery dataset name
-        table_id: Table name
+
+    Returns:
+        bigquery.Client
     """
     if not project_id:
         project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
         if not project_id:
             raise ValueError("Set GOOGLE_CLOUD_PROJECT environment variable")
 
-    # Create client with credentials
-    if credentials:
-        client = bigquery.Client(project=project_id, credentials=credentials)
-    else:
-        # Use default credentials (environment variable, gcloud auth, etc.)
-        client = bigquery.Client(project=project_id)
-    table_ref = f"{project_id}.{dataset_id}.{table_id}"
-
-    rows_to_insert = [{
-        "agency": agency,
-        "month": month,
-        "year": year,
-        "report": report_content
-    }]
+    # Credentials are kept in the cache entry so their id stays unique
+    key = (project_id, id(credentials) if credentials is not None else None)
+    with _cache_lock:
+        if key not in _clients:
+            if credentials:
+                client = bigquery.Client(project=project_id, credentials=credentials)
+            else:
+                # Use default credentials (environment variable, gcloud auth, etc.)
+                client = bigquery.Client(project=project_id)
+            _clients[key] = (credentials, client)
+        return _clients[key][1]
+
+
+def get_table(client, table_ref):
+    """Return the table metadata, fetching it once per client."""
+    key = (id(client), table_ref)
+    with _cache_lock:
+        table = _tables.get(key)
+    if table is None:
+        table = client.get_table(table_ref)
+        with _cache_lock:
+            _tables[key] = table
+    return table
+
+
+def make_row_id(row):
+    """Stable insert id, so a retried insert of the same report is deduplicated by BigQuery."""
+    content_hash = hashlib.sha256(row["report"].encode()).hexdigest()
+    return hashlib.sha256(f"{row['agency']}|{row['year']}|{row['month']}|{content_hash}".encode()).hexdigest()
+
+
+def insert_reports(reports, project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports"):
+    """
+    Insert several reports into BigQuery in as few requests as possible.
 
-    errors = client.insert_rows_json(client.get_table(table_ref), rows_to_insert)
+    Args:
+        reports: List of dicts with agency, month, year and report keys
+        project_id: Google Cloud project ID
+        credentials: Service account credentials (optional)
+        dataset_id: BigQuery dataset name
+        table_id: Table name
+    """
+    if not reports:
+        return
+
+    client = get_client(project_id, credentials)
+    table_ref = f"{client.project}.{dataset_id}.{table_id}"
+    table = get_table(client, table_ref)
+
+    rows = [{"agency": r["agency"], "month": r["month"], "year": r["year"], "report": r["report"]} for r in reports]
+
+    # Split only when the rows would exceed the insertAll request size limit
+    requests = [[]]
+    request_bytes = 0
+    for row in rows:
+        row_bytes = len(json.dumps(row).encode())
+        if requests[-1] and request_bytes + row_bytes > MAX_INSERT_BYTES:
+            requests.append([])
+            request_bytes = 0
+        requests[-1].append(row)
+        request_bytes += row_bytes
+
+    errors = []
+    for request_rows in requests:
+        with metrics.timer("bigquery_insert_duration_seconds", table=table_ref):
+            request_errors = client.insert_rows_json(
+                table,
+                request_rows,
+                row_ids=[make_row_id(row) for row in request_rows],
+                retry=INSERT_RETRY
+            )
+        metrics.inc("bigquery_rows_total", len(request_rows) - len(request_errors), status="ok")
+        metrics.inc("bigquery_rows_total", len(request_errors), status="error")
+        errors.extend(request_errors)
+    invalidate_reports_cache(table_ref)
 
     if errors:
-        raise Exception(f"Error inserting report: {errors}")
-    else:
-        print(f"Successfully inserted report for {agency} ({month}/{year})")
+        raise Exception(f"Error inserting reports: {errors}")
 
 
-def get_reports(agency=None, month=None, year=None,
-               project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports"):
+class ReportUploadBatch:
     """
-    Get reports from BigQuery with optional filters
+    Accumulates reports and uploads them with a single insert_reports() call.
+
+    Usable as a context manager, which flushes on exit.
+    """
+
+    def __init__(self, project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports"):
+        self.project_id = project_id
+        self.credentials = credentials
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.reports = []
+
+    def add(self, agency, month, year, report_content):
+        self.reports.append({"agency": agency, "month": month, "year": year, "report": report_content})
+
+    def flush(self):
+        """Upload the pending reports. If the insert fails they stay pending for the next flush."""
+        reports, self.reports = self.reports, []
+        try:
+            insert_reports(reports, project_id=self.project_id, credentials=self.credentials,
+                           dataset_id=self.dataset_id, table_id=self.table_id)
+        except Exception:
+            # Rows that did get in are deduplicated by their insert ids when retried
+            self.reports[:0] = reports
+            raise
+        if reports:
+            print(f"Successfully inserted {len(reports)} reports")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+
+def insert_report(agency, month, year, report_content,
+                 project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports"):
+    """
+    Insert a new report into BigQuery
 
     Args:
-        agency: Filter by agency name (optional)
-        month: Filter by month (optional)
-        year: Filter by year (optional)
+        agency: Agency name
+        month: Month (integer)
+        year: Year (integer)
+        report_content: Markdown report content
         project_id: Google Cloud project ID
         credentials: Service account credentials (optional)
         dataset_id: BigQuery dataset name
         table_id: Table name
-
-    Returns:
-        List of report records
     """
-    if not project_id:
-        project_id = os.getenv('GOOGLE_CLOUD_PROJECT')
-        if not project_id:
-            raise ValueError("Set GOOGLE_CLOUD_PROJECT environment variable")
+    insert_reports([{"agency": agency, "month": month, "year": year, "report": report_content}],
+                   project_id=project_id, credentials=credentials, dataset_id=dataset_id, table_id=table_id)
+    print(f"Successfully inserted report for {agency} ({month}/{year})")
 
-    # Create client with credentials
-    if credentials:
-        client = bigquery.Client(project=project_id, credentials=credentials)
-    else:
-        # Use default credentials (environment variable, gcloud auth, etc.)
-        client = bigquery.Client(project=project_id)
-    table_ref = f"{project_id}.{dataset_id}.{table_id}"
 
+def _build_reports_query(table_ref, agency=None, month=None, year=None, include_report=True):
     where_clauses = []
     parameters = []
 
@@ -93,17 +194,100 @@ def get_reports(agency=None, month=None, year=None,
 
     where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
+    # BigQuery bills by the columns read, so only touch `report` when it is needed
+    columns = "agency, month, year, report" if include_report else "agency, month, year"
+
     query = f"""
-    SELECT agency, month, year, report
+    SELECT {columns}
     FROM `{table_ref}`
     {where_clause}
     ORDER BY year DESC, month DESC, agency
     """
+    return query, bigquery.QueryJobConfig(query_parameters=parameters)
+
+
+def iter_reports(agency=None, month=None, year=None, include_report=True, page_size=100,
+                 project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports"):
+    """
+    Stream reports from BigQuery page by page instead of materializing them all.
+
+    Args:
+        agency: Filter by agency name (optional)
+        month: Filter by month (optional)
+        year: Filter by year (optional)
+        include_report: Also fetch the report markdown (False lists metadata only)
+        page_size: Rows fetched per page
+        project_id: Google Cloud project ID
+        credentials: Service account credentials (optional)
+        dataset_id: BigQuery dataset name
+        table_id: Table name
+
+    Yields:
+        dict: One report record at a time
+    """
+    client = get_client(project_id, credentials)
+    table_ref = f"{client.project}.{dataset_id}.{table_id}"
 
-    job_config = bigquery.QueryJobConfig(query_parameters=parameters)
+    query, job_config = _build_reports_query(table_ref, agency, month, year, include_report)
     query_job = client.query(query, job_config=job_config)
 
-    return [dict(row) for row in query_job.result()]
+    for row in query_job.result(page_size=page_size):
+        yield dict(row)
+
+
+def get_reports(agency=None, month=None, year=None,
+               project_id=None, credentials=None, dataset_id="government_analytics", table_id="reports",
+               include_report=True, use_cache=True):
+    """
+    Get reports from BigQuery with optional filters
+
+    Results are served from a local read-through cache for REPORTS_CACHE_TTL
+    seconds; insert_reports() invalidates the cached results of its table.
+
+    Args:
+        agency: Filter by agency name (optional)
+        month: Filter by month (optional)
+        year: Filter by year (optional)
+        project_id: Google Cloud project ID
+        credentials: Service account credentials (optional)
+        dataset_id: BigQuery dataset name
+        table_id: Table name
+        include_report: Also fetch the report markdown (False lists metadata only)
+        use_cache: Read through the local cache
+
+    Returns:
+        List of report records
+    """
+    client = get_client(project_id, credentials)
+    table_ref = f"{client.project}.{dataset_id}.{table_id}"
+    cache_key = (table_ref, agency, month, year, include_report)
+
+    if use_cache:
+        with _cache_lock:
+            cached = _reports_cache.get(cache_key)
+        if cached is not None and time.monotonic() < cached[0]:
+            return list(cached[1])
+
+    reports = list(iter_reports(agency, month, year, include_report=include_report,
+                                project_id=client.project, credentials=credentials,
+                                dataset_id=dataset_id, table_id=table_id))
+    if use_cache:
+        with _cache_lock:
+            _reports_cache[cache_key] = (time.monotonic() + REPORTS_CACHE_TTL, reports)
+    return list(reports)
+
+
+def list_reports(agency=None, month=None, year=None, **kwargs):
+    """List which (agency, month, year) reports exist, without transferring report bodies."""
+    return get_reports(agency, month, year, include_report=False, **kwargs)
+
+
+def invalidate_reports_cache(table_ref=None):
+    """Drop cached get_reports() results, for one table or all of them."""
+    with _cache_lock:
+        for key in list(_reports_cache):
+            if table_ref is None or key[0] == table_ref:
+                del _reports_cache[key]
 
 
 # Helper function to load credentials from service account file
@@ -131,7 +315,6 @@ def load_credentials_from_json(service_account_json):
     Returns:
         Service account credentials object
     """
-    import json
     service_account_info = json.loads(service_account_json)
     return service_account.Credentials.from_service_account_info(service_account_info)
 
@@ -0,0 +1,157 @@
+import os
+import json
+import math
+import zlib
+import threading
+
+from src.openai_wrapper import get_completion_with_logprobs
+from src.prompts import filter_post_yes_no_prompt, filter_system_prompt
+from src.filtering import is_relevant_post
+from src import metrics
+
+# configure via env vars
+# "1" makes run() classify posts with the cascade instead of batched requests
+CASCADE_ENABLED = os.environ.get("CASCADE_ENABLED", "0") == "1"
+CASCADE_CHEAP_MODEL = os.environ.get("CASCADE_CHEAP_MODEL", "gpt-4o-mini")
+CASCADE_STRONG_MODEL = os.environ.get("CASCADE_STRONG_MODEL", "gpt-4o")
+# Cheap answers less confident than this escalate to the strong model
+CASCADE_THRESHOLD = float(os.environ.get("CASCADE_THRESHOLD", 0.9))
+# Per-agency overrides of CASCADE_THRESHOLD, as a JSON object of agency name to threshold
+CASCADE_THRESHOLDS = json.loads(os.environ.get("CASCADE_THRESHOLDS", "{}"))
+# Keyword hits at which a post is accepted without asking a model, 0 disables the keyword tier
+CASCADE_KEYWORD_HITS = int(os.environ.get("CASCADE_KEYWORD_HITS", 0))
+# Share of confidently decided posts also sent to the strong model to measure agreement
+CASCADE_AUDIT_RATE = float(os.environ.get("CASCADE_AUDIT_RATE", 0.0))
+
+TIERS = ("keywords", "cheap", "strong")
+CONFIDENCE_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+
+def get_cascade_threshold(agency=None):
+    return float(CASCADE_THRESHOLDS.get(agency, CASCADE_THRESHOLD)) if agency else CASCADE_THRESHOLD
+
+
+def yes_no_verdict(content, alternatives):
+    """
+    Read a yes/no answer and its confidence from the first token's alternatives.
+
+    The confidence is the probability of the chosen answer among the yes and no
+    tokens. Without logprobs the answer is read from the text with confidence 0.
+
+    Returns:
+        Tuple of (verdict or None if the answer is neither yes nor no, confidence)
+    """
+    p_yes = sum(math.exp(logprob) for token, logprob in alternatives if token.strip().lower() == "yes")
+    p_no = sum(math.exp(logprob) for token, logprob in alternatives if token.strip().lower() == "no")
+    if p_yes + p_no > 0:
+        return p_yes >= p_no, max(p_yes, p_no) / (p_yes + p_no)
+    answer = (content or "").strip().lower()
+    if answer.startswith("yes"):
+        return True, 0.0
+    if answer.startswith("no"):
+        return False, 0.0
+    return None, 0.0
+
+
+class Cascade:
+    """
+    Relevance classification in tiers of increasing cost.
+
+    1. keywords: posts with at least keyword_hits keyword hits are accepted outright
+    2. cheap: a small model answers yes/no, its confidence is read from the logprobs
+    3. strong: answers of the cheap model below the threshold are asked again of the
+       strong model, whose verdict stands (None if its answer could not be parsed)
+
+    A deterministic audit_rate sample of the posts decided by the first two tiers is
+    also sent to the strong model; audits only measure agreement, the earlier
+    verdict stands. Safe to share between threads.
+
+    Args:
+        agency: Agency name, picks the threshold from CASCADE_THRESHOLDS
+        threshold: Confidence below which the cheap tier escalates (overrides the agency's)
+        cheap_model: Model of the cheap tier
+        strong_model: Model of the strong tier
+        keyword_hits: Keyword hits accepted without a model, 0 disables the tier
+        audit_rate: Share of confident decisions double-checked by the strong model
+    """
+
+    def __init__(self, agency=None, threshold=None, cheap_model=CASCADE_CHEAP_MODEL,
+                 strong_model=CASCADE_STRONG_MODEL, keyword_hits=CASCADE_KEYWORD_HITS,
+                 audit_rate=CASCADE_AUDIT_RATE):
+        self.threshold = threshold if threshold is not None else get_cascade_threshold(agency)
+        self.cheap_model = cheap_model
+        self.strong_model = strong_model
+        self.keyword_hits = keyword_hits
+        self.audit_rate = audit_rate
+        self.lock = threading.Lock()
+        self.decisions = {tier: 0 for tier in TIERS}
+        self.relevant = {tier: 0 for tier in TIERS}
+        # comparison with the strong model -> [compared, agreed]
+        self.comparisons = {"escalated": [0, 0], "audited_keywords": [0, 0], "audited_cheap": [0, 0]}
+
+    def cheap_verdict(self, post, topic):
+        post_text = f"Title: {post.get('title', '')}\nBody: {post.get('body', '')}"
+        prompt = filter_post_yes_no_prompt.format(topic=topic, post=post_text)
+        content, alternatives = get_completion_with_logprobs(filter_system_prompt, prompt, model=self.cheap_model)
+        return yes_no_verdict(content, alternatives)
+
+    def strong_verdict(self, post, topic):
+        return is_relevant_post(post, topic, model=self.strong_model, temperature=0)
+
+    def audited(self, post):
+        """Deterministic sample, so reruns audit the same posts and hit the cache."""
+        if self.audit_rate <= 0:
+            return False
+        return zlib.crc32(str(post.get('id', '')).encode()) / 2 ** 32 < self.audit_rate
+
+    def compare(self, comparison, verdict, strong):
+        if strong is None:
+            # The strong model's answer could not be parsed, there is nothing to compare
+            return
+        with self.lock:
+            counts = self.comparisons[comparison]
+            counts[0] += 1
+            counts[1] += int(bool(verdict) == bool(strong))
+        metrics.inc("cascade_comparisons_total", comparison=comparison, agreed=str(bool(verdict) == bool(strong)))
+
+    def decide(self, tier, verdict):
+        with self.lock:
+            self.decisions[tier] += 1
+            self.relevant[tier] += int(bool(verdict))
+        metrics.inc("cascade_decisions_total", tier=tier)
+        return verdict
+
+    def classify(self, post, topic):
+        """Classify one post, escalating through the tiers until one is confident."""
+        if self.keyword_hits and int(post.get('keyword_hits') or 0) >= self.keyword_hits:
+            if self.audited(post):
+                self.compare("audited_keywords", True, self.strong_verdict(post, topic))
+            return self.decide("keywords", True)
+
+        verdict, confidence = self.cheap_verdict(post, topic)
+        metrics.observe("cascade_confidence", confidence, buckets=CONFIDENCE_BUCKETS)
+        if verdict is not None and confidence >= self.threshold:
+            if self.audited(post):
+                self.compare("audited_cheap", verdict, self.strong_verdict(post, topic))
+            return self.decide("cheap", verdict)
+
+        strong = self.strong_verdict(post, topic)
+        if verdict is not None:
+            self.compare("escalated", verdict, strong)
+        return self.decide("strong", strong)
+
+    def report(self):
+        """Per-tier volumes and how often the cheaper tiers agreed with the strong model."""
+        with self.lock:
+            total = sum(self.decisions.values())
+            return {
+                "threshold": self.threshold,
+                "models": {"cheap": self.cheap_model, "strong": self.strong_model},
+                "posts": total,
+                "tiers": {tier: {"decided": self.decisions[tier], "relevant": self.relevant[tier],
+                                 "share": round(self.decisions[tier] / total, 4) if total else None}
+                          for tier in TIERS},
+                "agreement": {name: {"compared": compared, "agreed": agreed,
+                                     "rate": round(agreed / compared, 4) if compared else None}
+                              for name, (compared, agreed) in self.comparisons.items()},
+            }
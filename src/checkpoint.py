@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+
+# configure via env vars
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "checkpoints")
+
+
+def agency_slug(agency):
+    return agency.replace(' ', '_').lower()
+
+
+def get_report_filename(agency, month, year):
+    """Markdown file run() writes a finished report to."""
+    return f"report_{agency_slug(agency)}_{month}-{year}.md"
+
+
+def load_report(agency, month, year, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Return the finished report of an (agency, month, year), or None if it was not generated yet.
+
+    Looks at the report file first, then at a checkpointed report whose run did
+    not get as far as writing the file.
+    """
+    filename = get_report_filename(agency, month, year)
+    if os.path.exists(filename):
+        with open(filename, 'r', encoding='utf-8') as f:
+            return f.read()
+    path = Checkpoint.get_path(agency, month, year, checkpoint_dir)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("report")
+    return None
+
+
+class Checkpoint:
+    """
+    Stage manifest of one (agency, month, year) pipeline run.
+
+    Holds the keywords, topic, per-post and per-comment relevance verdicts and
+    the final report, so a restarted run can skip everything that was already
+    produced. Keywords, topic and report rewrite the manifest (atomically).
+    Verdicts arrive in many small batches, so they are only appended to a JSONL
+    log next to it, which is folded back into the manifest when the checkpoint
+    is loaded and on the next full save. Safe to update from several worker
+    threads.
+    """
+
+    def __init__(self, agency, month, year, checkpoint_dir=CHECKPOINT_DIR):
+        self.path = self.get_path(agency, month, year, checkpoint_dir)
+        self.log_path = f"{os.path.splitext(self.path)[0]}.verdicts.jsonl"
+        self.lock = threading.RLock()
+        self.log = None
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        else:
+            self.data = {
+                "agency": agency,
+                "month": month,
+                "year": year,
+                "keywords": None,
+                "topic": None,
+                "post_verdicts": {},
+                "comment_verdicts": {},
+                "report": None
+            }
+        if os.path.exists(self.log_path):
+            self.replay_log()
+            self.save()
+
+    @staticmethod
+    def get_path(agency, month, year, checkpoint_dir=CHECKPOINT_DIR):
+        return os.path.join(checkpoint_dir, f"{agency_slug(agency)}_{month}-{year}.json")
+
+    def save(self):
+        """Rewrite the whole manifest, verdicts included, and empty the verdict log."""
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+            # Only dropped once the manifest holds its verdicts, replaying it again is harmless
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+
+    def replay_log(self):
+        with open(self.log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line cut short by a crash
+                    continue
+                self.apply(entry)
+
+    def apply(self, entry):
+        if "comments" in entry:
+            post_verdicts = self.data["comment_verdicts"].setdefault(entry["post_id"], {})
+            post_verdicts.update(entry["comments"])
+        else:
+            self.data["post_verdicts"].update(entry["posts"])
+
+    def append(self, entry):
+        """Apply a verdict log entry and append it to the log."""
+        with self.lock:
+            self.apply(entry)
+            if self.log is None:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                self.log = open(self.log_path, 'a', encoding='utf-8')
+            self.log.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            self.log.flush()
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.save()
+
+    def get_post_verdicts(self):
+        """Return a copy of the post id to relevance map recorded so far."""
+        with self.lock:
+            return dict(self.data["post_verdicts"])
+
+    def record_post_verdicts(self, verdicts):
+        if not verdicts:
+            return
+        self.append({"posts": {str(post_id): bool(v) for post_id, v in verdicts.items()}})
+
+    def get_comment_verdicts(self, post_id):
+        """Return a copy of the comment id to relevance map recorded for a post."""
+        with self.lock:
+            return dict(self.data["comment_verdicts"].get(str(post_id), {}))
+
+    def record_comment_verdicts(self, post_id, verdicts):
+        if not verdicts:
+            return
+        self.append({"post_id": str(post_id),
+                     "comments": {str(comment_id): bool(v) for comment_id, v in verdicts.items()}})
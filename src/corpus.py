@@ -0,0 +1,139 @@
+from src.scrape_reddit import (connects, fetch_new, fetch_comments, keyword_hits, save_high_water_mark,
+                               ScrapeCancelled)
+from src.keyword_matcher import get_matcher
+from src.records import Corpus
+from src.storage import STORAGE_DIR, partition_lock, read_partition_records, write_partition
+
+# Shared scrape cache, one Parquet partition per (subreddit, month)
+CORPUS_DIR = STORAGE_DIR
+
+
+def save_subreddit_corpus(items, subreddit, year, month=None, corpus_dir=CORPUS_DIR):
+    """Save the fetch_new() records of one subreddit and month."""
+    write_partition(items, subreddit, year, month, root=corpus_dir)
+
+
+def load_subreddit_corpus(subreddit, year, month=None, corpus_dir=CORPUS_DIR):
+    """Load the stored Post records of one subreddit and month, or None if it was never scraped."""
+    return read_partition_records(subreddit, year, month, root=corpus_dir)
+
+
+def build_corpus(limit=1000, year=2025, month=None, subreddits=None, keywords=None, corpus_dir=CORPUS_DIR,
+                 refresh=False, should_stop=None):
+    """
+    Scrape each subreddit once for the month and keep every post in range.
+
+    Comments are only fetched for posts matching `keywords`, which should be the
+    union of the keyword lists of all agencies that will share the corpus.
+
+    Args:
+        limit (int): Maximum number of posts to check per subreddit
+        year (int): Year to search for posts
+        month (int, optional): Specific month to search (1-12). If None, searches entire year.
+        subreddits (list): List of subreddit names to search
+        keywords (list): Union of the keywords of every agency in the run
+        corpus_dir (str): Directory holding the per-subreddit corpus files
+        refresh (bool): Fetch posts newer than the subreddit's high-water mark and
+            merge them into an already stored corpus. Every scrape stored here,
+            the first one included, advances the mark.
+        should_stop (callable, optional): Cancellation check passed to fetch_new(),
+            ScrapeCancelled is raised once it returns True
+
+    Returns:
+        Corpus: Post records by subreddit, with the post -> comments index built once
+        and shared by every agency of the run
+    """
+    corpus = {}
+    for sub in subreddits:
+        # Jobs building the same month wait here and then load what the first one stored
+        with partition_lock(sub, year, month, corpus_dir):
+            items = load_subreddit_corpus(sub, year, month, corpus_dir)
+            # Newest post of the scrape, only saved as the high-water mark once the partition is stored
+            new_marks = {}
+            if items is not None and not refresh:
+                print(f"Loaded {len(items)} posts for r/{sub} from corpus")
+            elif items is not None:
+                # Only page back to the newest post stored by the previous scrape
+                new_items = fetch_new(limit=limit, year=year, month=month, subreddits=[sub],
+                                      keywords=keywords, keep_unmatched=True, incremental=True, new_marks=new_marks,
+                                      should_stop=should_stop)
+                known_ids = {item['id'] for item in items}
+                new_items = [item for item in new_items if item['id'] not in known_ids]
+                print(f"Added {len(new_items)} new posts to the r/{sub} corpus")
+                if new_items:
+                    items = new_items + items
+                    save_subreddit_corpus(items, sub, year, month, corpus_dir)
+            else:
+                items = fetch_new(limit=limit, year=year, month=month, subreddits=[sub],
+                                  keywords=keywords, keep_unmatched=True, new_marks=new_marks,
+                                  should_stop=should_stop)
+                # An empty result usually means the subreddit could not be reached,
+                # so don't cache it and retry on the next run
+                if items:
+                    save_subreddit_corpus(items, sub, year, month, corpus_dir)
+            if sub in new_marks:
+                save_high_water_mark(sub, new_marks[sub], year, month)
+        corpus[sub] = items
+    return Corpus.from_items(corpus)
+
+
+def get_agency_data(corpus, keywords, year, month=None, corpus_dir=CORPUS_DIR, should_stop=None):
+    """
+    Apply one agency's keywords to a shared corpus.
+
+    Posts that match but whose comments were not fetched when the corpus was
+    built are topped up from Reddit and written back to the corpus. Matched
+    posts and their comments are light copies of the corpus records, sharing
+    their text, with this agency's keyword_hits and comment is_related flags.
+
+    Args:
+        corpus (Corpus): Corpus returned by build_corpus()
+        keywords (list): Keywords of the agency, or a KeywordMatcher
+        year (int): Year of the corpus
+        month (int, optional): Month of the corpus
+        corpus_dir (str): Directory holding the per-subreddit corpus files
+        should_stop (callable, optional): Checked before every comment top-up,
+            ScrapeCancelled is raised once it returns True
+
+    Returns:
+        dict: 'posts', the matched Post records with this agency's keyword_hits, and
+        'comments', a Corpus of those posts indexing their comments (flagged with
+        this agency's is_related and keyword_hits) by post id
+    """
+    if not isinstance(corpus, Corpus):
+        corpus = Corpus.from_items(corpus)
+    reddit = None
+    matched = []
+    keywords = get_matcher(keywords)
+
+    for sub, posts in corpus.items():
+        updated = False
+        for post in posts:
+            text = (post.title or "") + " " + (post.body or "")
+            hits = keyword_hits(text, keywords)
+            if not hits:
+                continue
+
+            if post.comments is None:
+                if should_stop is not None and should_stop():
+                    raise ScrapeCancelled("Comment top-up cancelled")
+                if reddit is None:
+                    reddit = connects()
+                print(f"  Fetching comments for post {post.id}...")
+                corpus.set_comments(post, fetch_comments(reddit.submission(id=post.id), keywords))
+                updated = True
+
+            # The corpus records are shared by every agency, the hits and comment flags are this agency's
+            comments = []
+            for comment in post.comments:
+                comment_hits = keyword_hits(comment.body or "", keywords)
+                comments.append(comment.copy(is_related=comment_hits > 0, keyword_hits=comment_hits))
+            matched.append(post.copy(keyword_hits=hits, comments=comments))
+
+        if updated:
+            with partition_lock(sub, year, month, corpus_dir):
+                save_subreddit_corpus(posts, sub, year, month, corpus_dir)
+
+    comments = corpus.select(matched)
+    print(f"Matched {len(matched)} posts with {len(comments)} comments")
+    return {"posts": matched, "comments": comments}
@@ -0,0 +1,146 @@
+import re
+import zlib
+import numpy as np
+
+# Signature length and LSH banding; 16 bands of 4 rows catch pairs from about 0.5 Jaccard similarity
+NUM_PERM = 64
+LSH_BANDS = 16
+# Words per shingle
+SHINGLE_SIZE = 3
+# Estimated Jaccard similarity at which two texts count as copies
+DEDUP_THRESHOLD = 0.8
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """Hashed word k-grams of a text; texts shorter than k words become a single shingle."""
+    words = _WORD_RE.findall((text or "").lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+    return np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash_signatures(texts, num_perm=NUM_PERM, seed=1):
+    """
+    MinHash signatures of texts, one row per text.
+
+    Rows of empty texts are left at the maximum value and never match anything.
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(texts), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = shingles(text)
+        if len(hashes):
+            # (a * x + b) mod p stays below 2**64 since a, b and x are below 2**32
+            signatures[row] = ((np.outer(a, hashes) + b[:, None]) % _PRIME).min(axis=1)
+    return signatures
+
+
+def find_clusters(texts, threshold=DEDUP_THRESHOLD, num_perm=NUM_PERM, bands=LSH_BANDS):
+    """
+    Group near-duplicate texts with MinHash LSH.
+
+    Texts sharing a band bucket are compared on their full signatures and joined
+    when the estimated Jaccard similarity reaches the threshold.
+
+    Returns:
+        list: Clusters as lists of text indices, in order of first appearance
+    """
+    signatures = minhash_signatures(texts, num_perm)
+    rows = num_perm // bands
+    empty = signatures[:, 0] == np.iinfo(np.uint64).max
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets = {}
+        for i in range(len(texts)):
+            if not empty[i]:
+                buckets.setdefault(signatures[i, band * rows:(band + 1) * rows].tobytes(), []).append(i)
+        for members in buckets.values():
+            for pos, i in enumerate(members):
+                for j in members[pos + 1:]:
+                    root_i, root_j = find(i), find(j)
+                    if root_i != root_j and np.mean(signatures[i] == signatures[j]) >= threshold:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+
+def get_post_text(post):
+    return f"{post.get('title', '') or ''}\n{post.get('body', '') or ''}"
+
+
+def collapse_duplicate_posts(posts, comments_data, threshold=DEDUP_THRESHOLD):
+    """
+    Keep one representative per cluster of near-duplicate posts (e.g. crossposts).
+
+    The representative is the copy with the most comments. It is annotated with
+    duplicate_ids, duplicate_count and duplicate_subreddits, and the comments of
+    every copy are moved under it.
+
+    Returns:
+        Tuple of (representative posts, comments with post_id remapped to their representative)
+    """
+    clusters = find_clusters([get_post_text(post) for post in posts], threshold)
+    representatives = []
+    remap = {}
+    for cluster in clusters:
+        members = [posts[i] for i in cluster]
+        if len(members) == 1:
+            representatives.append(members[0])
+            continue
+        rep = max(members, key=lambda post: (int(post.get('num_comments') or 0), -float(post.get('created_utc') or 0)))
+        duplicates = [post for post in members if post is not rep]
+        representatives.append({
+            **rep,
+            "duplicate_ids": [str(post.get('id', '')) for post in duplicates],
+            "duplicate_count": len(duplicates),
+            "duplicate_subreddits": sorted({post.get('subreddit') for post in members if post.get('subreddit')}),
+        })
+        for post in duplicates:
+            remap[str(post.get('id', ''))] = str(rep.get('id', ''))
+
+    if remap:
+        comments_data = [{**comment, "post_id": remap[str(comment.get('post_id', ''))]}
+                         if str(comment.get('post_id', '')) in remap else comment
+                         for comment in comments_data]
+    print(f"Dedup kept {len(representatives)}/{len(posts)} posts ({len(remap)} near-duplicates collapsed)")
+    return representatives, comments_data
+
+
+def collapse_duplicate_comments(comments, threshold=DEDUP_THRESHOLD):
+    """
+    Keep one representative per cluster of near-duplicate comments (repeated bot
+    messages, copy-pasted replies), the highest scoring one, with duplicate_ids and
+    duplicate_count set on it.
+    """
+    if len(comments) < 2:
+        return comments
+    representatives = []
+    for cluster in find_clusters([comment.get('body', '') or '' for comment in comments], threshold):
+        members = [comments[i] for i in cluster]
+        if len(members) == 1:
+            representatives.append(members[0])
+            continue
+        rep = max(members, key=lambda comment: int(comment.get('score') or 0))
+        duplicates = [comment for comment in members if comment is not rep]
+        representatives.append({
+            **rep,
+            "duplicate_ids": [str(comment.get('comment_id', '')) for comment in duplicates],
+            "duplicate_count": len(duplicates),
+        })
+    return representatives
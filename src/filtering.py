@@ -1,35 +1,224 @@
-from src.openai_wrapper import get_completion
-from src.prompts import filter_post_prompt, filter_comment_prompt, filter_system_prompt, insight_post_prompt, insight_system_prompt
-from src.utils import parse_result
+from src.openai_wrapper import get_completion, get_completion_with_finish_reason, invalidate_completion
+from src.prompts import (filter_post_prompt, filter_posts_batch_prompt, filter_comment_prompt, filter_system_prompt,
+                         insight_post_prompt, insight_system_prompt,
+                         insight_map_prompt, insight_merge_prompt, insight_reduce_prompt)
+from src.utils import parse_result, map_concurrently, estimate_tokens, chunk_by_token_budget
+from src.prefilter import prefilter_posts
+from src.dedup import collapse_duplicate_posts, collapse_duplicate_comments
+from src.records import Corpus
+from src import metrics
 import json
 
+# Rounds of re-queuing items the batched classifiers left out of their answer
+MAX_BATCH_ROUNDS = 3
+# Prompt tokens per comment-filtering request, so megathreads are split instead of truncated
+COMMENT_CHUNK_TOKEN_BUDGET = 6000
+# Times a comment chunk whose answer was cut off at the token limit is halved and retried
+MAX_COMMENT_SPLIT_DEPTH = 2
+# Tokens of feedback data per report prompt, larger sets are summarized map-reduce style
+REPORT_TOKEN_BUDGET = 20000
 
-def filter_posts(posts, topic):
-    filtered_posts = []
 
-    for post in posts:
-        # Extract only the text content for the LLM
-        post_text = f"Title: {post.get('title', '')}\nBody: {post.get('body', '')}"
+def is_relevant_post(post, topic, checkpoint=None, model="gpt-4o-mini", temperature=0.7):
+    """
+    Ask the LLM whether a single post is relevant to the topic.
+
+    Returns:
+        bool, or None when the answer could not be parsed; no verdict is
+        checkpointed then, so a rerun asks again
+    """
+    # Extract only the text content for the LLM
+    post_text = f"Title: {post.get('title', '')}\nBody: {post.get('body', '')}"
 
-        prompt = filter_post_prompt.format(topic=topic, post=post_text)
-        result = get_completion(filter_system_prompt, prompt)
+    prompt = filter_post_prompt.format(topic=topic, post=post_text)
+    result = get_completion(filter_system_prompt, prompt, model=model, temperature=temperature)
+    try:
         parsed_result = parse_result(result)
-        if parsed_result is not None:
-            is_relevant = parsed_result.get('is_relevant', False)
-            if is_relevant:
-                filtered_posts.append(post)
+    except json.JSONDecodeError:
+        parsed_result = None
+    if not isinstance(parsed_result, dict):
+        # Don't replay the bad answer from the cache on the next run
+        invalidate_completion(filter_system_prompt, prompt, model=model, temperature=temperature)
+        return None
+    is_relevant = bool(parsed_result.get('is_relevant', False))
+    if checkpoint is not None:
+        checkpoint.record_post_verdicts({post.get('id', ''): is_relevant})
+    return is_relevant
+
+
+def classify_posts_batch(posts, topic, checkpoint=None):
+    """
+    Classify several posts with a single LLM call.
 
-    return filtered_posts
+    Returns:
+        Dict of post id to relevance, for the posts present in the response
+    """
+    posts_for_prompt = [{"id": str(post.get('id', '')),
+                         "title": post.get('title', ''),
+                         "body": post.get('body', '')} for post in posts]
+    prompt = filter_posts_batch_prompt.format(
+        topic=topic,
+        posts=json.dumps(posts_for_prompt, separators=(',', ':'))
+    )
+    result = get_completion(filter_system_prompt, prompt)
+    try:
+        parsed_result = parse_result(result)
+    except json.JSONDecodeError:
+        parsed_result = None
+    if not isinstance(parsed_result, list):
+        invalidate_completion(filter_system_prompt, prompt)
+        return {}
+
+    requested_ids = {post["id"] for post in posts_for_prompt}
+    verdicts = {}
+    for item in parsed_result:
+        if isinstance(item, dict) and str(item.get('id', '')) in requested_ids:
+            verdicts[str(item['id'])] = bool(item.get('is_relevant', False))
+    if checkpoint is not None:
+        checkpoint.record_post_verdicts(verdicts)
+    return verdicts
+
+
+def classify_posts_batched(posts, topic, batch_token_budget, max_workers=None, checkpoint=None):
+    """
+    Classify posts by packing them into token-budgeted batches, one LLM call per batch.
 
+    Posts missing from a batch's answer are re-queued into new batches, and any
+    still missing after MAX_BATCH_ROUNDS are classified one by one.
 
-def filter_comments(post, comments, topic):
+    Returns:
+        Dict of post id to relevance
+    """
+    if not posts:
+        return {}
+
+    def count_tokens(post):
+        return estimate_tokens(post.get('title', '') or '') + estimate_tokens(post.get('body', '') or '')
+
+    verdicts = {}
+    pending = list(posts)
+    request_count = 0
+    for _ in range(MAX_BATCH_ROUNDS):
+        if not pending:
+            break
+        batches = chunk_by_token_budget(pending, batch_token_budget, count_tokens)
+        request_count += len(batches)
+        for batch_verdicts in map_concurrently(lambda batch: classify_posts_batch(batch, topic, checkpoint),
+                                               batches, max_workers):
+            verdicts.update(batch_verdicts)
+        pending = [post for post in pending if str(post.get('id', '')) not in verdicts]
+        if pending:
+            print(f"{len(pending)} posts missing from batched verdicts, re-queuing")
+
+    if pending:
+        request_count += len(pending)
+        single_verdicts = map_concurrently(lambda post: is_relevant_post(post, topic, checkpoint), pending, max_workers)
+        for post, is_relevant in zip(pending, single_verdicts):
+            verdicts[str(post.get('id', ''))] = is_relevant
+
+    print(f"Classified {len(posts)} posts with {request_count} requests")
+    return verdicts
+
+
+def filter_posts(posts, topic, max_workers=None, batch_token_budget=None, checkpoint=None, cascade=None):
+    """
+    Filter posts for relevance to the topic using OpenAI API.
+
+    Args:
+        posts: List of post data
+        topic: The topic to filter against
+        max_workers: Number of concurrent LLM calls (defaults to OPENAI_MAX_WORKERS)
+        batch_token_budget: If set, classify several posts per call, packing up to
+            this many tokens of post text into each request
+        checkpoint: Optional Checkpoint; posts with a recorded verdict are skipped
+            and new verdicts are recorded as they come in
+        cascade: Optional cascade.Cascade classifying posts with cheap tiers first and
+            escalating unsure ones; takes precedence over batch_token_budget
+
+    Returns:
+        List of relevant posts, in input order
+    """
+    verdicts = checkpoint.get_post_verdicts() if checkpoint is not None else {}
+    pending = [post for post in posts if str(post.get('id', '')) not in verdicts]
+    if len(pending) < len(posts):
+        print(f"Resuming: {len(posts) - len(pending)} post verdicts loaded from checkpoint")
+
+    if cascade is not None:
+        pending_verdicts = map_concurrently(lambda post: cascade.classify(post, topic), pending, max_workers)
+        # Posts without a verdict (unparseable answers) are left out and asked again on a rerun
+        new_verdicts = {str(post.get('id', '')): is_relevant for post, is_relevant in zip(pending, pending_verdicts)
+                        if is_relevant is not None}
+        if checkpoint is not None:
+            checkpoint.record_post_verdicts(new_verdicts)
+        verdicts.update(new_verdicts)
+    elif batch_token_budget:
+        verdicts.update(classify_posts_batched(pending, topic, batch_token_budget, max_workers, checkpoint))
+    else:
+        pending_verdicts = map_concurrently(lambda post: is_relevant_post(post, topic, checkpoint), pending, max_workers)
+        for post, is_relevant in zip(pending, pending_verdicts):
+            verdicts[str(post.get('id', ''))] = is_relevant
+
+    return [post for post in posts if verdicts.get(str(post.get('id', '')), False)]
+
+
+def classify_comments_chunk(post_text, chunk, topic, depth=0):
+    """
+    Classify one chunk of comments with a single LLM call.
+
+    If the answer was cut off at the token limit (finish_reason "length"), the
+    chunk is split in half and each half is classified again, at most
+    MAX_COMMENT_SPLIT_DEPTH levels deep, so a chunk costs at most
+    2 ** (MAX_COMMENT_SPLIT_DEPTH + 1) - 1 calls here. Other bad answers
+    (refusals, malformed JSON) are not split: the chunk gets no verdicts from
+    this call. filter_comments() re-queues comments left without a verdict, in
+    new chunks, for up to MAX_BATCH_ROUNDS rounds.
+
+    Returns:
+        Dict of comment_id to relevance, for the comments present in the response(s)
+    """
+    prompt = filter_comment_prompt.format(
+        topic=topic,
+        post=post_text,
+        comments=json.dumps(chunk, separators=(',', ':'))
+    )
+    result, finish_reason = get_completion_with_finish_reason(filter_system_prompt, prompt)
+    try:
+        parsed_result = parse_result(result)
+    except json.JSONDecodeError:
+        parsed_result = None
+
+    if not isinstance(parsed_result, list):
+        invalidate_completion(filter_system_prompt, prompt)
+        if finish_reason != "length" or len(chunk) == 1 or depth >= MAX_COMMENT_SPLIT_DEPTH:
+            return {}
+        middle = len(chunk) // 2
+        verdicts = classify_comments_chunk(post_text, chunk[:middle], topic, depth + 1)
+        verdicts.update(classify_comments_chunk(post_text, chunk[middle:], topic, depth + 1))
+        return verdicts
+
+    verdicts = {}
+    for item in parsed_result:
+        if isinstance(item, dict):
+            verdicts[str(item.get('comment_id', ''))] = bool(item.get('is_relevant', False))
+    return verdicts
+
+
+def filter_comments(post, comments, topic, chunk_token_budget=COMMENT_CHUNK_TOKEN_BUDGET, max_workers=None,
+                    checkpoint=None):
     """
     Filter comments for a specific post using OpenAI API.
 
+    Comments are split into chunks of at most `chunk_token_budget` tokens
+    (post text included), classified independently and merged back by comment_id.
+
     Args:
         post: The post data
         comments: List of comment data
         topic: The topic to filter against
+        chunk_token_budget: Maximum prompt tokens of post text plus comments per request
+        max_workers: Number of concurrent LLM calls (defaults to OPENAI_MAX_WORKERS)
+        checkpoint: Optional Checkpoint; comments with a recorded verdict are skipped
+            and new verdicts are recorded as they come in
 
     Returns:
         List of relevant comments
@@ -44,105 +233,213 @@ def filter_comments(post, comments, topic):
     comments_for_prompt = []
     for comment in comments:
         comments_for_prompt.append({
-            "comment_id": comment.get('comment_id', ''),
+            "comment_id": str(comment.get('comment_id', '')),
             "body": comment.get('body', '')
         })
 
-    prompt = filter_comment_prompt.format(
-        topic=topic,
-        post=post_text,
-        comments=json.dumps(comments_for_prompt, indent=2)
-    )
-
-    result = get_completion(filter_system_prompt, prompt)
-    parsed_result = parse_result(result)
-
-    if parsed_result is not None:
-        # Create a mapping of comment_id to relevance
-        relevance_map = {}
-        for item in parsed_result:
-            relevance_map[item.get('comment_id', '')] = item.get('is_relevant', False)
-
-        # Filter comments based on relevance
-        filtered_comments = []
-        for comment in comments:
-            comment_id = comment.get('comment_id', '')
-            if relevance_map.get(comment_id, False):
-                filtered_comments.append(comment)
-
-        return filtered_comments
+    # The post text is repeated in every chunk, so leave room for it
+    comments_budget = max(chunk_token_budget - estimate_tokens(post_text), chunk_token_budget // 4)
+
+    def count_tokens(comment):
+        return estimate_tokens(comment['body'] or '') + 10
+
+    def classify_chunk(chunk):
+        chunk_verdicts = classify_comments_chunk(post_text, chunk, topic)
+        if checkpoint is not None:
+            checkpoint.record_comment_verdicts(post.get('id', ''), chunk_verdicts)
+        return chunk_verdicts
+
+    relevance_map = checkpoint.get_comment_verdicts(post.get('id', '')) if checkpoint is not None else {}
+    pending = [comment for comment in comments_for_prompt if comment['comment_id'] not in relevance_map]
+    for _ in range(MAX_BATCH_ROUNDS):
+        if not pending:
+            break
+        chunks = chunk_by_token_budget(pending, comments_budget, count_tokens)
+        for chunk_verdicts in map_concurrently(classify_chunk, chunks, max_workers):
+            relevance_map.update(chunk_verdicts)
+        # Re-queue comments the model left out of its answer
+        pending = [comment for comment in pending if comment['comment_id'] not in relevance_map]
+
+    if pending:
+        print(f"  {len(pending)} comments of post {post.get('id', '')} got no verdict")
+
+    # Filter comments based on relevance
+    filtered_comments = []
+    for comment in comments:
+        comment_id = str(comment.get('comment_id', ''))
+        if relevance_map.get(comment_id, False):
+            filtered_comments.append(comment)
 
-    return []
+    return filtered_comments
 
 
-def get_filtered_posts_and_comments(posts, comments_data, topic):
+def get_filtered_posts_and_comments(posts, comments_data, topic, max_workers=None, batch_token_budget=None,
+                                    prefilter_threshold=None, prefilter_top_k=None, prefilter_terms=None,
+                                    dedupe_threshold=None, checkpoint=None, cascade=None):
     """
     Filter posts and their associated comments, returning tuples of (post, relevant_comments).
 
     Args:
         posts: List of post data
-        comments_data: List of all comment data
+        comments_data: List of all comment data, or a records.Corpus whose prebuilt
+            post -> comments index is used as is
         topic: The topic to filter against
+        max_workers: Number of concurrent LLM calls (defaults to OPENAI_MAX_WORKERS)
+        batch_token_budget: If set, classify posts in batches of up to this many tokens
+        prefilter_threshold: If set, skip posts whose local similarity to the topic is below it
+        prefilter_top_k: If set, only send the this many most similar posts to the LLM
+        prefilter_terms: Extra terms (e.g. the agency keywords) for the prefilter query
+        dedupe_threshold: If set, collapse posts (and each post's comments) whose estimated
+            Jaccard similarity reaches it, so only one copy of a crossposted story is sent
+            to the LLM. Representatives carry duplicate_ids, duplicate_count and, for
+            posts, duplicate_subreddits; their verdict applies to the whole cluster.
+        checkpoint: Optional Checkpoint used to resume and record post and comment verdicts
+        cascade: Optional cascade.Cascade used to classify posts, see filter_posts()
 
     Returns:
         List of tuples: (post, list_of_relevant_comments)
     """
+    indexed = isinstance(comments_data, Corpus)
+    if dedupe_threshold is not None:
+        input_count = len(posts)
+        # An index is looked up through each representative's duplicate_ids instead of being remapped
+        posts, remapped = collapse_duplicate_posts(posts, [] if indexed else comments_data, dedupe_threshold)
+        if not indexed:
+            comments_data = remapped
+        metrics.inc("dedup_posts_collapsed_total", input_count - len(posts))
+
+    # Drop clear misses locally before paying for LLM calls
+    if prefilter_threshold is not None or prefilter_top_k is not None:
+        posts, stats = prefilter_posts(posts, topic, threshold=prefilter_threshold,
+                                       top_k=prefilter_top_k, query_terms=prefilter_terms)
+        metrics.inc("prefilter_posts_total", stats["kept"], result="kept")
+        metrics.inc("prefilter_posts_total", stats["skipped"], result="dropped")
+
     # First filter posts
-    filtered_posts = filter_posts(posts, topic)
+    filtered_posts = filter_posts(posts, topic, max_workers=max_workers, batch_token_budget=batch_token_budget,
+                                  checkpoint=checkpoint, cascade=cascade)
     print(f"Filtered {len(posts)} posts to {len(filtered_posts)} posts")
-
-    # Create a mapping of post_id to comments
-    comments_by_post = {}
-    for comment in comments_data:
-        post_id = comment.get('post_id', '')
-        if post_id not in comments_by_post:
-            comments_by_post[post_id] = []
-        comments_by_post[post_id].append(comment)
+    if checkpoint is not None and dedupe_threshold is not None:
+        # Copies share their representative's verdict
+        relevant_ids = {str(post.get('id', '')) for post in filtered_posts}
+        checkpoint.record_post_verdicts({duplicate_id: str(post.get('id', '')) in relevant_ids
+                                         for post in posts for duplicate_id in post.get('duplicate_ids', [])})
+
+    if indexed:
+        def comments_for(post):
+            post_comments = comments_data.comments_for(post.get('id', ''))
+            for duplicate_id in post.get('duplicate_ids', []):
+                post_comments = post_comments + comments_data.comments_for(duplicate_id)
+            return post_comments
+    else:
+        # Create a mapping of post_id to comments
+        comments_by_post = {}
+        for comment in comments_data:
+            post_id = comment.get('post_id', '')
+            if post_id not in comments_by_post:
+                comments_by_post[post_id] = []
+            comments_by_post[post_id].append(comment)
+
+        def comments_for(post):
+            return comments_by_post.get(post.get('id', ''), [])
 
     # Filter comments for each filtered post
-    result = []
-    for post in filtered_posts:
-        post_id = post.get('id', '')
-        post_comments = comments_by_post.get(post_id, [])
+    def filter_post_comments(post):
+        post_comments = comments_for(post)
+        if dedupe_threshold is not None:
+            comment_count = len(post_comments)
+            post_comments = collapse_duplicate_comments(post_comments, dedupe_threshold)
+            metrics.inc("dedup_comments_collapsed_total", comment_count - len(post_comments))
+        # Already on a pool thread, so the chunks of one post run in this thread instead of a nested pool
+        return filter_comments(post, post_comments, topic, max_workers=1, checkpoint=checkpoint)
+
+    filtered_comments = map_concurrently(filter_post_comments, filtered_posts, max_workers)
+
+    return list(zip(filtered_posts, filtered_comments))
 
-        # Filter comments for this post
-        filtered_comments = filter_comments(post, post_comments, topic)
 
-        # Add the tuple to result
-        result.append((post, filtered_comments))
+def format_post_for_report(post, comments):
+    """Format a post and its relevant comments as text for the report prompts."""
+    post_text = f"**POST:**\nTitle: {post.get('title', '')}\nBody: {post.get('body', '')}\n"
+    if post.get('duplicate_count'):
+        subreddits = ", ".join(f"r/{sub}" for sub in post.get('duplicate_subreddits', []))
+        post_text += f"(Posted {post['duplicate_count'] + 1} times across {subreddits})\n"
 
-    return result
+    if comments:
+        comments_text = "\n**COMMENTS:**\n"
+        for comment in comments:
+            repeats = f" (x{comment['duplicate_count'] + 1})" if comment.get('duplicate_count') else ""
+            comments_text += f"- {comment.get('body', '')}{repeats}\n"
+        post_text += comments_text
+
+    post_text += "\n" + "="*50 + "\n"
+    return post_text
 
 
-def generate_report(filtered_posts_and_comments, agency, topic):
+def summarize_report_batch(batch, agency, topic):
+    """Map stage: extract partial findings from one batch of formatted posts."""
+    prompt = insight_map_prompt.format(
+        agency=agency,
+        topic=topic,
+        post_count=len(batch),
+        posts_and_comments="\n".join(batch)
+    )
+    return get_completion(insight_system_prompt, prompt)
+
+
+def merge_partial_findings(partials, agency, topic, token_budget, max_workers=None):
+    """Merge partial findings in token-budgeted groups until they fit in one prompt."""
+    while len(partials) > 1 and sum(estimate_tokens(partial) for partial in partials) > token_budget:
+        groups = chunk_by_token_budget(partials, token_budget, estimate_tokens)
+        if len(groups) == len(partials):
+            # Every partial fills a group on its own, merging pairs is the best we can do
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        print(f"Merging {len(partials)} partial findings into {len(groups)}")
+        partials = map_concurrently(
+            lambda group: get_completion(insight_system_prompt, insight_merge_prompt.format(
+                agency=agency, topic=topic, partial_findings="\n\n---\n\n".join(group))),
+            groups, max_workers
+        )
+    return partials
+
+
+def generate_report(filtered_posts_and_comments, agency, topic,
+                    map_token_budget=REPORT_TOKEN_BUDGET, max_workers=None):
     """
     Generate a markdown report from filtered posts and comments.
 
+    When the data does not fit in `map_token_budget` tokens, the report is built
+    map-reduce style: batches of posts are summarized into partial findings in
+    parallel, which are then merged into the final report.
+
     Args:
         filtered_posts_and_comments: List of tuples (post, list_of_relevant_comments)
         agency: The agency name
         topic: The topic description
+        map_token_budget: Maximum tokens of feedback data per prompt (None sends everything at once)
+        max_workers: Number of concurrent LLM calls (defaults to OPENAI_MAX_WORKERS)
 
     Returns:
         str: Markdown report
     """
     # Format posts and comments as text for the LLM
-    posts_and_comments_text = []
+    posts_and_comments_text = [format_post_for_report(post, comments)
+                               for post, comments in filtered_posts_and_comments]
 
-    for post, comments in filtered_posts_and_comments:
-        # Format post
-        post_text = f"**POST:**\nTitle: {post.get('title', '')}\nBody: {post.get('body', '')}\n"
+    total_tokens = sum(estimate_tokens(text) for text in posts_and_comments_text)
+    if map_token_budget is None or total_tokens <= map_token_budget:
+        return write_report(posts_and_comments_text, agency, topic)
 
-        # Format comments
-        if comments:
-            comments_text = "\n**COMMENTS:**\n"
-            for comment in comments:
-                comments_text += f"- {comment.get('body', '')}\n"
-            post_text += comments_text
+    # Map: summarize batches of posts into partial findings
+    batches = chunk_by_token_budget(posts_and_comments_text, map_token_budget, estimate_tokens)
+    print(f"Report data is ~{total_tokens} tokens, summarizing {len(batches)} batches")
+    partials = map_concurrently(lambda batch: summarize_report_batch(batch, agency, topic), batches, max_workers)
 
-        post_text += "\n" + "="*50 + "\n"
-        posts_and_comments_text.append(post_text)
+    return reduce_partial_findings(partials, agency, topic, map_token_budget, max_workers)
 
+
+def write_report(posts_and_comments_text, agency, topic):
+    """Write the report from formatted posts that fit in a single prompt."""
     # Combine all posts and comments
     combined_text = "\n".join(posts_and_comments_text)
 
@@ -152,8 +449,15 @@ def generate_report(filtered_posts_and_comments, agency, topic):
         topic=topic,
         posts_and_comments=combined_text
     )
-
-    report = get_completion(insight_system_prompt, prompt)
-    return report
+    return get_completion(insight_system_prompt, prompt)
 
 
+def reduce_partial_findings(partials, agency, topic, token_budget, max_workers=None):
+    """Reduce stage: merge the partial findings of the map stage into the final report."""
+    partials = merge_partial_findings(partials, agency, topic, token_budget, max_workers)
+    prompt = insight_reduce_prompt.format(
+        agency=agency,
+        topic=topic,
+        partial_findings="\n\n---\n\n".join(partials)
+    )
+    return get_completion(insight_system_prompt, prompt)
@@ -0,0 +1,162 @@
+import os
+import time
+import socket
+import argparse
+import threading
+import traceback
+from src.jobs import JobStore
+from src.checkpoint import agency_slug
+from src import metrics
+
+# configure via env vars
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", 2))
+# Seconds an idle worker thread waits before polling the queue again
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+HEARTBEAT_INTERVAL = 30
+# Running jobs re-read their cancel flag at most this often
+CANCEL_CHECK_INTERVAL = 2
+
+
+def cancel_checker(store, job_id):
+    """Return a should_stop() callable that polls the job's cancel flag without hitting the store on every call."""
+    state = {"checked_at": 0.0, "cancelled": False}
+
+    def should_stop():
+        now = time.monotonic()
+        if not state["cancelled"] and now - state["checked_at"] >= CANCEL_CHECK_INTERVAL:
+            state["checked_at"] = now
+            state["cancelled"] = store.is_cancel_requested(job_id)
+        return state["cancelled"]
+
+    return should_stop
+
+
+def run_scrape_job(params, should_stop, progress):
+    from src.scrape_reddit import run_scraper
+    return run_scraper(should_stop=should_stop, progress=progress, **params)
+
+
+def run_report_job(params, should_stop, progress):
+    # run.py loads the BigQuery credentials on import, so only report workers pay for it
+    from run import run
+    result = run(params["agency"], params["month"], params["year"], progress=progress,
+                 streaming=params.get("streaming", False), should_stop=should_stop)
+    return {
+        "agency": params["agency"],
+        "month": params["month"],
+        "year": params["year"],
+        "report": result["report"],
+        "report_filename": result["report_filename"],
+        "filtered_posts": len(result["filtered_data"]),
+    }
+
+
+def report_dedupe_key(agency, month, year):
+    """Identical report requests share one in-flight job."""
+    return f"report:{agency_slug(agency)}:{month}-{year}"
+
+
+JOB_HANDLERS = {
+    "scrape": run_scrape_job,
+    "report": run_report_job,
+}
+
+
+def run_job(store, job):
+    from src.scrape_reddit import ScrapeCancelled
+
+    job_id = job["id"]
+    print(f"Starting {job['kind']} job {job_id}")
+
+    def progress(event, data):
+        store.add_event(job_id, event, data)
+
+    progress("job_started", {"kind": job["kind"]})
+    start = time.perf_counter()
+    try:
+        result = JOB_HANDLERS[job["kind"]](job["params"], cancel_checker(store, job_id), progress)
+    except ScrapeCancelled:
+        print(f"Job {job_id} cancelled")
+        store.mark_cancelled(job_id)
+        status = "cancelled"
+    except Exception as e:
+        traceback.print_exc()
+        store.fail(job_id, f"{type(e).__name__}: {e}")
+        status = "failed"
+    else:
+        print(f"Job {job_id} completed")
+        store.complete(job_id, result)
+        status = "completed"
+    metrics.inc("jobs_total", kind=job["kind"], status=status)
+    metrics.observe("job_duration_seconds", time.perf_counter() - start, kind=job["kind"])
+
+
+class JobWorker:
+    """
+    Pulls jobs from the store and runs up to `concurrency` of them at a time.
+
+    Several workers (processes or hosts sharing the database file) can run
+    side by side, each job is claimed by exactly one of them.
+    """
+
+    def __init__(self, store=None, concurrency=JOB_WORKER_CONCURRENCY, poll_interval=JOB_POLL_INTERVAL):
+        self.store = store or JobStore()
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def slot_loop(self, slot):
+        worker = f"{self.name}/{slot}"
+        while not self.stopping.is_set():
+            job = self.store.claim(worker)
+            if job is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+            with self.lock:
+                self.running.add(job["id"])
+            try:
+                run_job(self.store, job)
+            finally:
+                with self.lock:
+                    self.running.discard(job["id"])
+                self.publish_metrics()
+
+    def publish_metrics(self):
+        try:
+            self.store.save_metrics(self.name, metrics.registry.snapshot())
+        except Exception as e:
+            print(f"Failed to publish worker metrics: {e}")
+
+    def heartbeat_loop(self):
+        while not self.stopping.wait(HEARTBEAT_INTERVAL):
+            with self.lock:
+                job_ids = list(self.running)
+            if job_ids:
+                self.store.heartbeat(job_ids)
+            self.publish_metrics()
+
+    def run(self):
+        print(f"Job worker {self.name} started with concurrency {self.concurrency}")
+        threads = [threading.Thread(target=self.heartbeat_loop, daemon=True)]
+        threads += [threading.Thread(target=self.slot_loop, args=(slot,), daemon=True)
+                    for slot in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads[1:]):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            # Running jobs are abandoned, their heartbeat stops and another worker picks them up
+            print("Stopping job worker...")
+            self.stopping.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued API jobs")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL)
+    args = parser.parse_args()
+    JobWorker(concurrency=args.concurrency, poll_interval=args.poll_interval).run()
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+
+# configure via env vars
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "jobs.sqlite3")
+# Maximum number of queued (not yet running) jobs before new ones are refused
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", 20))
+# A running job whose worker has not sent a heartbeat for this long is put back in the queue
+STALE_JOB_SECONDS = float(os.environ.get("STALE_JOB_SECONDS", 300))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    """
+    Durable job queue in SQLite, shared by the API processes and the workers.
+
+    Job status goes queued -> running -> completed / failed / cancelled. Every
+    call opens its own short-lived connection, so a store can be used from any
+    thread or process.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, max_queued=MAX_QUEUED_JOBS):
+        self.path = path
+        self.max_queued = max_queued
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL,
+                    dedupe_key TEXT
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "dedupe_key" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN dedupe_key TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            # At most one unfinished job per dedupe key
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe_key ON jobs (dedupe_key) "
+                         "WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running')")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS worker_metrics (
+                    worker TEXT PRIMARY KEY,
+                    snapshot TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(self, kind, params, dedupe_key=None):
+        """
+        Queue a job and return its id. Raises QueueFullError when too much work is queued.
+
+        Args:
+            kind (str): Job handler name, see src.job_worker.JOB_HANDLERS
+            params (dict): JSON-serializable handler arguments
+            dedupe_key (str, optional): If a queued or running job already has this key,
+                its id is returned instead of queueing a duplicate
+        """
+        job_id = f"{kind}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')",
+                    (dedupe_key,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return row["id"]
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                conn.execute("ROLLBACK")
+                raise QueueFullError(f"{queued} jobs already queued")
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at, dedupe_key) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), time.time(), dedupe_key)
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self, worker):
+        """Atomically take the oldest queued job for a worker, or return None."""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Recover jobs of workers that died mid-run
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (now - STALE_JOB_SECONDS,)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        job = self._to_dict(row)
+        job["status"] = "running"
+        return job
+
+    def heartbeat(self, job_ids):
+        with self.connect() as conn:
+            conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                             [(time.time(), job_id) for job_id in job_ids])
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "completed", result=result)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", error=error)
+
+    def mark_cancelled(self, job_id):
+        self._finish(job_id, "cancelled")
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are cancelled at once, running jobs are flagged
+        and stop at their next cancellation check.
+
+        Returns:
+            str: The job status after the request, or None if the job does not exist
+        """
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            status = row["status"]
+            if status == "queued":
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                             (time.time(), job_id))
+                status = "cancelled"
+            elif status == "running":
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+        return status
+
+    def is_cancel_requested(self, job_id):
+        with self.connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def get(self, job_id, include_result=True):
+        columns = "*" if include_result else "id, kind, params, status, NULL AS result, error, cancel_requested, " \
+                                             "worker, created_at, started_at, heartbeat_at, finished_at, dedupe_key"
+        with self.connect() as conn:
+            row = conn.execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, limit=100):
+        """Most recent jobs first, without their results."""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, params, status, NULL AS result, result IS NOT NULL AS has_result, error, "
+                "cancel_requested, worker, created_at, started_at, heartbeat_at, finished_at, dedupe_key "
+                "FROM jobs ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            job = self._to_dict(row)
+            job["has_result"] = bool(job["has_result"])
+            jobs.append(job)
+        return jobs
+
+    def count_by_status(self):
+        with self.connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def add_event(self, job_id, event, data=None):
+        """Append a progress event to a job's event log."""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, event, json.dumps(data or {}), time.time())
+            )
+
+    def get_events(self, job_id, after=0, limit=500):
+        """
+        Read a job's events in order.
+
+        Args:
+            job_id (str): Job id
+            after (int): Only return events with a larger id, to resume a stream
+            limit (int): Maximum number of events to return
+
+        Returns:
+            list: Dicts with id, event, data and created_at
+        """
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT id, event, data, created_at FROM job_events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (job_id, after, limit)
+            ).fetchall()
+        return [{**dict(row), "data": json.loads(row["data"])} for row in rows]
+
+    def save_metrics(self, worker, snapshot):
+        """Publish a worker process' metrics snapshot, see src.metrics."""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO worker_metrics (worker, snapshot, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (worker) DO UPDATE SET snapshot = excluded.snapshot, updated_at = excluded.updated_at",
+                (worker, json.dumps(snapshot), time.time())
+            )
+
+    def load_metrics(self):
+        """Return the latest metrics snapshot of every worker process that ever published one."""
+        with self.connect() as conn:
+            rows = conn.execute("SELECT snapshot FROM worker_metrics").fetchall()
+        return [json.loads(row["snapshot"]) for row in rows]
@@ -0,0 +1,107 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+
+def _trie_pattern(node):
+    """Build a regex from a character trie so shared prefixes are only tried once."""
+    alternatives = [re.escape(char) + _trie_pattern(child)
+                    for char, child in sorted(node.items()) if char != '']
+    if not alternatives:
+        return ''
+    pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    if '' in node:
+        # Greedy optional group, so the longest keyword at a position wins
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+class KeywordMatcher:
+    """
+    Match a fixed keyword set against text in a single regex pass.
+
+    Keywords are compiled once into a trie-shaped alternation. Matching is case
+    insensitive and, like the plain `k in text` check it replaces, finds
+    keywords anywhere in the text unless word_boundaries is set, in which case
+    a keyword must not be directly preceded or followed by a word character.
+    """
+
+    def __init__(self, keywords, word_boundaries=False):
+        self.keywords = sorted({k.lower() for k in keywords if k})
+        self.word_boundaries = word_boundaries
+
+        trie = {}
+        for keyword in self.keywords:
+            node = trie
+            for char in keyword:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        pattern = _trie_pattern(trie)
+        if word_boundaries:
+            pattern = r'(?<!\w)(' + pattern + r')(?!\w)'
+        else:
+            pattern = '(' + pattern + ')'
+
+        # No keywords: never match anything
+        if not self.keywords:
+            pattern = r'(?!)'
+        self._search = re.compile(pattern).search
+        # Zero-width lookahead so matches starting inside another match are found too
+        self._finditer = re.compile('(?=' + pattern + ')').finditer
+
+        # The scan only reports the longest keyword starting at each position,
+        # so remember the shorter keywords that are prefixes of it
+        self._prefixes = {}
+        for keyword in self.keywords:
+            self._prefixes[keyword] = [
+                other for other in self.keywords
+                if len(other) < len(keyword) and keyword.startswith(other)
+                and not (word_boundaries and re.match(r'\w', keyword[len(other)]))
+            ]
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def matches(self, text):
+        """Check if the text contains any keyword."""
+        if not text:
+            return False
+        return self._search(text.lower()) is not None
+
+    def counts(self, text):
+        """Return a Counter of keyword to number of occurrences in the text."""
+        hits = Counter()
+        if not text:
+            return hits
+        for match in self._finditer(text.lower()):
+            keyword = match.group(1)
+            hits[keyword] += 1
+            for prefix in self._prefixes[keyword]:
+                hits[prefix] += 1
+        return hits
+
+    def score(self, text):
+        """Return the total number of keyword occurrences in the text."""
+        return sum(self.counts(text).values())
+
+
+@lru_cache(maxsize=64)
+def _get_cached_matcher(keywords, word_boundaries):
+    return KeywordMatcher(keywords, word_boundaries=word_boundaries)
+
+
+def get_matcher(keywords, word_boundaries=False):
+    """
+    Return a compiled matcher for a keyword list, building it once per keyword set.
+
+    Args:
+        keywords: List of keywords, or an existing KeywordMatcher which is returned as is
+        word_boundaries (bool): Only match whole words
+
+    Returns:
+        KeywordMatcher
+    """
+    if isinstance(keywords, KeywordMatcher):
+        return keywords
+    return _get_cached_matcher(tuple(keywords), word_boundaries)
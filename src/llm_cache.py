@@ -0,0 +1,121 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+
+# configure via env vars
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+# Seconds before a cached completion expires, 0 keeps entries forever
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 30 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 100000))
+# "on" reads and writes the cache, "refresh" skips reads but stores new answers, "off" bypasses it
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "on")
+
+# Run eviction once every this many inserts rather than on every write
+EVICTION_INTERVAL = 100
+
+
+class CompletionCache:
+    """
+    SQLite cache of LLM completions keyed by a hash of the request.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted once the cache holds more than `max_entries` rows. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                last_access REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+
+    @staticmethod
+    def make_key(model, system_prompt, prompt, temperature, **extra):
+        payload = json.dumps([model, system_prompt, prompt, temperature, extra], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        """Return the cached response, or None on a miss or an expired entry."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, model, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self.inserts += 1
+            if self.inserts % EVICTION_INTERVAL == 0:
+                self._evict()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+
+    def _evict(self):
+        if self.ttl:
+            self.conn.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,))
+        self.conn.execute(
+            "DELETE FROM completions WHERE key IN "
+            "(SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM completions")
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, opening it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompletionCache()
+        return _cache
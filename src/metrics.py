@@ -0,0 +1,256 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = "crash_reports_"
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+# USD per 1M prompt / completion tokens, used for the cost estimate of run summaries
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms of one process.
+
+    Snapshots are plain JSON, so other processes (the job workers) can publish
+    theirs and have them merged into the API's Prometheus export.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels_key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets),
+                                                    "sum": 0.0, "count": 0}
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of a block in seconds, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self.counters.items()],
+                "histograms": [{"name": name, "labels": dict(labels), "buckets": h["buckets"],
+                                "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+                               for (name, labels), h in self.histograms.items()],
+            }
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+def merge_snapshots(snapshots):
+    """
+    Add up the counters and histograms of several snapshots.
+
+    Histograms are only added up when their bucket bounds are the same (e.g. a
+    worker running an older release may use other ones). When one series comes
+    with several sets of bounds, each set is kept as its own series with a
+    `buckets` label listing the bounds.
+    """
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for counter in snapshot["counters"]:
+            key = (counter["name"], _labels_key(counter["labels"]))
+            counters[key] = counters.get(key, 0) + counter["value"]
+        for h in snapshot["histograms"]:
+            key = (h["name"], _labels_key(h["labels"]), tuple(h["buckets"]))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = {"buckets": list(h["buckets"]), "counts": list(h["counts"]),
+                                   "sum": h["sum"], "count": h["count"]}
+                continue
+            merged["counts"] = [a + b for a, b in zip(merged["counts"], h["counts"])]
+            merged["sum"] += h["sum"]
+            merged["count"] += h["count"]
+
+    layouts = {}
+    for name, labels, buckets in histograms:
+        layouts[(name, labels)] = layouts.get((name, labels), 0) + 1
+    merged_histograms = []
+    for (name, labels, buckets), h in histograms.items():
+        labels = dict(labels)
+        if layouts[(name, _labels_key(labels))] > 1:
+            labels["buckets"] = ",".join(str(bound) for bound in buckets)
+        merged_histograms.append({"name": name, "labels": labels, **h})
+    return {
+        "counters": [{"name": name, "labels": dict(labels), "value": value}
+                     for (name, labels), value in counters.items()],
+        "histograms": merged_histograms,
+    }
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = []
+    for k, v in items:
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{k}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def to_prometheus(snapshot):
+    """Render a snapshot in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+    for counter in sorted(snapshot["counters"], key=lambda c: c["name"]):
+        name = METRIC_PREFIX + counter["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']}")
+    for h in sorted(snapshot["histograms"], key=lambda h: h["name"]):
+        name = METRIC_PREFIX + h["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip(h["buckets"], h["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(h['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(h['labels'], {'le': '+Inf'})} {h['count']}")
+        lines.append(f"{name}_sum{_format_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_format_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize(snapshot):
+    """
+    Condense a snapshot into the run summary written by the CLI.
+
+    Returns:
+        dict: Stage wall times, Reddit, LLM, cascade and BigQuery totals and an estimated LLM cost
+    """
+    def counter_total(name, **match):
+        return sum(c["value"] for c in snapshot["counters"]
+                   if c["name"] == name and all(c["labels"].get(k) == v for k, v in match.items()))
+
+    def timing(h):
+        return {"count": h["count"], "total_seconds": round(h["sum"], 3),
+                "mean_seconds": round(h["sum"] / h["count"], 3) if h["count"] else None}
+
+    histograms = {h["name"]: [] for h in snapshot["histograms"]}
+    for h in snapshot["histograms"]:
+        histograms[h["name"]].append(h)
+
+    llm = {}
+    for c in snapshot["counters"]:
+        if c["name"] == "llm_tokens_total":
+            model_stats = llm.setdefault(c["labels"]["model"], {"prompt_tokens": 0, "completion_tokens": 0})
+            model_stats[f"{c['labels']['kind']}_tokens"] += c["value"]
+    cost = 0.0
+    for model, stats in llm.items():
+        stats["requests"] = counter_total("llm_requests_total", model=model, status="ok")
+        prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        stats["estimated_cost_usd"] = round((stats["prompt_tokens"] * prompt_price
+                                             + stats["completion_tokens"] * completion_price) / 1e6, 6)
+        cost += stats["estimated_cost_usd"]
+
+    return {
+        "stages": {h["labels"]["stage"]: timing(h) for h in histograms.get("stage_duration_seconds", [])},
+        "reddit": {
+            "requests": counter_total("reddit_requests_total"),
+            "errors": counter_total("reddit_requests_total", status="error"),
+            "latency": [{"labels": h["labels"], **timing(h)}
+                        for h in histograms.get("reddit_request_duration_seconds", [])],
+        },
+        "llm": {
+            "models": llm,
+            "cache_hits": counter_total("llm_cache_total", result="hit"),
+            "cache_misses": counter_total("llm_cache_total", result="miss"),
+            "failed_requests": counter_total("llm_requests_total", status="error"),
+            "retries": counter_total("llm_retries_total"),
+            "parse_failures": counter_total("llm_parse_failures_total"),
+            "latency": [{"labels": h["labels"], **timing(h)}
+                        for h in histograms.get("llm_request_duration_seconds", [])],
+            "estimated_cost_usd": round(cost, 6),
+        },
+        "prefilter": {
+            "kept": counter_total("prefilter_posts_total", result="kept"),
+            "dropped": counter_total("prefilter_posts_total", result="dropped"),
+        },
+        "cascade": {
+            "decisions": {c["labels"]["tier"]: c["value"] for c in snapshot["counters"]
+                          if c["name"] == "cascade_decisions_total"},
+            "agreement": {
+                comparison: {"compared": counter_total("cascade_comparisons_total", comparison=comparison),
+                             "agreed": counter_total("cascade_comparisons_total", comparison=comparison,
+                                                     agreed="True")}
+                for comparison in sorted({c["labels"]["comparison"] for c in snapshot["counters"]
+                                          if c["name"] == "cascade_comparisons_total"})
+            },
+        },
+        "bigquery": {
+            "rows_uploaded": counter_total("bigquery_rows_total", status="ok"),
+            "rows_failed": counter_total("bigquery_rows_total", status="error"),
+            "uploads": [timing(h) for h in histograms.get("bigquery_insert_duration_seconds", [])],
+        },
+    }
+
+
+registry = MetricsRegistry()
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    registry.observe(name, value, buckets, **labels)
+
+
+def timer(name, **labels):
+    return registry.timer(name, **labels)
+
+
+def stage(name):
+    """Time a pipeline stage, e.g. `with stage("filtering"): ...`"""
+    return registry.timer("stage_duration_seconds", stage=name)
+
+
+def write_run_summary(path, **extra):
+    """Write the summary of this process' metrics, plus any extra fields, as JSON."""
+    summary = {**extra, **summarize(registry.snapshot())}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Run summary saved to {path}")
+    return summary
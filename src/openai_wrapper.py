@@ -1,14 +1,172 @@
+import os
+import json
+import time
+import random
 import openai
+from src.rate_limit import RateLimiter
+from src.utils import estimate_tokens
+from src.llm_cache import get_cache, CompletionCache, LLM_CACHE_MODE
+from src import metrics
+from src.transport import get_openai_client, first_token_logprobs
 
 
-client = openai.OpenAI()
+# Retries are handled below so that 429s also pause the shared limiter.
+# TRANSPORT_MODE=record/replay swaps in a client that records to or answers from cassettes
+client = get_openai_client(max_retries=0)
 
-def get_completion(system_prompt, prompt, model="gpt-4o-mini"):
+# Account quotas, shared by every thread of the process
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", 500))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", 200000))
+MAX_RETRIES = 5
+# Completion tokens reserved per call, since the real count is only known afterwards
+COMPLETION_TOKENS_ESTIMATE = 500
+
+limiter = RateLimiter(requests_per_minute=OPENAI_RPM, tokens_per_minute=OPENAI_TPM)
+
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.APITimeoutError,
+                    openai.APIConnectionError, openai.InternalServerError)
+
+
+def get_retry_delay(error, attempt):
+    """Use the server's Retry-After hint if there is one, otherwise exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(60, 2 ** attempt) + random.uniform(0, 1)
+
+
+def get_completion(system_prompt, prompt, model="gpt-4o-mini", temperature=0.7, cache_mode=None):
+    """
+    Get a chat completion, served from the on-disk cache when possible.
+
+    Args:
+        system_prompt: System message
+        prompt: User message
+        model: OpenAI model name
+        temperature: Sampling temperature
+        cache_mode: "on", "refresh" or "off" (defaults to LLM_CACHE_MODE)
+
+    Returns:
+        str: The completion text
+    """
+    return get_completion_with_finish_reason(system_prompt, prompt, model, temperature, cache_mode)[0]
+
+
+def get_completion_with_finish_reason(system_prompt, prompt, model="gpt-4o-mini", temperature=0.7, cache_mode=None):
+    """
+    Like get_completion(), but also return why the model stopped, e.g. "length"
+    when the answer was cut off at the token limit.
+
+    Returns:
+        Tuple of (completion text, finish reason or None when served from the cache)
+    """
+    cache_mode = cache_mode or LLM_CACHE_MODE
+    cache = get_cache() if cache_mode != "off" else None
+    cache_key = CompletionCache.make_key(model, system_prompt, prompt, temperature)
+    if cache is not None and cache_mode != "refresh":
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.inc("llm_cache_total", result="hit")
+            return cached, None
+        metrics.inc("llm_cache_total", result="miss")
+
+    choice = request_response(system_prompt, prompt, model, temperature).choices[0]
+    content = choice.message.content
+    if cache is not None and content is not None:
+        cache.set(cache_key, model, content)
+    return content, getattr(choice, "finish_reason", None)
+
+
+def invalidate_completion(system_prompt, prompt, model="gpt-4o-mini", temperature=0.7):
+    """
+    Drop a cached get_completion() answer, e.g. one its caller could not parse,
+    so that the next call asks the API again instead of replaying it.
+    """
+    if LLM_CACHE_MODE == "off":
+        return
+    get_cache().delete(CompletionCache.make_key(model, system_prompt, prompt, temperature))
+    metrics.inc("llm_cache_invalidations_total")
+
+
+def get_completion_with_logprobs(system_prompt, prompt, model="gpt-4o-mini", temperature=0, max_tokens=1,
+                                 top_logprobs=5, cache_mode=None):
+    """
+    Get a short completion with the log probabilities of its first token's alternatives,
+    e.g. to read how sure the model is of a yes/no answer.
+
+    Shares the on-disk cache with get_completion(), under keys of its own.
+
+    Returns:
+        Tuple of (completion text, list of (token, logprob) for the first token,
+        empty if the API sent no logprobs)
+    """
+    cache_mode = cache_mode or LLM_CACHE_MODE
+    cache = get_cache() if cache_mode != "off" else None
+    cache_key = CompletionCache.make_key(model, system_prompt, prompt, temperature, max_tokens=max_tokens,
+                                         top_logprobs=top_logprobs)
+    if cache is not None and cache_mode != "refresh":
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.inc("llm_cache_total", result="hit")
+            cached = json.loads(cached)
+            return cached["content"], [tuple(pair) for pair in cached["top_logprobs"]]
+        metrics.inc("llm_cache_total", result="miss")
+
+    response = request_response(system_prompt, prompt, model, temperature, max_tokens=max_tokens,
+                                logprobs=True, top_logprobs=top_logprobs)
+    content = response.choices[0].message.content
+    alternatives = first_token_logprobs(response)
+    if cache is not None and content is not None:
+        cache.set(cache_key, model, json.dumps({"content": content, "top_logprobs": alternatives}))
+    return content, alternatives
+
+
+def request_response(system_prompt, prompt, model, temperature, **options):
+    """
+    Call the OpenAI API, respecting the shared rate limiter and retrying transient errors.
+
+    Returns the whole response; options (e.g. logprobs) go to the API as is.
+    """
     messages = [{"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}]
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=0.7,
-    )
-    return response.choices[0].message.content
\ No newline at end of file
+    estimated_tokens = (estimate_tokens(system_prompt) + estimate_tokens(prompt)
+                        + options.get("max_tokens", COMPLETION_TOKENS_ESTIMATE))
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire(estimated_tokens)
+        start = time.perf_counter()
+        try:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                **options
+            )
+        except TRANSIENT_ERRORS as e:
+            metrics.observe("llm_request_duration_seconds", time.perf_counter() - start, model=model)
+            metrics.inc("llm_requests_total", model=model, status="error")
+            if attempt == MAX_RETRIES:
+                raise
+            metrics.inc("llm_retries_total", model=model, error=type(e).__name__)
+            delay = get_retry_delay(e, attempt)
+            print(f"OpenAI request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            if isinstance(e, openai.RateLimitError):
+                # Back off every worker, not just this one
+                limiter.pause(delay)
+            time.sleep(delay)
+            continue
+        metrics.observe("llm_request_duration_seconds", time.perf_counter() - start, model=model)
+        metrics.inc("llm_requests_total", model=model, status="ok")
+        record_usage(model, response)
+        return response
+
+
+def record_usage(model, response):
+    """Count the prompt and completion tokens the API reports for a response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, model=model, kind="prompt")
+    metrics.inc("llm_tokens_total", usage.completion_tokens or 0, model=model, kind="completion")
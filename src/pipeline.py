@@ -0,0 +1,205 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.filtering import (filter_posts, filter_comments, format_post_for_report, summarize_report_batch,
+                           write_report, reduce_partial_findings, REPORT_TOKEN_BUDGET)
+from src.dedup import collapse_duplicate_comments
+from src.utils import estimate_tokens, MAX_WORKERS
+from src import metrics
+
+# configure via env vars
+# Scraped records buffered between the scraper and the filters; the scrape pauses while it is full
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 50))
+# Most posts classified together once they are available
+PIPELINE_BATCH_SIZE = int(os.environ.get("PIPELINE_BATCH_SIZE", 20))
+# Post batches and comment filters in flight at once, each runs its own LLM calls concurrently
+PIPELINE_STAGE_WORKERS = int(os.environ.get("PIPELINE_STAGE_WORKERS", 4))
+
+# Seconds to wait for more records while filters are in flight
+POLL_INTERVAL = 0.05
+
+_DONE = object()
+
+
+class ProducerError:
+    """Exception raised by the record iterator, passed through the queue to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def produce(records, buffer, stop):
+    """Producer thread: move records into the bounded queue, blocking while it is full."""
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for record in records:
+            metrics.inc("pipeline_records_total")
+            if not put(record):
+                return
+    except Exception as e:
+        put(ProducerError(e))
+        return
+    finally:
+        # Stops the scrape (and its comment workers) when the consumer gave up early
+        if hasattr(records, "close"):
+            records.close()
+    put(_DONE)
+
+
+def take_batch(buffer, batch_size, timeout=None):
+    """
+    Take up to batch_size queued records, waiting up to `timeout` seconds for the first.
+
+    Returns:
+        Tuple of (records, whether the producer is done)
+    """
+    batch = []
+    try:
+        item = buffer.get(timeout=timeout)
+    except queue.Empty:
+        return batch, False
+    while True:
+        if item is _DONE:
+            return batch, True
+        if isinstance(item, ProducerError):
+            raise item.error
+        batch.append(item)
+        if len(batch) >= batch_size:
+            return batch, False
+        try:
+            item = buffer.get_nowait()
+        except queue.Empty:
+            return batch, False
+
+
+def filter_record_comments(post, topic, max_workers=None, dedupe_threshold=None, checkpoint=None):
+    """Filter the comments nested in a scraped post record."""
+    comments = post.get('comments') or []
+    if dedupe_threshold is not None:
+        comment_count = len(comments)
+        comments = collapse_duplicate_comments(comments, dedupe_threshold)
+        metrics.inc("dedup_comments_collapsed_total", comment_count - len(comments))
+    return filter_comments(post, comments, topic, max_workers=max_workers, checkpoint=checkpoint)
+
+
+def stream_filtered_posts(records, topic, max_workers=None, batch_token_budget=None, dedupe_threshold=None,
+                          checkpoint=None, queue_size=PIPELINE_QUEUE_SIZE, batch_size=PIPELINE_BATCH_SIZE,
+                          stage_workers=PIPELINE_STAGE_WORKERS, cascade=None):
+    """
+    Filter posts and their comments while they are still being scraped.
+
+    A producer thread drains `records` (e.g. scrape_reddit.iter_new()) into a
+    bounded queue. Posts are classified in batches of whatever is queued, and the
+    comments of each relevant post are filtered as soon as its verdict is in. Once
+    stage_workers tasks are in flight no more records are taken, the queue fills
+    up and the scrape waits, so a slow LLM never makes records pile up.
+
+    Posts without fetched comments (keep_unmatched records) are skipped. Crossposts
+    are not collapsed since later copies are not known yet; repeated comments are.
+
+    Args:
+        records: Iterable of post records with nested comments
+        topic: The topic to filter against
+        max_workers: Number of concurrent LLM calls per task (defaults to OPENAI_MAX_WORKERS)
+        batch_token_budget: If set, classify several posts per call, see filter_posts()
+        dedupe_threshold: If set, collapse near-duplicate comments of each post
+        checkpoint: Optional Checkpoint used to resume and record post and comment verdicts
+        queue_size: Records buffered between the scraper and the filters
+        batch_size: Most posts per classification task
+        stage_workers: Classification and comment filtering tasks in flight
+        cascade: Optional cascade.Cascade used to classify posts, see filter_posts()
+
+    Yields:
+        Tuples of (post, list_of_relevant_comments), in completion order
+    """
+    buffer = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    producer = threading.Thread(target=produce, args=(records, buffer, stop), daemon=True)
+    producer.start()
+    executor = ThreadPoolExecutor(max_workers=stage_workers)
+    # future -> ("posts", batch) or ("comments", post)
+    tasks = {}
+    finished = False
+    try:
+        while not finished or tasks:
+            accepting = not finished and len(tasks) < stage_workers
+            if accepting:
+                # Only block on the queue when there is nothing else to wait for
+                batch, finished = take_batch(buffer, batch_size, timeout=POLL_INTERVAL if tasks else None)
+                batch = [record for record in batch if record.get('comments') is not None]
+                if batch:
+                    future = executor.submit(filter_posts, batch, topic, max_workers=max_workers,
+                                             batch_token_budget=batch_token_budget, checkpoint=checkpoint,
+                                             cascade=cascade)
+                    tasks[future] = ("posts", batch)
+            if not tasks:
+                continue
+
+            done, _ = wait(tasks, timeout=0 if accepting and not finished else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, data = tasks.pop(future)
+                if kind == "posts":
+                    print(f"Filtered {len(data)} streamed posts to {len(future.result())} posts")
+                    for post in future.result():
+                        comments_future = executor.submit(filter_record_comments, post, topic, max_workers,
+                                                          dedupe_threshold, checkpoint)
+                        tasks[comments_future] = ("comments", post)
+                else:
+                    yield data, future.result()
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_report(filtered_posts_and_comments, agency, topic, map_token_budget=REPORT_TOKEN_BUDGET,
+                  max_workers=None):
+    """
+    Build the report while filtered posts are still arriving.
+
+    Posts are formatted as they come in, and each time the formatted text fills
+    map_token_budget the batch is summarized in the background (the map stage of
+    generate_report()). Data that fits in one budget gets a single report prompt.
+
+    Args:
+        filtered_posts_and_comments: Iterable of tuples (post, list_of_relevant_comments),
+            e.g. stream_filtered_posts()
+        agency: The agency name
+        topic: The topic description
+        map_token_budget: Maximum tokens of feedback data per prompt (None sends everything at once)
+        max_workers: Number of concurrent map calls (defaults to OPENAI_MAX_WORKERS)
+
+    Returns:
+        Tuple of (list of (post, relevant_comments) tuples, markdown report)
+    """
+    results = []
+    batch = []
+    batch_tokens = 0
+    partials = []
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as executor:
+        for post, comments in filtered_posts_and_comments:
+            results.append((post, comments))
+            text = format_post_for_report(post, comments)
+            tokens = estimate_tokens(text)
+            if map_token_budget is not None and batch and batch_tokens + tokens > map_token_budget:
+                partials.append(executor.submit(summarize_report_batch, batch, agency, topic))
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+
+        if not partials:
+            return results, write_report(batch, agency, topic)
+        partials.append(executor.submit(summarize_report_batch, batch, agency, topic))
+        print(f"Summarized report data of {len(results)} posts in {len(partials)} batches")
+        partials = [future.result() for future in partials]
+    return results, reduce_partial_findings(partials, agency, topic, map_token_budget, max_workers)
@@ -0,0 +1,122 @@
+import os
+import re
+import zlib
+import numpy as np
+
+# Hashed feature space of the local vectorizer
+N_FEATURES = 2 ** 14
+# Posts vectorized per NumPy batch, bounds memory at BATCH_SIZE x N_FEATURES floats
+BATCH_SIZE = 512
+# Posts scoring below this cosine similarity to the topic are never sent to the LLM (unset: off)
+PREFILTER_THRESHOLD = float(os.environ["PREFILTER_THRESHOLD"]) if os.environ.get("PREFILTER_THRESHOLD") else None
+# Most posts sent to the LLM per run, best scoring first (unset: no limit)
+PREFILTER_TOP_K = int(os.environ["PREFILTER_TOP_K"]) if os.environ.get("PREFILTER_TOP_K") else None
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "from", "has", "have", "i", "if", "in",
+    "is", "it", "its", "me", "my", "of", "on", "or", "so", "that", "the", "their", "there", "they", "this",
+    "to", "was", "we", "were", "what", "when", "with", "you", "your", "just", "like", "get", "do", "not",
+}
+
+
+def tokenize(text):
+    """Lowercased words without stopwords, plus word bigrams."""
+    words = [word for word in TOKEN_RE.findall((text or "").lower()) if word not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hash_features(text, n_features=N_FEATURES):
+    """Return the feature indices and signed counts of a text (signed hashing trick)."""
+    counts = {}
+    for token in tokenize(text):
+        h = zlib.crc32(token.encode())
+        index = h % n_features
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        counts[index] = counts.get(index, 0.0) + sign
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return indices, values
+
+
+def vectorize(features, idf, n_features=N_FEATURES):
+    """Build L2-normalized TF-IDF rows from hashed features."""
+    matrix = np.zeros((len(features), n_features), dtype=np.float32)
+    for row, (indices, values) in enumerate(features):
+        # Sublinear term frequency, keeping the hash sign
+        matrix[row, indices] = np.sign(values) * (1 + np.log(np.abs(values) + 1e-9).clip(min=0))
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def get_post_text(post):
+    return f"{post.get('title', '') or ''}\n{post.get('body', '') or ''}"
+
+
+def score_posts(posts, topic, query_terms=None, n_features=N_FEATURES):
+    """
+    Score posts by cosine similarity to the topic with a local hashing TF-IDF model.
+
+    Args:
+        posts: List of post data
+        topic: Topic description from get_topic()
+        query_terms: Optional extra terms (e.g. the agency keywords) added to the topic query
+
+    Returns:
+        numpy.ndarray: One similarity score per post, in input order
+    """
+    query = topic + " " + " ".join(query_terms or [])
+    features = [hash_features(get_post_text(post), n_features) for post in posts]
+    query_features = hash_features(query, n_features)
+
+    # Document frequencies over the posts and the query
+    df = np.zeros(n_features, dtype=np.float32)
+    for indices, _ in features + [query_features]:
+        df[indices] += 1
+    n_docs = len(features) + 1
+    idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+
+    query_vector = vectorize([query_features], idf, n_features)[0]
+    scores = np.empty(len(posts), dtype=np.float32)
+    for start in range(0, len(posts), BATCH_SIZE):
+        batch = vectorize(features[start:start + BATCH_SIZE], idf, n_features)
+        scores[start:start + BATCH_SIZE] = batch @ query_vector
+    return scores
+
+
+def prefilter_posts(posts, topic, threshold=None, top_k=None, query_terms=None):
+    """
+    Drop posts that are clearly unrelated to the topic before any LLM call.
+
+    Args:
+        posts: List of post data
+        topic: Topic description from get_topic()
+        threshold: Keep posts scoring at least this cosine similarity
+        top_k: Keep at most this many of the best scoring posts
+        query_terms: Optional extra terms added to the topic query
+
+    Returns:
+        Tuple of (kept posts in input order, stats dict)
+    """
+    if not posts or (threshold is None and top_k is None):
+        return list(posts), {"scored": len(posts), "kept": len(posts), "skipped": 0}
+
+    scores = score_posts(posts, topic, query_terms)
+    keep = np.ones(len(posts), dtype=bool)
+    if threshold is not None:
+        keep &= scores >= threshold
+    if top_k is not None and keep.sum() > top_k:
+        ranked = np.argsort(-np.where(keep, scores, -np.inf), kind="stable")
+        keep = np.zeros(len(posts), dtype=bool)
+        keep[ranked[:top_k]] = True
+
+    kept = [post for post, kept_flag in zip(posts, keep) if kept_flag]
+    stats = {
+        "scored": len(posts),
+        "kept": len(kept),
+        "skipped": len(posts) - len(kept),
+        "min_kept_score": float(scores[keep].min()) if len(kept) else None,
+    }
+    return kept, stats
@@ -23,6 +23,46 @@ Output only:
 ```
 """
 
+filter_post_yes_no_prompt = """
+Analyze this Reddit post and determine if it's relevant to the given topic.
+
+Topic: {topic}
+Post: {post}
+
+Is this post relevant to the topic? Consider:
+- Direct mentions of the topic or related services
+- User experiences with the topic
+- Issues, complaints, or praise related to the topic
+- be a bit generous in what is relevant
+
+Answer with a single word: yes or no.
+"""
+
+filter_posts_batch_prompt = """
+Analyze these Reddit posts and determine which are relevant to the given topic.
+
+Topic: {topic}
+Posts: {posts}
+
+For each post, determine if it's relevant by checking if it has:
+- Direct mentions of the topic or related services
+- User experiences with the topic
+- Issues, complaints, or praise related to the topic
+- be a bit generous in what is relevant
+
+Return a verdict for every post id.
+
+Output only:
+```json
+[
+    {{
+        "id": "post_id",
+        "is_relevant": true/false
+    }}
+]
+```
+"""
+
 filter_comment_prompt = """
 Analyze these comments and determine which are relevant to the topic.
 
@@ -60,7 +100,9 @@ Generate an actionable government report analyzing public feedback about {agency
 
 **Public Feedback Data:**
 {posts_and_comments}
+"""
 
+insight_report_structure = """
 # ACTIONABLE ANALYSIS REPORT
 
 ## Executive Summary
@@ -134,6 +176,67 @@ The metrics should only reflect what was understood from the posts and comments,
 **Output:** Professional government report in markdown format only.
 """
 
+insight_post_prompt += insight_report_structure
+
+
+insight_map_prompt = """
+Extract structured findings from this batch of public feedback about {agency} services and operations.
+The findings will later be merged with those of other batches into a single report.
+
+**Agency:** {agency}
+**Service Area:** {topic}
+**Posts in this batch:** {post_count}
+
+**Public Feedback Data:**
+{posts_and_comments}
+
+List, in markdown:
+
+## Issues
+- For each distinct issue: service area, short description, number of posts/comments raising it, severity (1-5)
+- Up to 3 exact user quotes as evidence per issue
+
+## Root Causes
+- System/process failures, staffing or resource issues, policy gaps mentioned
+
+## Citizen-Suggested Solutions
+- Specific improvements and workarounds users mention
+
+## Positive Feedback
+- What users say is working well, with quotes
+
+## Sentiment
+- Overall tone and trust in the agency for this batch
+
+Only report what is in the data. Keep counts exact so they can be summed across batches.
+"""
+
+insight_merge_prompt = """
+Merge these partial findings about {agency} ({topic}), extracted from separate batches of public feedback,
+into one set of findings with the same sections (Issues, Root Causes, Citizen-Suggested Solutions,
+Positive Feedback, Sentiment).
+
+Combine duplicate issues and add up their counts. Keep the most representative exact quotes.
+
+**Partial Findings:**
+{partial_findings}
+
+Output the merged findings in markdown only.
+"""
+
+insight_reduce_prompt = """
+Generate an actionable government report analyzing public feedback about {agency} services and operations.
+
+**Agency:** {agency}
+**Service Area:** {topic}
+
+The public feedback was analyzed in batches. Combine the findings of all batches below,
+merging duplicate issues and adding up their counts, and base the report only on them.
+
+**Findings From Public Feedback:**
+{partial_findings}
+""" + insight_report_structure
+
 
 keywords_generator_system_prompt = """
 You are an expert in government services and public administration, specializing in identifying relevant search terms for social media monitoring.
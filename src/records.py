@@ -0,0 +1,143 @@
+import sys
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """
+    Base of the slotted record types.
+
+    Supports the read side of the dict interface (get, [], keys, **record), so
+    code written against the plain-dict records keeps working.
+    """
+    __slots__ = ()
+    # Fields holding few distinct values, shared between records via sys.intern
+    INTERNED = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            value = fields.get(name)
+            setattr(self, name, _intern(value) if name in self.INTERNED else value)
+
+    @classmethod
+    def from_dict(cls, data, **overrides):
+        return cls(**{**data, **overrides})
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            value = getattr(self, key)
+            return default if value is None and default is not None else value
+        return default
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def copy(self, **changes):
+        record = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(record, name, changes[name] if name in changes else getattr(self, name))
+        return record
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.get('id') or self.get('comment_id')!r})"
+
+
+class Comment(Record):
+    __slots__ = ("post_id", "comment_id", "author", "body", "created_utc", "score", "parent_id",
+                 "is_related", "keyword_hits")
+    INTERNED = ("post_id", "author", "parent_id")
+
+
+class Post(Record):
+    """A post with its comments, a list of Comment or None when they were not fetched."""
+    __slots__ = ("source", "subreddit", "id", "unique_id", "title", "body", "url", "author",
+                 "created_utc", "num_comments", "score", "keyword_hits", "comments")
+    INTERNED = ("source", "subreddit", "author")
+
+    @classmethod
+    def from_item(cls, item):
+        """Build a Post from a fetch_new() record, converting its nested comment dicts."""
+        comments = item.get("comments")
+        if comments is not None:
+            comments = [comment if isinstance(comment, Comment) else Comment.from_dict(comment, post_id=item["id"])
+                        for comment in comments]
+        return cls.from_dict(item, comments=comments)
+
+
+class Corpus:
+    """
+    Posts of several subreddits with their comments, indexed once.
+
+    Indexes post ids to posts and comments, and (lazily) parent ids to their
+    replies. Iterating a corpus yields its comments and len() counts them, so it
+    can be passed wherever a list of comment rows is expected.
+    """
+
+    def __init__(self, posts_by_subreddit=None):
+        self.posts_by_subreddit = {sub: list(posts) for sub, posts in (posts_by_subreddit or {}).items()}
+        self.posts_by_id = {post.id: post for posts in self.posts_by_subreddit.values() for post in posts}
+        self._children = None
+
+    @classmethod
+    def from_items(cls, items_by_subreddit):
+        """Build a corpus from fetch_new() records (dicts or Posts), keyed by subreddit."""
+        return cls({sub: [item if isinstance(item, Post) else Post.from_item(item) for item in items]
+                    for sub, items in items_by_subreddit.items()})
+
+    def select(self, posts):
+        """A corpus of some of these posts, sharing their records and comment lists."""
+        by_subreddit = {}
+        for post in posts:
+            by_subreddit.setdefault(post.subreddit, []).append(post)
+        return Corpus(by_subreddit)
+
+    # dict-style access by subreddit
+    def items(self):
+        return self.posts_by_subreddit.items()
+
+    def __getitem__(self, subreddit):
+        return self.posts_by_subreddit[subreddit]
+
+    @property
+    def posts(self):
+        return [post for posts in self.posts_by_subreddit.values() for post in posts]
+
+    def comments_for(self, post_id):
+        post = self.posts_by_id.get(post_id)
+        return post.comments or [] if post is not None else []
+
+    def set_comments(self, post, comments):
+        """Attach freshly fetched comments to a post of the corpus."""
+        post.comments = [comment if isinstance(comment, Comment) else Comment.from_dict(comment, post_id=post.id)
+                         for comment in comments]
+        self._children = None
+
+    def replies_to(self, parent_id):
+        """Comments replying to a fullname (t3_<post id> or t1_<comment id>)."""
+        if self._children is None:
+            children = {}
+            for comment in self:
+                children.setdefault(comment.parent_id, []).append(comment)
+            self._children = children
+        return self._children.get(parent_id, [])
+
+    def __iter__(self):
+        for posts in self.posts_by_subreddit.values():
+            for post in posts:
+                yield from post.comments or []
+
+    def __len__(self):
+        return sum(len(post.comments or []) for posts in self.posts_by_subreddit.values() for post in posts)
@@ -1,14 +1,36 @@
 # reddit_fetch.py
 import os
 import time
+import json
 import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import praw
+import prawcore
+from src.keyword_matcher import get_matcher
+from src.rate_limit import RateLimiter
+from src import metrics
+from src import transport
 
 # configure via env vars
 CLIENT_ID = os.environ.get("REDDIT_CLIENT_ID")
 CLIENT_SECRET = os.environ.get("REDDIT_CLIENT_SECRET")
 USER_AGENT = os.environ.get("REDDIT_USER_AGENT", "boston-crash-scraper/0.1 (by u/yourname)")
+HIGH_WATER_MARKS_PATH = os.environ.get("REDDIT_HIGH_WATER_MARKS", "reddit_high_water_marks.json")
+# Reddit allows 100 OAuth requests per minute per client id, shared by all threads
+REDDIT_QPM = int(os.environ.get("REDDIT_QPM", 100))
+# Processes (e.g. job workers) scraping with the same client id; each one gets an equal share of REDDIT_QPM
+REDDIT_PROCESSES = max(1, int(os.environ.get("REDDIT_PROCESSES", 1)))
+REDDIT_REQUEST_TIMEOUT = int(os.environ.get("REDDIT_REQUEST_TIMEOUT", 16))
+REDDIT_COMMENT_WORKERS = int(os.environ.get("REDDIT_COMMENT_WORKERS", 4))
+# fetch_new() reports its counters to the progress callback every this many posts
+PROGRESS_EVERY = 25
+
+reddit_limiter = RateLimiter(requests_per_minute=REDDIT_QPM / REDDIT_PROCESSES)
+_thread_local = threading.local()
+_high_water_marks_lock = threading.Lock()
 # SUBREDDITS = ["boston", "massachusetts", "cambri`dge", "bikeboston", "MassachusettsUSA", "CambridgeMA", ]  # Using verified subreddit names
 
 # CRASH_KEYWORDS = [
@@ -22,13 +44,56 @@ USER_AGENT = os.environ.get("REDDIT_USER_AGENT", "boston-crash-scraper/0.1 (by u
 #     "injured", "hospitalized", "trauma", "life flight", "medevac", "first responders"
 # ]
 
+class ScrapeCancelled(Exception):
+    pass
+
+def report_progress(progress, event, **data):
+    """Send an event to a fetch_new() progress callback. Callback errors never stop the scrape."""
+    if progress is None:
+        return
+    try:
+        progress(event, data)
+    except Exception as e:
+        print(f"Progress callback failed on {event}: {e}")
+
+class LimitedRequestor(prawcore.Requestor):
+    """
+    prawcore requestor that takes every HTTP request from the shared Reddit limiter.
+
+    With TRANSPORT_MODE=record every exchange is also saved to the cassettes, and
+    with TRANSPORT_MODE=replay responses come from them instead of the network.
+    """
+
+    def request(self, *args, **kwargs):
+        if transport.TRANSPORT_MODE == "replay":
+            metrics.inc("reddit_requests_total", status="replay")
+            return transport.replay_reddit_response(args, kwargs)
+        reddit_limiter.acquire()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = super().request(*args, **kwargs)
+            status = str(getattr(response, "status_code", "ok"))
+            if transport.TRANSPORT_MODE == "record":
+                transport.record_reddit_response(args, kwargs, response, time.perf_counter() - start)
+            return response
+        finally:
+            metrics.inc("reddit_requests_total", status=status)
+            metrics.observe("reddit_request_duration_seconds", time.perf_counter() - start)
+
 def connects():
-    if not CLIENT_ID or not CLIENT_SECRET:
+    client_id, client_secret = CLIENT_ID, CLIENT_SECRET
+    if transport.TRANSPORT_MODE == "replay":
+        # Replayed responses need no real credentials
+        client_id, client_secret = client_id or "replay", client_secret or "replay"
+    if not client_id or not client_secret:
         raise ValueError("REDDIT_CLIENT_ID and REDDIT_CLIENT_SECRET environment variables must be set")
     
-    reddit = praw.Reddit(client_id=CLIENT_ID,
-                        client_secret=CLIENT_SECRET,
-                        user_agent=USER_AGENT)
+    reddit = praw.Reddit(client_id=client_id,
+                        client_secret=client_secret,
+                        user_agent=USER_AGENT,
+                        requestor_class=LimitedRequestor,
+                        timeout=REDDIT_REQUEST_TIMEOUT)
     
     # Test the connection
     try:
@@ -41,20 +106,61 @@ def connects():
     
     return reddit
 
+def get_thread_reddit():
+    """PRAW is not thread safe, so every worker thread gets its own Reddit instance."""
+    if not hasattr(_thread_local, "reddit"):
+        _thread_local.reddit = connects()
+    return _thread_local.reddit
+
+def matches_keywords(text, keywords):
+    """Check if a piece of text contains any of the keywords (list or KeywordMatcher)."""
+    return get_matcher(keywords).matches(text)
+
+def keyword_hits(text, keywords):
+    """Count the keyword occurrences in a piece of text."""
+    return get_matcher(keywords).score(text)
+
+def get_post_text(post):
+    return (post.title or "") + " " + (post.selftext or "")
+
 def candidate_post(post, keywords):
-    text = (post.title or "") + " " + (post.selftext or "")
-    text_lower = text.lower()
-    return any(k in text_lower for k in keywords)
+    return matches_keywords(get_post_text(post), keywords)
+
+def build_post_record(post, sub, comments, hits=0):
+    """Build the post record returned by fetch_new()."""
+    uid = hashlib.sha256((post.id + (post.created_utc and str(post.created_utc))).encode()).hexdigest()
+    return {
+        "source": "reddit",
+        "subreddit": sub,
+        "id": post.id,
+        "unique_id": uid,
+        "title": post.title,
+        "body": post.selftext,
+        "url": post.url,
+        "author": getattr(post.author, "name", None),
+        "created_utc": post.created_utc,
+        "num_comments": post.num_comments,
+        "score": post.score,
+        "keyword_hits": hits,
+        "comments": comments
+    }
 
-def fetch_comments(post, keywords):
-    """Fetch all comments from a post, including nested ones."""
+def fetch_comments(post, keywords, replace_more_limit=None):
+    """
+    Fetch all comments from a post, including nested ones.
+
+    replace_more_limit caps how many "more comments" links are expanded
+    (one API request each); None expands all of them.
+    """
     comments = []
+    keywords = get_matcher(keywords)
     try:
-        # Load all comments, including those hidden behind "more comments" links
-        post.comments.replace_more(limit=None)
+        # Load comments hidden behind "more comments" links
+        post.comments.replace_more(limit=replace_more_limit)
         
         for comment in post.comments.list():
             if hasattr(comment, 'body') and comment.body != '[deleted]' and comment.body != '[removed]':
+                hits = keyword_hits(comment.body, keywords)
                 comments.append({
                     "comment_id": comment.id,
                     "author": getattr(comment.author, "name", None) if comment.author else None,
@@ -62,7 +168,8 @@ def fetch_comments(post, keywords):
                     "created_utc": comment.created_utc,
                     "score": comment.score,
                     "parent_id": comment.parent_id,
-                    "is_related": candidate_comment(comment, keywords)
+                    "is_related": hits > 0,
+                    "keyword_hits": hits
                 })
     except Exception as e:
         print(f"Error fetching comments: {e}")
@@ -73,8 +180,7 @@ def candidate_comment(comment, keywords):
     """Check if a comment contains relevant keywords."""
     if not hasattr(comment, 'body') or not comment.body:
         return False
-    text_lower = comment.body.lower()
-    return any(k in text_lower for k in keywords)
+    return matches_keywords(comment.body, keywords)
 
 
 def is_within_date_range(post_timestamp, year, month=None):
@@ -105,79 +211,266 @@ def is_within_date_range(post_timestamp, year, month=None):
         post_date = datetime.fromtimestamp(post_timestamp)
         return start_of_year <= post_date <= end_of_year
 
-def fetch_new(limit=1000, year=2025, month=None, subreddits=None, keywords=None):
+def get_date_range_start(year, month=None):
+    """Return the epoch timestamp of the first second of the month/year range."""
+    return datetime(year, month or 1, 1).timestamp()
+
+def get_date_range_key(year, month=None):
+    return f"{year}-{month:02d}" if month else str(year)
+
+def load_high_water_marks(path=HIGH_WATER_MARKS_PATH):
+    """Load the persisted high-water marks, keyed by date range then subreddit."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_high_water_marks(marks, path=HIGH_WATER_MARKS_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(marks, f, indent=2)
+    os.replace(tmp_path, path)
+
+def save_high_water_mark(subreddit, mark, year, month=None, path=HIGH_WATER_MARKS_PATH):
+    """Advance one subreddit's high-water mark for a date range, once the posts behind it are stored."""
+    with _high_water_marks_lock:
+        marks = load_high_water_marks(path)
+        marks.setdefault(get_date_range_key(year, month), {})[subreddit] = mark
+        save_high_water_marks(marks, path)
+
+def fetch_comments_by_id(post_id, keywords, replace_more_limit=None, started_at=None):
+    """Worker task: fetch a post's comment tree with this thread's Reddit instance."""
+    if started_at is not None:
+        started_at[post_id] = time.monotonic()
+    post = get_thread_reddit().submission(id=post_id)
+    return fetch_comments(post, keywords, replace_more_limit)
+
+def fetch_record_comments(record, keywords, replace_more_limit=None, started_at=None, progress=None):
+    """Worker task: fetch the comments of a post record and report the finished record."""
+    comments = fetch_comments_by_id(record["id"], keywords, replace_more_limit, started_at)
+    report_progress(progress, "comments_fetched", subreddit=record["subreddit"], post_id=record["id"],
+                    comments=len(comments), relevant_comments=len([c for c in comments if c["is_related"]]))
+    report_progress(progress, "post", record={**record, "comments": comments})
+    return comments
+
+def wait_for_comments(record, future, started_at, comment_timeout=None):
+    """
+    Wait for a comment fetch submitted by iter_new() and attach the comments to its record.
+
+    A fetch that runs longer than comment_timeout seconds is abandoned and its
+    post keeps an empty comment list.
+    """
+    post_id = record["id"]
+    while True:
+        started = started_at.get(post_id)
+        wait = None
+        if comment_timeout is not None:
+            wait = comment_timeout - (time.monotonic() - started) if started else comment_timeout
+        try:
+            comments = future.result(timeout=max(wait, 0) if wait is not None else None)
+        except FutureTimeoutError:
+            if started_at.get(post_id) is None:
+                # Still queued behind other posts, its own clock has not started
+                continue
+            print(f"  Timed out fetching comments for post {post_id} after {comment_timeout}s")
+            future.cancel()
+            comments = []
+        except Exception as e:
+            print(f"  Error fetching comments for post {post_id}: {e}")
+            comments = []
+        break
+
+    record["comments"] = comments
+    print(f"  Post {post_id}: {len(comments)} comments ({len([c for c in comments if c['is_related']])} relevant)")
+    return record
+
+def fetch_new(limit=1000, year=2025, month=None, subreddits=None, keywords=None, keep_unmatched=False,
+              incremental=False, high_water_marks_path=HIGH_WATER_MARKS_PATH, new_marks=None,
+              comment_workers=REDDIT_COMMENT_WORKERS, comment_timeout=None, replace_more_limit=None,
+              should_stop=None, progress=None):
+    """
+    Walk the newest posts of each subreddit and collect the ones in the date range.
+
+    Takes the arguments of iter_new().
+
+    Returns:
+        list: Post records with their comments
+    """
+    return list(iter_new(limit=limit, year=year, month=month, subreddits=subreddits, keywords=keywords,
+                         keep_unmatched=keep_unmatched, incremental=incremental,
+                         high_water_marks_path=high_water_marks_path, new_marks=new_marks,
+                         comment_workers=comment_workers,
+                         comment_timeout=comment_timeout, replace_more_limit=replace_more_limit,
+                         should_stop=should_stop, progress=progress))
+
+def iter_new(limit=1000, year=2025, month=None, subreddits=None, keywords=None, keep_unmatched=False,
+             incremental=False, high_water_marks_path=HIGH_WATER_MARKS_PATH, new_marks=None,
+             comment_workers=REDDIT_COMMENT_WORKERS, comment_timeout=None, replace_more_limit=None,
+             should_stop=None, progress=None):
+    """
+    Walk the newest posts of each subreddit and yield the ones in the date range.
+
+    Records are yielded in listing order as soon as their comments are fetched,
+    while the walk goes on, so consumers can work on them during the scrape. The
+    walk only advances while the consumer asks for records, so a slow consumer
+    holds back the scrape instead of piling records up in memory.
+
+    Args:
+        limit (int): Maximum number of posts to check per subreddit
+        year (int): Year to search for posts
+        month (int, optional): Specific month to search (1-12). If None, searches entire year.
+        subreddits (list): List of subreddit names to search
+        keywords (list): List of keywords (or a KeywordMatcher) a post must contain
+            to have its comments fetched
+        keep_unmatched (bool): Also yield in-range posts that did not match the keywords,
+            with "comments" set to None. Used to build a shared corpus.
+        incremental (bool): Only yield posts newer than the subreddit's persisted
+            high-water mark for this date range, and advance the mark afterwards.
+            Posts skipped by the keyword filter are not revisited, so pair this
+            with keep_unmatched when the results are stored.
+        high_water_marks_path (str): JSON file holding the high-water marks
+        new_marks (dict, optional): Receives the newest in-range post of each subreddit
+            instead of it being saved as the high-water mark. Lets a caller that stores
+            the records call save_high_water_mark() only once they are stored, so a
+            crash in between does not leave unstored posts behind the mark.
+        comment_workers (int): Threads expanding comment trees while the listings are walked
+        comment_timeout (float, optional): Seconds after which a post's comment fetch is abandoned
+        replace_more_limit (int, optional): Maximum "more comments" expansions per post
+        should_stop (callable, optional): Checked before every post, ScrapeCancelled is
+            raised once it returns True
+        progress (callable, optional): Called as progress(event, data) from the walking
+            thread and the comment workers, so it must be thread-safe. Events are
+            subreddit_started, posts_checked (every PROGRESS_EVERY posts), relevant_post,
+            comments_fetched, post (a finished record with its comments),
+            subreddit_finished, subreddit_failed and finished.
+
+    Yields:
+        dict: Post records with their comments
+    """
     r = connects()
-    items = []
+    keywords = get_matcher(keywords)
     total_posts_checked = 0
     posts_in_date_range = 0
-    
-    for sub in subreddits:
-        try:
-            print(f"Accessing subreddit: r/{sub}")
-            subreddit = r.subreddit(sub)
-            
-            # Test if subreddit is accessible by checking its display name
-            _ = subreddit.display_name
-            print(f"Successfully connected to r/{sub}")
-            
-            post_count = 0
-            sub_posts_checked = 0
-            sub_posts_in_range = 0
-            
-            for post in subreddit.new(limit=limit):
-                sub_posts_checked += 1
-                total_posts_checked += 1
-                
-                # Check if post is within date range
-                if not is_within_date_range(post.created_utc, year, month):
-                    continue
-                
-                sub_posts_in_range += 1
-                posts_in_date_range += 1
-                
-                if candidate_post(post, keywords):
+    relevant_posts = 0
+    start_of_range = get_date_range_start(year, month)
+    date_range_key = get_date_range_key(year, month)
+    range_marks = load_high_water_marks(high_water_marks_path).get(date_range_key, {}) if incremental else {}
+
+    # Comment trees are expanded in worker threads so the listing walk never waits on them
+    executor = ThreadPoolExecutor(max_workers=max(1, comment_workers))
+    # (record, future) in listing order, future is None for posts without a comment fetch
+    pending = deque()
+    started_at = {}
+
+    def finished_records(block=False):
+        """Pop the records at the head of the listing whose comments are in (all of them if block)."""
+        while pending and (block or pending[0][1] is None or pending[0][1].done()):
+            record, future = pending.popleft()
+            if future is not None:
+                wait_for_comments(record, future, started_at, comment_timeout)
+            yield record
+
+    try:
+        for sub in subreddits:
+            try:
+                print(f"Accessing subreddit: r/{sub}")
+                report_progress(progress, "subreddit_started", subreddit=sub)
+                subreddit = r.subreddit(sub)
+
+                # Test if subreddit is accessible by checking its display name
+                _ = subreddit.display_name
+                print(f"Successfully connected to r/{sub}")
+
+                post_count = 0
+                sub_posts_checked = 0
+                sub_posts_in_range = 0
+                mark = range_marks.get(sub)
+                newest_seen = None
+
+                # The listing is newest-first, so paging can stop at the start of the
+                # date range or at the newest post seen by the previous incremental run
+                for post in subreddit.new(limit=limit):
+                    if should_stop is not None and should_stop():
+                        raise ScrapeCancelled(f"Scrape cancelled while walking r/{sub}")
+                    sub_posts_checked += 1
+                    total_posts_checked += 1
+                    if sub_posts_checked % PROGRESS_EVERY == 0:
+                        report_progress(progress, "posts_checked", subreddit=sub, posts_checked=sub_posts_checked,
+                                        posts_in_range=sub_posts_in_range, relevant=post_count)
+
+                    if post.created_utc and post.created_utc < start_of_range:
+                        print(f"Reached posts older than {date_range_key}, stopping r/{sub}")
+                        break
+
+                    if mark and (post.id == mark["id"] or post.created_utc < mark["created_utc"]):
+                        print(f"Reached posts already seen on a previous run, stopping r/{sub}")
+                        break
+
+                    # Skip posts newer than the date range
+                    if not is_within_date_range(post.created_utc, year, month):
+                        continue
+
+                    sub_posts_in_range += 1
+                    posts_in_date_range += 1
+                    if newest_seen is None:
+                        newest_seen = {"id": post.id, "created_utc": post.created_utc}
+
+                    hits = keyword_hits(get_post_text(post), keywords)
+                    if not hits:
+                        if keep_unmatched:
+                            pending.append((build_post_record(post, sub, None), None))
+                            yield from finished_records()
+                        continue
+
                     post_count += 1
+                    relevant_posts += 1
                     post_date = datetime.fromtimestamp(post.created_utc).strftime("%Y-%m-%d") if post.created_utc else "Unknown"
                     print(f"Processing relevant post {post_count} ({post_date}): {post.title[:50]}...")
-                    
-                    # Fetch comments
-                    print(f"  Fetching comments for post {post.id}...")
-                    comments = fetch_comments(post, keywords)
-                    print(f"  Found {len(comments)} comments ({len([c for c in comments if c['is_related']])} relevant)")
-                    
-                    # build record
-                    uid = hashlib.sha256((post.id + (post.created_utc and str(post.created_utc))).encode()).hexdigest()
-                    items.append({
-                        "source": "reddit",
-                        "subreddit": sub,
-                        "id": post.id,
-                        "unique_id": uid,
-                        "title": post.title,
-                        "body": post.selftext,
-                        "url": post.url,
-                        "author": getattr(post.author, "name", None),
-                        "created_utc": post.created_utc,
-                        "num_comments": post.num_comments,
-                        "score": post.score,
-                        "comments": comments
-                    })
-            date_range_desc = f"{year}-{month:02d}" if month else str(year)
-            print(f"r/{sub}: {sub_posts_checked} posts checked, {sub_posts_in_range} in {date_range_desc}, {post_count} relevant")
-        except Exception as e:
-            print(f"Error accessing r/{sub}: {e}")
-            print(f"Skipping r/{sub} and continuing with other subreddits...")
-            continue
-        time.sleep(1)  # polite pause between subreddits
-    
+                    report_progress(progress, "relevant_post", subreddit=sub, post_id=post.id, title=post.title,
+                                    created_utc=post.created_utc, keyword_hits=hits)
+
+                    # Queue the comment fetch
+                    record = build_post_record(post, sub, [], hits)
+                    future = executor.submit(fetch_record_comments, record, keywords, replace_more_limit,
+                                             started_at, progress)
+                    pending.append((record, future))
+                    yield from finished_records()
+                print(f"r/{sub}: {sub_posts_checked} posts checked, {sub_posts_in_range} in {date_range_key}, {post_count} relevant")
+                report_progress(progress, "subreddit_finished", subreddit=sub, posts_checked=sub_posts_checked,
+                                posts_in_range=sub_posts_in_range, relevant=post_count)
+
+                if newest_seen is not None and new_marks is not None:
+                    new_marks[sub] = newest_seen
+                elif newest_seen is not None and incremental:
+                    save_high_water_mark(sub, newest_seen, year, month, high_water_marks_path)
+            except ScrapeCancelled:
+                raise
+            except Exception as e:
+                print(f"Error accessing r/{sub}: {e}")
+                report_progress(progress, "subreddit_failed", subreddit=sub, error=str(e))
+                print(f"Skipping r/{sub} and continuing with other subreddits...")
+                continue
+            yield from finished_records()
+            time.sleep(1)  # polite pause between subreddits
+
+        print(f"Waiting for comments of {len(pending)} posts...")
+        yield from finished_records(block=True)
+    finally:
+        # Also reached when the consumer stops early or the scrape is cancelled
+        executor.shutdown(wait=False, cancel_futures=True)
+
     print(f"\nOVERALL STATS:")
-    date_range_desc = f"{year}-{month:02d}" if month else str(year)
     print(f"Total posts checked: {total_posts_checked}")
-    print(f"Posts in date range ({date_range_desc}): {posts_in_date_range}")
-    print(f"Relevant posts found: {len(items)}")
-    
-    return items
+    print(f"Posts in date range ({date_range_key}): {posts_in_date_range}")
+    print(f"Relevant posts found: {relevant_posts}")
+    metrics.inc("reddit_posts_checked_total", total_posts_checked)
+    metrics.inc("reddit_posts_in_range_total", posts_in_date_range)
+    metrics.inc("reddit_relevant_posts_total", relevant_posts)
+    report_progress(progress, "finished", posts_checked=total_posts_checked,
+                    posts_in_range=posts_in_date_range, relevant=relevant_posts)
 
-def run_scraper(limit=1000, year=2025, month=None, subreddits=None, keywords=None):
+def run_scraper(limit=1000, year=2025, month=None, subreddits=None, keywords=None, should_stop=None,
+                progress=None):
     """
     Main function to run the Reddit scraper with specified parameters.
 
@@ -186,7 +479,10 @@ def run_scraper(limit=1000, year=2025, month=None, subreddits=None, keywords=Non
         year (int): Year to search for posts
         month (int, optional): Specific month to search (1-12). If None, searches entire year.
         subreddits (list): List of subreddit names to search
-        keywords (list): List of keywords to search for
+        keywords (list): List of keywords to search for, or a KeywordMatcher
+            (e.g. one built with word_boundaries=True)
+        should_stop (callable, optional): Cancellation check, see fetch_new()
+        progress (callable, optional): Progress callback, see fetch_new()
 
     Returns:
         dict: Contains 'posts' and 'comments' data
@@ -206,8 +502,21 @@ def run_scraper(limit=1000, year=2025, month=None, subreddits=None, keywords=Non
     print("=" * 60)
 
     # Fetch the data
-    items = fetch_new(limit=limit, year=year, month=month, subreddits=subreddits, keywords=keywords)
+    items = fetch_new(limit=limit, year=year, month=month, subreddits=subreddits, keywords=keywords,
+                      should_stop=should_stop, progress=progress)
+
+    return items_to_scraper_data(items)
+
+def items_to_scraper_data(items):
+    """
+    Flatten fetch_new() records into the posts/comments rows returned by run_scraper().
 
+    Args:
+        items (list): Post records with nested comments
+
+    Returns:
+        dict: Contains 'posts' and 'comments' data
+    """
     # Prepare posts data
     posts_data = []
     comments_data = []
@@ -228,12 +537,13 @@ def run_scraper(limit=1000, year=2025, month=None, subreddits=None, keywords=Non
             'created_utc': item['created_utc'],
             'created_datetime': created_datetime,
             'num_comments': item['num_comments'],
-            'score': item['score']
+            'score': item['score'],
+            'keyword_hits': item.get('keyword_hits', 0)
         }
         posts_data.append(post_row)
 
         # Collect comments
-        for comment in item.get('comments', []):
+        for comment in item.get('comments') or []:
             comment_row = {
                 'post_id': item['id'],
                 'post_title': item['title'],
@@ -245,7 +555,8 @@ def run_scraper(limit=1000, year=2025, month=None, subreddits=None, keywords=Non
                 'created_datetime': datetime.fromtimestamp(comment['created_utc']).isoformat() if comment['created_utc'] else None,
                 'score': comment['score'],
                 'parent_id': comment['parent_id'],
-                'is_related': comment['is_related']
+                'is_related': comment['is_related'],
+                'keyword_hits': comment.get('keyword_hits', 0)
             }
             comments_data.append(comment_row)
 
@@ -0,0 +1,279 @@
+import os
+import threading
+from contextlib import contextmanager
+import pyarrow as pa
+import pyarrow.dataset as ds
+try:
+    import fcntl
+except ImportError:
+    # No cross-process partition locks on Windows, threads are still serialized
+    fcntl = None
+
+from src.records import Post, Comment
+
+# Root of the Parquet datasets, laid out as {kind}/subreddit=.../year=.../month=.../
+STORAGE_DIR = os.environ.get("CORPUS_DIR", "corpus")
+
+PARTITION_SCHEMA = pa.schema([
+    ("subreddit", pa.string()),
+    ("year", pa.int32()),
+    # 0 holds whole-year scrapes (month=None)
+    ("month", pa.int32()),
+])
+
+POST_SCHEMA = pa.schema([
+    ("source", pa.string()),
+    ("id", pa.string()),
+    ("unique_id", pa.string()),
+    ("title", pa.string()),
+    ("body", pa.string()),
+    ("url", pa.string()),
+    ("author", pa.string()),
+    ("created_utc", pa.float64()),
+    ("num_comments", pa.int64()),
+    ("score", pa.int64()),
+    ("keyword_hits", pa.int64()),
+    # False for posts whose comments were not fetched when the corpus was built
+    ("comments_fetched", pa.bool_()),
+] + list(PARTITION_SCHEMA))
+
+COMMENT_SCHEMA = pa.schema([
+    ("post_id", pa.string()),
+    ("comment_id", pa.string()),
+    ("author", pa.string()),
+    ("body", pa.string()),
+    ("created_utc", pa.float64()),
+    ("score", pa.int64()),
+    ("parent_id", pa.string()),
+    ("is_related", pa.bool_()),
+    ("keyword_hits", pa.int64()),
+] + list(PARTITION_SCHEMA))
+
+SCHEMAS = {"posts": POST_SCHEMA, "comments": COMMENT_SCHEMA}
+
+# (root, subreddit, year, month) -> threading.Lock
+_partition_locks = {}
+_partition_locks_lock = threading.Lock()
+
+
+def get_dataset(kind, root=STORAGE_DIR):
+    """Open the posts or comments dataset, or return None if nothing was written yet."""
+    path = os.path.join(root, kind)
+    if not os.path.exists(path):
+        return None
+    return ds.dataset(path, format="parquet", schema=SCHEMAS[kind],
+                      partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"))
+
+
+def build_filter(subreddits=None, year=None, month=None, extra=None):
+    """Combine partition predicates (pruned at the directory level) with an optional row filter."""
+    expression = None
+    predicates = []
+    if subreddits is not None:
+        predicates.append(ds.field("subreddit").isin(list(subreddits)))
+    if year is not None:
+        predicates.append(ds.field("year") == year)
+    if month is not None:
+        predicates.append(ds.field("month") == month)
+    if extra is not None:
+        predicates.append(extra)
+    for predicate in predicates:
+        expression = predicate if expression is None else expression & predicate
+    return expression
+
+
+def read_table(kind, columns=None, subreddits=None, year=None, month=None, filter=None, root=STORAGE_DIR):
+    """
+    Read posts or comments with column projection and predicate pushdown.
+
+    Args:
+        kind (str): "posts" or "comments"
+        columns (list, optional): Columns to load, all by default
+        subreddits (list, optional): Only read these subreddit partitions
+        year (int, optional): Only read this year's partitions
+        month (int, optional): Only read this month's partitions (0 for whole-year scrapes)
+        filter (pyarrow.dataset.Expression, optional): Extra row predicate, e.g. ds.field("score") > 10
+        root (str): Storage directory
+
+    Returns:
+        pyarrow.Table
+    """
+    dataset = get_dataset(kind, root)
+    if dataset is None:
+        schema = SCHEMAS[kind]
+        if columns is not None:
+            schema = pa.schema([schema.field(column) for column in columns])
+        return schema.empty_table()
+    return dataset.to_table(columns=columns, filter=build_filter(subreddits, year, month, filter))
+
+
+def read_posts(columns=None, subreddits=None, year=None, month=None, filter=None, root=STORAGE_DIR):
+    """Read post rows as a list of dicts, see read_table()."""
+    return read_table("posts", columns, subreddits, year, month, filter, root).to_pylist()
+
+
+def read_comments(columns=None, subreddits=None, year=None, month=None, filter=None, root=STORAGE_DIR):
+    """Read comment rows as a list of dicts, see read_table()."""
+    return read_table("comments", columns, subreddits, year, month, filter, root).to_pylist()
+
+
+def as_bool(value):
+    """A flag as a bool, also from the 'True'/'False' strings of CSV exports (None stays None)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1")
+    return bool(value)
+
+
+def as_int(value):
+    """A count as an int, also from CSV strings such as '3' or '3.0' (None stays None)."""
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+@contextmanager
+def partition_lock(subreddit, year, month=None, root=STORAGE_DIR):
+    """
+    Hold one (subreddit, year, month) partition exclusively, across the threads
+    and processes sharing the storage directory.
+
+    Wrap a whole read -> scrape -> write_partition() sequence in it, so that two
+    jobs needing the same month scrape it once and never write it at the same time.
+    """
+    key = (os.path.abspath(root), subreddit, year, month or 0)
+    with _partition_locks_lock:
+        lock = _partition_locks.setdefault(key, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(root, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{subreddit}_{year}_{month or 0}.lock"), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_partition(items, subreddit, year, month=None, root=STORAGE_DIR):
+    """
+    Replace the stored posts and comments of one (subreddit, year, month) partition.
+
+    Callers sharing the storage directory with other jobs hold partition_lock().
+
+    Args:
+        items (list): fetch_new() records, with "comments" None when they were not fetched
+        subreddit (str): Subreddit name
+        year (int): Year of the scrape
+        month (int, optional): Month of the scrape, None for a whole year
+        root (str): Storage directory
+    """
+    partition = {"subreddit": subreddit, "year": year, "month": month or 0}
+    post_rows = []
+    comment_rows = []
+    for item in items:
+        post_rows.append({
+            "source": item.get("source", "reddit"),
+            "id": item["id"],
+            "unique_id": item.get("unique_id"),
+            "title": item.get("title"),
+            "body": item.get("body"),
+            "url": item.get("url"),
+            "author": item.get("author"),
+            "created_utc": item.get("created_utc"),
+            "num_comments": as_int(item.get("num_comments")),
+            "score": as_int(item.get("score")),
+            "keyword_hits": as_int(item.get("keyword_hits")),
+            "comments_fetched": item.get("comments") is not None,
+            **partition
+        })
+        for comment in item.get("comments") or []:
+            comment_rows.append({
+                "post_id": item["id"],
+                "comment_id": comment["comment_id"],
+                "author": comment.get("author"),
+                "body": comment.get("body"),
+                "created_utc": comment.get("created_utc"),
+                "score": as_int(comment.get("score")),
+                "parent_id": comment.get("parent_id"),
+                "is_related": as_bool(comment.get("is_related")),
+                "keyword_hits": as_int(comment.get("keyword_hits")),
+                **partition
+            })
+
+    partitioning = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+    for kind, rows in (("posts", post_rows), ("comments", comment_rows)):
+        table = pa.Table.from_pylist(rows, schema=SCHEMAS[kind])
+        path = os.path.join(root, kind)
+        if not rows:
+            # Nothing to write, but stale files of the partition must still go
+            partition_dir = os.path.join(path, f"subreddit={subreddit}", f"year={year}", f"month={month or 0}")
+            for name in os.listdir(partition_dir) if os.path.isdir(partition_dir) else []:
+                os.remove(os.path.join(partition_dir, name))
+            continue
+        ds.write_dataset(table, path, format="parquet", partitioning=partitioning,
+                         basename_template="part-{i}.parquet",
+                         existing_data_behavior="delete_matching")
+
+
+def read_partition(subreddit, year, month=None, root=STORAGE_DIR):
+    """
+    Load one (subreddit, year, month) partition back into fetch_new() records.
+
+    Returns:
+        list: Post records with nested comments (None where they were not fetched),
+        or None if the partition was never written
+    """
+    posts = read_posts(subreddits=[subreddit], year=year, month=month or 0, root=root)
+    if not posts:
+        return None
+
+    comments_by_post = {}
+    comment_columns = [name for name in COMMENT_SCHEMA.names if name not in PARTITION_SCHEMA.names]
+    for comment in read_comments(columns=comment_columns, subreddits=[subreddit], year=year,
+                                 month=month or 0, root=root):
+        comments_by_post.setdefault(comment["post_id"], []).append(comment)
+
+    items = []
+    for post in posts:
+        fetched = post.pop("comments_fetched")
+        for key in ("year", "month"):
+            post.pop(key)
+        post["comments"] = comments_by_post.get(post["id"], []) if fetched else None
+        items.append(post)
+    return items
+
+
+def read_partition_records(subreddit, year, month=None, root=STORAGE_DIR):
+    """
+    Load one partition like read_partition(), but into compact Post and Comment
+    records built straight from the Arrow columns, without a dict per row.
+
+    Returns:
+        list: Post records with their Comment lists, or None if the partition was never written
+    """
+    post_columns = [name for name in POST_SCHEMA.names if name not in ("year", "month")]
+    posts = read_table("posts", columns=post_columns, subreddits=[subreddit], year=year, month=month or 0,
+                       root=root)
+    if posts.num_rows == 0:
+        return None
+    posts = posts.to_pydict()
+
+    comment_columns = [name for name in COMMENT_SCHEMA.names if name not in PARTITION_SCHEMA.names]
+    comments = read_table("comments", columns=comment_columns, subreddits=[subreddit], year=year,
+                          month=month or 0, root=root).to_pydict()
+    comments_by_post = {}
+    for row in zip(*comments.values()):
+        comment = Comment(**dict(zip(comment_columns, row)))
+        comments_by_post.setdefault(comment.post_id, []).append(comment)
+
+    items = []
+    for row in zip(*posts.values()):
+        fields = dict(zip(posts.keys(), row))
+        fetched = fields.pop("comments_fetched")
+        items.append(Post(**fields, comments=comments_by_post.get(fields["id"], []) if fetched else None))
+    return items
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import hashlib
+from types import SimpleNamespace
+
+# configure via env vars
+# "live" talks to the services, "record" also saves every exchange to the cassettes,
+# "replay" answers from the cassettes only and never touches the network
+TRANSPORT_MODE = os.environ.get("TRANSPORT_MODE", "live")
+CASSETTE_DIR = os.environ.get("CASSETTE_DIR", "cassettes")
+# Replay delay per request: seconds, or "recorded" to reproduce the recorded latency
+REPLAY_LATENCY = os.environ.get("REPLAY_LATENCY", "0")
+
+MODES = ("live", "record", "replay")
+# Reddit OAuth token endpoint, whose tokens are never written to disk
+REDDIT_TOKEN_URL = "https://www.reddit.com/api/v1/access_token"
+# Form fields of OAuth requests that hold secrets
+SECRET_FIELDS = ("password", "refresh_token", "code")
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def request_key(*parts):
+    """Stable hash of a request's identifying parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def simulate_latency(entry):
+    if REPLAY_LATENCY == "recorded":
+        delay = entry.get("elapsed", 0)
+    else:
+        delay = float(REPLAY_LATENCY)
+    if delay > 0:
+        time.sleep(delay)
+
+
+class Cassette:
+    """
+    Recorded request/response pairs of one service, one JSON file per request key.
+
+    Separate files keep concurrent recording threads and processes from
+    clobbering each other, and keep cassette diffs readable.
+    """
+
+    def __init__(self, name, cassette_dir=None):
+        self.path = os.path.join(cassette_dir or CASSETTE_DIR, name)
+
+    def get(self, key):
+        path = os.path.join(self.path, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, key, request, response, elapsed):
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"request": request, "response": response, "elapsed": elapsed}, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+# OpenAI
+
+def completion_key(model, messages, temperature, **options):
+    # Plain completions keep the keys they were recorded under before options were keyed
+    if options:
+        return request_key("chat.completions", model, messages, temperature, options)
+    return request_key("chat.completions", model, messages, temperature)
+
+
+def completion_response(content, prompt_tokens=None, completion_tokens=None, top_logprobs=None, finish_reason=None):
+    """Build the slice of an OpenAI chat completion response the pipeline reads."""
+    usage = None
+    if prompt_tokens is not None:
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    logprobs = None
+    if top_logprobs:
+        alternatives = [SimpleNamespace(token=token, logprob=logprob) for token, logprob in top_logprobs]
+        logprobs = SimpleNamespace(content=[SimpleNamespace(token=alternatives[0].token,
+                                                            logprob=alternatives[0].logprob,
+                                                            top_logprobs=alternatives)])
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), logprobs=logprobs,
+                                                    finish_reason=finish_reason)],
+                           usage=usage)
+
+
+def first_token_logprobs(response):
+    """(token, logprob) alternatives of a response's first token, or [] without logprobs."""
+    logprobs = getattr(response.choices[0], "logprobs", None)
+    content = getattr(logprobs, "content", None)
+    if not content:
+        return []
+    first = content[0]
+    alternatives = getattr(first, "top_logprobs", None) or [first]
+    return [(alternative.token, alternative.logprob) for alternative in alternatives]
+
+
+class RecordingOpenAIClient:
+    """Wraps a live openai.OpenAI client and saves every chat completion to the cassette."""
+
+    def __init__(self, client, cassette):
+        self.client = client
+        self.cassette = cassette
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature=None, **kwargs):
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(model=model, messages=messages, temperature=temperature,
+                                                       **kwargs)
+        usage = getattr(response, "usage", None)
+        self.cassette.put(
+            completion_key(model, messages, temperature, **kwargs),
+            {"model": model, "messages": messages, "temperature": temperature, **kwargs},
+            {"content": response.choices[0].message.content,
+             "prompt_tokens": getattr(usage, "prompt_tokens", None),
+             "completion_tokens": getattr(usage, "completion_tokens", None),
+             "top_logprobs": first_token_logprobs(response),
+             "finish_reason": getattr(response.choices[0], "finish_reason", None)},
+            time.perf_counter() - start
+        )
+        return response
+
+
+class ReplayOpenAIClient:
+    """Answers chat completions from the cassette, raising CassetteMiss for unrecorded requests."""
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, temperature=None, **kwargs):
+        entry = self.cassette.get(completion_key(model, messages, temperature, **kwargs))
+        if entry is None:
+            raise CassetteMiss(f"No recorded completion for model {model} and this prompt in {self.cassette.path}")
+        simulate_latency(entry)
+        response = entry["response"]
+        return completion_response(response["content"], response.get("prompt_tokens"),
+                                   response.get("completion_tokens"), response.get("top_logprobs"),
+                                   response.get("finish_reason"))
+
+
+def get_openai_client(**kwargs):
+    """Return the OpenAI client for TRANSPORT_MODE. Replay needs neither the SDK's API key nor the network."""
+    if TRANSPORT_MODE not in MODES:
+        raise ValueError(f"TRANSPORT_MODE must be one of {MODES}, got {TRANSPORT_MODE!r}")
+    cassette = Cassette("openai")
+    if TRANSPORT_MODE == "replay":
+        return ReplayOpenAIClient(cassette)
+
+    import openai
+    client = openai.OpenAI(**kwargs)
+    if TRANSPORT_MODE == "record":
+        return RecordingOpenAIClient(client, cassette)
+    return client
+
+
+# Reddit
+
+reddit_cassette = Cassette("reddit")
+
+
+def _reddit_request_parts(args, kwargs):
+    method = kwargs.get("method", args[0] if args else None)
+    url = kwargs.get("url", args[1] if len(args) > 1 else None)
+    data = kwargs.get("data")
+    if isinstance(data, dict):
+        data = sorted(data.items())
+    if data:
+        data = [[k, "<redacted>" if k in SECRET_FIELDS else v] for k, v in data]
+    # Headers and auth carry credentials and tokens, they are not part of the request identity
+    return {"method": (method or "").upper(), "url": url, "params": kwargs.get("params"),
+            "data": data, "json": kwargs.get("json")}
+
+
+def record_reddit_response(args, kwargs, response, elapsed):
+    """Save a prawcore HTTP exchange, redacting OAuth tokens."""
+    request = _reddit_request_parts(args, kwargs)
+    body = response.text
+    if request["url"] == REDDIT_TOKEN_URL:
+        try:
+            token = json.loads(body)
+            token["access_token"] = "replay-token"
+            body = json.dumps(token)
+        except ValueError:
+            pass
+    reddit_cassette.put(
+        request_key(request),
+        request,
+        {"status_code": response.status_code,
+         "headers": {k: v for k, v in response.headers.items() if k.lower() != "set-cookie"},
+         "body": body,
+         "url": response.url},
+        elapsed
+    )
+
+
+def replay_reddit_response(args, kwargs):
+    """Rebuild a recorded prawcore HTTP response as a requests.Response."""
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    request = _reddit_request_parts(args, kwargs)
+    entry = reddit_cassette.get(request_key(request))
+    if entry is None:
+        raise CassetteMiss(f"No recorded Reddit response for {request['method']} {request['url']} "
+                           f"{request['params']} in {reddit_cassette.path}")
+    simulate_latency(entry)
+    recorded = entry["response"]
+    response = requests.Response()
+    response.status_code = recorded["status_code"]
+    response.headers = CaseInsensitiveDict(recorded["headers"])
+    # The body is stored decoded, so drop encodings of the original transfer, and
+    # drop the rate limit headers so prawcore does not throttle a replay
+    for header in ("content-encoding", "x-ratelimit-remaining", "x-ratelimit-used", "x-ratelimit-reset"):
+        response.headers.pop(header, None)
+    response._content = recorded["body"].encode("utf-8")
+    response.encoding = "utf-8"
+    response.url = recorded["url"]
+    return response
@@ -1,10 +1,70 @@
+import os
 import re
 import json
+from concurrent.futures import ThreadPoolExecutor
+from src import metrics
+
+# Default size of the worker pools used for LLM calls
+MAX_WORKERS = int(os.environ.get("OPENAI_MAX_WORKERS", 8))
+
 
 def parse_result(result):
-    matches = re.search(r'```json(.*)```', result, re.DOTALL)
+    matches = re.search(r'```json(.*)```', result or "", re.DOTALL)
     if matches:
-        return json.loads(matches.group(1))
+        try:
+            return json.loads(matches.group(1))
+        except json.JSONDecodeError:
+            metrics.inc("llm_parse_failures_total", reason="invalid_json")
+            raise
+    metrics.inc("llm_parse_failures_total", reason="no_json_block")
     return None
 
 
+def estimate_tokens(text):
+    """Rough token count for budgeting (about 4 characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def chunk_by_token_budget(items, token_budget, count_tokens):
+    """
+    Split items into consecutive chunks whose estimated size stays within a token budget.
+
+    An item larger than the budget gets a chunk of its own.
+
+    Args:
+        items: Items to split
+        token_budget: Maximum tokens per chunk
+        count_tokens: Function returning the token estimate of one item
+
+    Returns:
+        List of lists of items
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for item in items:
+        item_tokens = count_tokens(item)
+        if current and current_tokens + item_tokens > token_budget:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def map_concurrently(func, items, max_workers=None):
+    """
+    Apply func to every item with a bounded thread pool.
+
+    Results are returned in input order. With max_workers=1 the items are
+    processed sequentially in the calling thread.
+    """
+    items = list(items)
+    max_workers = max_workers or MAX_WORKERS
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(func, items))
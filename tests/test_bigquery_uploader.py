@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("google.cloud.bigquery")
+from src import bigquery_uploader  # noqa: E402
+
+
+def test_failed_flush_keeps_the_reports(monkeypatch):
+    inserted = []
+
+    def insert_reports(reports, **kwargs):
+        if not inserted:
+            inserted.append(None)
+            raise Exception("Error inserting reports")
+        inserted.append([r["agency"] for r in reports])
+
+    monkeypatch.setattr(bigquery_uploader, "insert_reports", insert_reports)
+    batch = bigquery_uploader.ReportUploadBatch(project_id="test")
+    batch.add("MBTA", 9, 2025, "report")
+
+    with pytest.raises(Exception):
+        batch.flush()
+    batch.add("BPD", 9, 2025, "report")
+    batch.flush()
+
+    assert inserted[1:] == [["MBTA", "BPD"]]
+    assert batch.reports == []
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("praw")
+from src.corpus import build_corpus, get_agency_data  # noqa: E402
+from src import corpus as corpus_module  # noqa: E402
+
+
+def item(post_id, title, comments):
+    return {"source": "reddit", "subreddit": "boston", "id": post_id, "title": title, "body": "",
+            "created_utc": 1757000000.0, "keyword_hits": 1,
+            "comments": [{"comment_id": f"{post_id}{i}", "body": body, "parent_id": f"t3_{post_id}",
+                          "is_related": True, "keyword_hits": 1} for i, body in enumerate(comments)]}
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    items = [item("a", "Red line delays again", ["the mbta is late", "snow on storrow drive"]),
+             item("b", "Storrow drive crash", ["traffic on storrow", "red line too"])]
+    monkeypatch.setattr(corpus_module, "fetch_new", lambda **kwargs: items)
+    monkeypatch.setattr(corpus_module, "save_high_water_mark", lambda *args, **kwargs: None)
+    build_corpus(year=2025, month=9, subreddits=["boston"], keywords=["red line", "storrow"],
+                 corpus_dir=str(tmp_path))
+    # Reloaded from storage, as a later run would
+    return build_corpus(year=2025, month=9, subreddits=["boston"], keywords=["red line", "storrow"],
+                        corpus_dir=str(tmp_path))
+
+
+def comment_flags(data):
+    return {comment.comment_id: (comment.is_related, comment.keyword_hits) for comment in data["comments"]}
+
+
+def test_comment_flags_are_per_agency(corpus, tmp_path):
+    transit = get_agency_data(corpus, ["red line", "mbta"], 2025, 9, corpus_dir=str(tmp_path))
+    roads = get_agency_data(corpus, ["storrow"], 2025, 9, corpus_dir=str(tmp_path))
+
+    assert [post.id for post in transit["posts"]] == ["a"]
+    assert comment_flags(transit) == {"a0": (True, 1), "a1": (False, 0)}
+    assert [post.id for post in roads["posts"]] == ["b"]
+    assert comment_flags(roads) == {"b0": (True, 1), "b1": (False, 0)}
+    # The shared corpus keeps the flags of the scrape
+    assert corpus.comments_for("a")[1].is_related is True
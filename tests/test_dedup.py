@@ -0,0 +1,41 @@
+from src.dedup import find_clusters, collapse_duplicate_posts, collapse_duplicate_comments
+
+STORY = ("The red line train derailed near JFK station this morning and the MBTA says shuttle buses "
+         "are replacing service for the rest of the week")
+
+
+def test_find_clusters_groups_near_duplicates():
+    texts = [STORY, "Completely unrelated post about my cat", STORY + " (crosspost)", ""]
+    assert find_clusters(texts) == [[0, 2], [1], [3]]
+
+
+def test_empty_texts_never_match():
+    assert find_clusters(["", "", None]) == [[0], [1], [2]]
+
+
+def test_collapse_duplicate_posts_keeps_the_most_commented_copy():
+    posts = [{"id": "a", "subreddit": "boston", "title": "Red line derailed", "body": STORY, "num_comments": 1},
+             {"id": "b", "subreddit": "massachusetts", "title": "Red line derailed", "body": STORY,
+              "num_comments": 5},
+             {"id": "c", "subreddit": "boston", "title": "Cat pics", "body": "my cat", "num_comments": 0}]
+    comments = [{"comment_id": "x", "post_id": "a"}, {"comment_id": "y", "post_id": "c"}]
+
+    representatives, remapped = collapse_duplicate_posts(posts, comments)
+
+    assert [post["id"] for post in representatives] == ["b", "c"]
+    assert representatives[0]["duplicate_ids"] == ["a"]
+    assert representatives[0]["duplicate_subreddits"] == ["boston", "massachusetts"]
+    assert [comment["post_id"] for comment in remapped] == ["b", "c"]
+
+
+def test_collapse_duplicate_comments_keeps_the_highest_score():
+    bot = "I am a bot, and this action was performed automatically. Please contact the moderators"
+    comments = [{"comment_id": "1", "body": bot, "score": 1},
+                {"comment_id": "2", "body": "the shuttle buses were packed", "score": 3},
+                {"comment_id": "3", "body": bot, "score": 7}]
+
+    collapsed = collapse_duplicate_comments(comments)
+
+    assert [comment["comment_id"] for comment in collapsed] == ["3", "2"]
+    assert collapsed[0]["duplicate_ids"] == ["1"]
+    assert collapse_duplicate_comments(comments[:1]) == comments[:1]
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+pytest.importorskip("openai")
+# The client is built on import, it is never called here
+os.environ.setdefault("OPENAI_API_KEY", "test")
+from src import filtering  # noqa: E402
+
+TRUNCATED = '```json\n[{"comment_id": "0", "is_rel'
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    """Answer every comment chunk with `answer`, counting the calls."""
+    state = {"answer": (TRUNCATED, "length"), "calls": 0}
+
+    def get_completion_with_finish_reason(system_prompt, prompt):
+        state["calls"] += 1
+        return state["answer"]
+
+    monkeypatch.setattr(filtering, "get_completion_with_finish_reason", get_completion_with_finish_reason)
+    monkeypatch.setattr(filtering, "invalidate_completion", lambda *args, **kwargs: None)
+    return state
+
+
+def chunk(size):
+    return [{"comment_id": str(i), "body": f"comment {i}"} for i in range(size)]
+
+
+def test_truncated_answers_split_at_most_twice(answers):
+    assert filtering.classify_comments_chunk("post", chunk(8), "topic") == {}
+    # 1 + 2 + 4 calls, never down to single comments
+    assert answers["calls"] == 7
+
+
+def test_other_bad_answers_are_not_split(answers):
+    answers["answer"] = ("I can't help with that.", "stop")
+    assert filtering.classify_comments_chunk("post", chunk(8), "topic") == {}
+    assert answers["calls"] == 1
+
+
+def test_verdicts_are_read_by_comment_id(answers):
+    answers["answer"] = ('```json\n[{"comment_id": "0", "is_relevant": true}, '
+                         '{"comment_id": "1", "is_relevant": false}]\n```', "stop")
+    assert filtering.classify_comments_chunk("post", chunk(2), "topic") == {"0": True, "1": False}
+
+
+def test_prefilter_counts_kept_and_dropped_posts(monkeypatch):
+    monkeypatch.setattr(filtering, "filter_posts", lambda posts, topic, **kwargs: [])
+    filtering.metrics.registry.reset()
+    posts = [{"id": "a", "title": "Red line delays on the MBTA"},
+             {"id": "b", "title": "Best pizza in the North End"},
+             {"id": "c", "title": "MBTA bus shuttles replace the Red line"}]
+
+    filtering.get_filtered_posts_and_comments(posts, [], "MBTA Red line service", prefilter_top_k=2)
+
+    counts = {c["labels"]["result"]: c["value"] for c in filtering.metrics.registry.snapshot()["counters"]
+              if c["name"] == "prefilter_posts_total"}
+    assert counts == {"kept": 2, "dropped": 1}
+
+
+def test_comments_of_each_post_are_not_filtered_on_a_nested_pool(monkeypatch):
+    workers = []
+
+    def filter_comments(post, comments, topic, max_workers=None, checkpoint=None):
+        workers.append(max_workers)
+        return comments
+
+    monkeypatch.setattr(filtering, "filter_posts", lambda posts, topic, **kwargs: posts)
+    monkeypatch.setattr(filtering, "filter_comments", filter_comments)
+    posts = [{"id": str(i), "title": f"post {i}"} for i in range(4)]
+
+    filtering.get_filtered_posts_and_comments(posts, [], "topic", max_workers=4)
+
+    assert workers == [1, 1, 1, 1]
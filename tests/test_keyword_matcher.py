@@ -0,0 +1,71 @@
+import pytest
+
+from src.keyword_matcher import KeywordMatcher, get_matcher
+
+KEYWORDS = ["MBTA", "MBTA bus", "red line", "T"]
+TEXTS = [
+    "The MBTA bus was late again, then the mbta shuttle broke down.",
+    "Red Line delays: red line trains held at Park St.",
+    "Took the MBTA Bus to the MBTA bus stop near the T",
+    "",
+    "nothing relevant here",
+]
+
+
+def substring_counts(keywords, text):
+    """The plain `k in text` check the matcher replaced, as occurrence counts."""
+    text = text.lower()
+    return {k.lower(): text.count(k.lower()) for k in keywords if text.count(k.lower())}
+
+
+def test_overlapping_keywords_are_both_counted():
+    matcher = KeywordMatcher(["MBTA", "MBTA bus"])
+    assert matcher.counts("the MBTA bus and the MBTA") == {"mbta": 2, "mbta bus": 1}
+    assert matcher.score("the MBTA bus and the MBTA") == 3
+
+
+def test_matching_is_case_insensitive():
+    matcher = KeywordMatcher(["Red Line"])
+    assert matcher.matches("RED LINE shutdown")
+    assert matcher.counts("red line, Red Line, rEd LiNe") == {"red line": 3}
+
+
+def test_substring_matches_without_word_boundaries():
+    matcher = KeywordMatcher(["T", "bus"])
+    assert matcher.counts("buses at the station") == {"bus": 1, "t": 4}
+
+
+def test_word_boundaries_only_match_whole_words():
+    matcher = KeywordMatcher(["T", "bus", "MBTA"], word_boundaries=True)
+    assert not matcher.matches("buses at the station")
+    assert matcher.counts("Took the T, then a bus (MBTA).") == {"t": 1, "bus": 1, "mbta": 1}
+    # A shorter keyword followed by a word character is not a whole word
+    assert KeywordMatcher(["MBTA", "MBTA bus"], word_boundaries=True).counts("MBTA buses") == {"mbta": 1}
+
+
+@pytest.mark.parametrize("word_boundaries", [False, True])
+def test_regex_metacharacters_are_literal(word_boundaries):
+    matcher = KeywordMatcher(["C++", "a.b", "(T)", "[x]"], word_boundaries=word_boundaries)
+    assert matcher.counts("c++ and a.b and (t) and [x]") == {"c++": 1, "a.b": 1, "(t)": 1, "[x]": 1}
+    assert not matcher.matches("axb cc (tt) x")
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_counts_agree_with_substring_counting(text):
+    matcher = get_matcher(KEYWORDS)
+    assert dict(matcher.counts(text)) == substring_counts(KEYWORDS, text)
+    assert matcher.matches(text) == any(k.lower() in text.lower() for k in KEYWORDS)
+
+
+def test_empty_keyword_set_never_matches():
+    matcher = KeywordMatcher([""])
+    assert len(matcher) == 0
+    assert not matcher.matches("anything")
+    assert matcher.score("anything") == 0
+
+
+def test_matchers_are_cached_per_keyword_set():
+    assert get_matcher(KEYWORDS) is get_matcher(list(KEYWORDS))
+    assert get_matcher(KEYWORDS, word_boundaries=True) is not get_matcher(KEYWORDS)
+    matcher = KeywordMatcher(KEYWORDS)
+    assert get_matcher(matcher) is matcher
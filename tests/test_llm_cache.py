@@ -0,0 +1,54 @@
+import pytest
+
+from src.llm_cache import CompletionCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CompletionCache(path=str(tmp_path / "cache.sqlite3"), ttl=0, max_entries=1000)
+
+
+def test_keys_depend_on_every_request_part():
+    key = CompletionCache.make_key("gpt-4o-mini", "system", "prompt", 0.7)
+    assert key == CompletionCache.make_key("gpt-4o-mini", "system", "prompt", 0.7)
+    assert key != CompletionCache.make_key("gpt-4o", "system", "prompt", 0.7)
+    assert key != CompletionCache.make_key("gpt-4o-mini", "system", "prompt", 0)
+    assert key != CompletionCache.make_key("gpt-4o-mini", "system", "prompt", 0.7, max_tokens=1)
+
+
+def test_set_get_delete(cache):
+    assert cache.get("key") is None
+    cache.set("key", "gpt-4o-mini", "answer")
+    assert cache.get("key") == "answer"
+    cache.delete("key")
+    assert cache.get("key") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache = CompletionCache(path=str(tmp_path / "cache.sqlite3"), ttl=60)
+    now = [1000.0]
+    monkeypatch.setattr("src.llm_cache.time.time", lambda: now[0])
+    cache.set("key", "gpt-4o-mini", "answer")
+    now[0] += 59
+    assert cache.get("key") == "answer"
+    now[0] += 2
+    assert cache.get("key") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.llm_cache.EVICTION_INTERVAL", 1)
+    cache = CompletionCache(path=str(tmp_path / "cache.sqlite3"), ttl=0, max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr("src.llm_cache.time.time", lambda: now[0])
+    for key in ("a", "b"):
+        now[0] += 1
+        cache.set(key, "gpt-4o-mini", key)
+    now[0] += 1
+    cache.get("a")
+    now[0] += 1
+    cache.set("c", "gpt-4o-mini", "c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "a" and cache.get("c") == "c"
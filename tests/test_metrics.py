@@ -0,0 +1,32 @@
+from src.metrics import MetricsRegistry, merge_snapshots, to_prometheus
+
+
+def snapshot_with(buckets, *values, **labels):
+    registry = MetricsRegistry()
+    registry.inc("jobs_total", kind="report")
+    for value in values:
+        registry.observe("job_duration_seconds", value, buckets=buckets, **labels)
+    return registry.snapshot()
+
+
+def test_matching_histograms_are_added_up():
+    merged = merge_snapshots([snapshot_with((1, 10), 0.5, 5), snapshot_with((1, 10), 20)])
+
+    assert merged["counters"] == [{"name": "jobs_total", "labels": {"kind": "report"}, "value": 2}]
+    [h] = merged["histograms"]
+    assert (h["labels"], h["buckets"], h["counts"], h["count"], h["sum"]) == ({}, [1, 10], [1, 1], 3, 25.5)
+
+
+def test_histograms_with_other_buckets_are_kept_apart():
+    merged = merge_snapshots([snapshot_with((1, 10), 0.5), snapshot_with((1, 10), 5),
+                              snapshot_with((5, 60), 30, 2), snapshot_with((1, 10), 1, kind="scrape")])
+
+    series = {(h["labels"].get("kind"), h["labels"].get("buckets")): (h["buckets"], h["counts"], h["count"])
+              for h in merged["histograms"]}
+    assert series == {
+        (None, "1,10"): ([1, 10], [1, 1], 2),
+        (None, "5,60"): ([5, 60], [1, 1], 2),
+        # Only series that actually disagree get the label
+        ("scrape", None): ([1, 10], [1, 0], 1),
+    }
+    assert 'crash_reports_job_duration_seconds_count{buckets="5,60"} 2' in to_prometheus(merged)
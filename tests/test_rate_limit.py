@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from src.rate_limit import TokenBucket, RateLimiter
+
+
+def test_bucket_serves_its_capacity_without_waiting():
+    bucket = TokenBucket(rate_per_minute=60, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Refilled at one token per second
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+
+def test_oversized_reservations_are_capped_at_the_capacity():
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(1000) == pytest.approx(10.0, abs=0.05)
+
+
+def test_limiter_waits_for_the_tokens_quota(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=600)
+    limiter.acquire(600)
+    assert sleeps == []
+    limiter.acquire(60)
+    assert sleeps == [pytest.approx(6.0, abs=0.05)]
+
+
+def test_pause_holds_every_caller(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    limiter = RateLimiter(requests_per_minute=600)
+    limiter.pause(5)
+    limiter.acquire()
+    assert sleeps == [pytest.approx(5.0, abs=0.05)]
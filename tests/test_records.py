@@ -0,0 +1,68 @@
+import pytest
+
+from src.records import Comment, Post, Corpus
+
+
+def item(post_id, subreddit, comments):
+    return {"source": "reddit", "subreddit": subreddit, "id": post_id, "title": f"Post {post_id}", "body": "",
+            "keyword_hits": 1,
+            "comments": None if comments is None else [
+                {"comment_id": comment_id, "body": f"Comment {comment_id}", "parent_id": parent_id,
+                 "is_related": False, "keyword_hits": 0}
+                for comment_id, parent_id in comments]}
+
+
+@pytest.fixture
+def corpus():
+    return Corpus.from_items({
+        "boston": [item("a", "boston", [("a1", "t3_a"), ("a2", "t1_a1")]), item("b", "boston", None)],
+        "cambridge": [item("c", "cambridge", [("c1", "t3_c")])],
+    })
+
+
+def test_records_read_like_dicts():
+    post = Post.from_item(item("a", "boston", [("a1", "t3_a")]))
+    assert post["id"] == "a"
+    assert post.get("title") == "Post a"
+    assert post.get("missing", "default") == "default"
+    assert "subreddit" in post and "missing" not in post
+    assert {**post}["subreddit"] == "boston"
+    with pytest.raises(KeyError):
+        post["missing"]
+    assert isinstance(post.comments[0], Comment)
+    assert post.comments[0].post_id == "a"
+
+
+def test_copy_shares_fields_and_overrides_some():
+    post = Post.from_item(item("a", "boston", [("a1", "t3_a")]))
+    copy = post.copy(keyword_hits=5)
+    assert copy.keyword_hits == 5 and post.keyword_hits == 1
+    assert copy.comments is post.comments
+    assert copy.to_dict() == {**post.to_dict(), "keyword_hits": 5}
+
+
+def test_interned_fields_are_shared():
+    first = Comment(author="".join(["some", "one"]))
+    second = Comment(author="".join(["some", "one"]))
+    assert first.author is second.author
+
+
+def test_corpus_indexes(corpus):
+    assert len(corpus) == 3
+    assert [comment.comment_id for comment in corpus.comments_for("a")] == ["a1", "a2"]
+    assert corpus.comments_for("b") == []
+    assert corpus.comments_for("unknown") == []
+    assert [comment.comment_id for comment in corpus.replies_to("t1_a1")] == ["a2"]
+    assert [post.id for post in corpus["boston"]] == ["a", "b"]
+
+
+def test_select_and_set_comments(corpus):
+    selected = corpus.select([corpus.posts_by_id["a"], corpus.posts_by_id["c"]])
+    assert sorted(selected.posts_by_subreddit) == ["boston", "cambridge"]
+    assert len(selected) == 3
+
+    post = corpus.posts_by_id["b"]
+    assert corpus.replies_to("t3_b") == []
+    corpus.set_comments(post, [{"comment_id": "b1", "parent_id": "t3_b"}])
+    assert [comment.comment_id for comment in corpus.replies_to("t3_b")] == ["b1"]
+    assert corpus.comments_for("b")[0].post_id == "b"
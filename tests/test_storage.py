@@ -0,0 +1,44 @@
+import csv
+
+from src.storage import write_partition, read_partition, read_partition_records
+
+
+def csv_rows(tmp_path, rows):
+    """Rows as they come back from a scraper CSV export, every value a string."""
+    path = tmp_path / "export.csv"
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_partition_from_csv_shaped_records(tmp_path):
+    comments = csv_rows(tmp_path, [
+        {"comment_id": "c1", "body": "the mbta is late", "score": "4", "is_related": "True", "keyword_hits": "3"},
+        {"comment_id": "c2", "body": "nice weather", "score": "", "is_related": "False", "keyword_hits": "0.0"},
+    ])
+    items = [{"id": "p1", "subreddit": "boston", "title": "Red line", "num_comments": "2", "score": "10",
+              "keyword_hits": "1", "comments": comments}]
+
+    write_partition(items, "boston", 2025, 9, root=str(tmp_path))
+
+    [post] = read_partition_records("boston", 2025, 9, root=str(tmp_path))
+    assert (post.num_comments, post.score, post.keyword_hits) == (2, 10, 1)
+    assert [(c.comment_id, c.score, c.is_related, c.keyword_hits) for c in post.comments] == [
+        ("c1", 4, True, 3), ("c2", None, False, 0)]
+
+
+def test_partition_round_trip(tmp_path):
+    items = [{"id": "p1", "title": "t", "keyword_hits": 2,
+              "comments": [{"comment_id": "c1", "body": "b", "is_related": True, "keyword_hits": 1}]},
+             {"id": "p2", "title": "u", "keyword_hits": 0, "comments": None}]
+
+    write_partition(items, "boston", 2025, 9, root=str(tmp_path))
+
+    loaded = read_partition("boston", 2025, 9, root=str(tmp_path))
+    assert [(post["id"], post["keyword_hits"]) for post in loaded] == [("p1", 2), ("p2", 0)]
+    assert loaded[0]["comments"][0]["is_related"] is True
+    assert loaded[1]["comments"] is None
+    assert read_partition("boston", 2025, 10, root=str(tmp_path)) is None
@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src import transport
+
+praw = pytest.importorskip("praw")
+requests = pytest.importorskip("requests")
+from src.scrape_reddit import LimitedRequestor  # noqa: E402
+
+
+TOKEN_RESPONSE = {"access_token": "secret-token", "token_type": "bearer", "expires_in": 86400, "scope": "*"}
+
+
+def listing(*post_ids):
+    children = [{"kind": "t3", "data": {"id": post_id, "name": f"t3_{post_id}", "title": f"Post {post_id}",
+                                        "selftext": "", "created_utc": 1757000000.0 - i,
+                                        "subreddit": "boston"}}
+                for i, post_id in enumerate(post_ids)]
+    return {"kind": "Listing", "data": {"children": children, "after": None, "before": None}}
+
+
+def make_response(url, payload):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["content-type"] = "application/json; charset=UTF-8"
+    response._content = json.dumps(payload).encode()
+    response.url = url
+    return response
+
+
+class FakeSession(requests.Session):
+    """Answers Reddit's token and listing endpoints without the network."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        if url == transport.REDDIT_TOKEN_URL:
+            return make_response(url, TOKEN_RESPONSE)
+        if url.startswith("https://oauth.reddit.com/r/boston/new"):
+            return make_response(url, listing("a1", "a2", "a3"))
+        raise AssertionError(f"Unexpected request {method} {url}")
+
+
+class OfflineSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        raise AssertionError(f"Replay reached the network: {method} {url}")
+
+
+@pytest.fixture
+def cassette_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(transport, "reddit_cassette", transport.Cassette("reddit", str(tmp_path)))
+    monkeypatch.setattr(transport, "REPLAY_LATENCY", "0")
+    return tmp_path / "reddit"
+
+
+def new_post_ids(session):
+    reddit = praw.Reddit(client_id="client", client_secret="secret", user_agent="crash-reports tests",
+                         requestor_class=LimitedRequestor, requestor_kwargs={"session": session})
+    return [post.id for post in reddit.subreddit("boston").new(limit=3)]
+
+
+def test_reddit_record_then_replay(cassette_dir, monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(transport, "TRANSPORT_MODE", "record")
+    recorded = new_post_ids(session)
+    assert recorded == ["a1", "a2", "a3"]
+    assert len(session.requests) == 2
+
+    monkeypatch.setattr(transport, "TRANSPORT_MODE", "replay")
+    assert new_post_ids(OfflineSession()) == recorded
+
+
+def test_reddit_cassette_redacts_the_access_token(cassette_dir, monkeypatch):
+    monkeypatch.setattr(transport, "TRANSPORT_MODE", "record")
+    new_post_ids(FakeSession())
+    cassettes = "".join(path.read_text() for path in cassette_dir.glob("*.json"))
+    assert "secret-token" not in cassettes
+    assert "replay-token" in cassettes
+
+
+def test_reddit_replay_miss(cassette_dir, monkeypatch):
+    monkeypatch.setattr(transport, "TRANSPORT_MODE", "replay")
+    with pytest.raises(transport.CassetteMiss):
+        transport.replay_reddit_response(("GET", "https://oauth.reddit.com/r/boston/new"), {"params": {"limit": 3}})
+
+
+def test_openai_record_then_replay(tmp_path):
+    cassette = transport.Cassette("openai", str(tmp_path))
+    messages = [{"role": "user", "content": "Is this relevant?"}]
+
+    def create(**kwargs):
+        return transport.completion_response("yes", 10, 1, top_logprobs=[("yes", -0.1), ("no", -2.3)],
+                                             finish_reason="stop")
+
+    live = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    recorded = transport.RecordingOpenAIClient(live, cassette).chat.completions.create(
+        model="gpt-4o-mini", messages=messages, temperature=0, logprobs=True, top_logprobs=5)
+
+    replayed = transport.ReplayOpenAIClient(cassette).chat.completions.create(
+        model="gpt-4o-mini", messages=messages, temperature=0, logprobs=True, top_logprobs=5)
+    assert replayed.choices[0].message.content == recorded.choices[0].message.content
+    assert replayed.choices[0].finish_reason == "stop"
+    assert transport.first_token_logprobs(replayed) == [("yes", -0.1), ("no", -2.3)]
+    with pytest.raises(transport.CassetteMiss):
+        transport.ReplayOpenAIClient(cassette).chat.completions.create(model="gpt-4o-mini", messages=messages,
+                                                                       temperature=0)
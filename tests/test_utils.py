@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from src.utils import chunk_by_token_budget, estimate_tokens, map_concurrently, parse_result
+
+
+def test_chunks_stay_within_the_budget():
+    assert chunk_by_token_budget([1, 2, 3, 4, 5], 5, lambda n: n) == [[1, 2], [3], [4], [5]]
+    assert chunk_by_token_budget([2, 2, 2, 2], 4, lambda n: n) == [[2, 2], [2, 2]]
+
+
+def test_oversized_items_get_a_chunk_of_their_own():
+    assert chunk_by_token_budget([1, 10, 1], 5, lambda n: n) == [[1], [10], [1]]
+
+
+def test_chunking_nothing():
+    assert chunk_by_token_budget([], 5, lambda n: n) == []
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 101
+
+
+def test_parse_result():
+    assert parse_result('Sure:\n```json\n{"is_relevant": true}\n```') == {"is_relevant": True}
+    assert parse_result("no json here") is None
+    assert parse_result(None) is None
+    # Truncated answers raise, so the comment classifier can tell them apart and split the chunk
+    with pytest.raises(json.JSONDecodeError):
+        parse_result('```json\n[{"comment_id": "1", "is_rel\n```')
+
+
+def test_map_concurrently_keeps_input_order():
+    assert map_concurrently(lambda n: n * n, range(20), max_workers=4) == [n * n for n in range(20)]
+    assert map_concurrently(lambda n: n + 1, [1, 2], max_workers=1) == [2, 3]